@@ -53,7 +53,82 @@ class Settings(BaseSettings):
     # AI Services
     BANANA_PRO_API_KEY: str = ""  # API key da Google AI Studio per Nano Banana Pro
     GEMINI_API_KEY: str = ""
+
+    # Backend di generazione: 'banana_pro', 'gemini' o 'local' (motore PIL offline per test di carico)
+    AI_BACKEND: str = "banana_pro"
+    AI_BACKEND_FALLBACKS: str = "gemini"  # Backend da provare in ordine se il principale non è disponibile
+    LOCAL_ENGINE_ENABLED: bool = False
+    LOCAL_ENGINE_LATENCY_MS: int = 2000  # Latenza simulata del modello
+    LOCAL_ENGINE_LATENCY_JITTER: float = 0.2  # Variazione relativa della latenza (+/-)
+    LOCAL_ENGINE_FAILURE_RATE: float = 0.0  # Quota di chiamate che falliscono con un 503 simulato
+    LOCAL_ENGINE_IMAGE_SIZE: int = 768
+    LOCAL_ENGINE_FETCH_IMAGES: bool = False  # False = immagini sostitutive derivate dagli URL, nessuna rete
+
+    # Immagini generate: formato di salvataggio su Storage ('webp', 'avif', 'jpeg') e qualità
+    GENERATED_IMAGE_FORMAT: str = "webp"
+    GENERATED_IMAGE_QUALITY: int = 82
     
+    # Storage privato: bucket serviti tramite URL firmati (separati da virgola, es: "customer-photos")
+    PRIVATE_STORAGE_BUCKETS: str = ""
+    SIGNED_URL_TTL: int = 3600  # Durata URL firmati in secondi
+    SIGNED_URL_REFRESH_MARGIN: int = 300  # Rinnova gli URL in cache quando mancano meno di N secondi
+
+    # Limiti di generazione immagini AI (token bucket per utente, negozio e globale)
+    # Unità = immagini in input (foto cliente + prodotti) x scenari generati
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_USER_BURST: int = 80
+    RATE_LIMIT_USER_PER_MINUTE: int = 40
+    RATE_LIMIT_SHOP_BURST: int = 160
+    RATE_LIMIT_SHOP_PER_MINUTE: int = 80
+    RATE_LIMIT_GLOBAL_BURST: int = 400
+    RATE_LIMIT_GLOBAL_PER_MINUTE: int = 200
+
+    # Circuit breaker per backend AI (Banana Pro, Gemini)
+    CIRCUIT_BREAKER_ENABLED: bool = True
+    CIRCUIT_WINDOW_SIZE: int = 20  # Ultime N chiamate osservate
+    CIRCUIT_MIN_CALLS: int = 5  # Chiamate minime nella finestra prima di poter aprire il circuito
+    CIRCUIT_FAILURE_RATE: float = 0.5  # Quota di chiamate fallite o lente che apre il circuito
+    CIRCUIT_SLOW_CALL_SECONDS: float = 90.0  # Chiamate più lente contano come fallite
+    CIRCUIT_OPEN_SECONDS: int = 30  # Durata dello stato aperto prima delle chiamate di prova
+    CIRCUIT_HALF_OPEN_PROBES: int = 1  # Chiamate di prova contemporanee in half-open
+
+    # Retry con backoff esponenziale e jitter (errori transitori 429/5xx, rete, timeout)
+    MODEL_RETRY_MAX_ATTEMPTS: int = 3
+    MODEL_RETRY_BASE_DELAY: float = 1.0  # Secondi, raddoppiati a ogni tentativo
+    MODEL_RETRY_MAX_DELAY: float = 20.0
+    MODEL_RETRY_BUDGET_SECONDS: float = 120.0  # Nessun nuovo tentativo oltre questo tempo dall'inizio
+    STORAGE_RETRY_MAX_ATTEMPTS: int = 4
+    STORAGE_RETRY_BASE_DELAY: float = 0.3
+    STORAGE_RETRY_MAX_DELAY: float = 5.0
+    STORAGE_RETRY_BUDGET_SECONDS: float = 20.0
+    RETRY_BUDGET_TOKENS: float = 10.0  # Budget di retry per processo (token bucket)
+    RETRY_BUDGET_RATIO: float = 0.1  # Token restituiti per ogni chiamata riuscita
+
+    # Cache in-process degli scenario prompts per negozio, usata dalla generazione immagini (secondi)
+    SCENARIO_CACHE_TTL: int = 300
+
+    # Compressione risposte (brotli se disponibile, altrimenti gzip)
+    COMPRESSION_ENABLED: bool = True
+    COMPRESSION_MIN_SIZE: int = 1024  # Bytes: sotto questa soglia le risposte non vengono compresse
+    COMPRESSION_GZIP_LEVEL: int = 6
+    COMPRESSION_BROTLI_QUALITY: int = 4  # 0-11: qualità bassa = compressione veloce per risposte dinamiche
+
+    # Metriche Prometheus su /metrics (con più worker impostare PROMETHEUS_MULTIPROC_DIR, vedi start_render.sh)
+    METRICS_ENABLED: bool = True
+    METRICS_TOKEN: str = ""  # Se impostato, /metrics richiede "Authorization: Bearer <token>" (obbligatorio in produzione)
+    METRICS_LOOP_LAG_INTERVAL: float = 0.5  # Secondi tra due misure del ritardo dell'event loop
+
+    # Conteggio query Supabase per richiesta (header Server-Timing solo con DEBUG)
+    QUERY_STATS_ENABLED: bool = True
+    QUERY_BUDGET_PER_REQUEST: int = 25  # Oltre questa soglia la richiesta viene segnalata nei log
+    QUERY_N_PLUS_ONE_THRESHOLD: int = 5  # Query con la stessa forma (valori diversi) segnalate come possibile N+1
+
+    # Logging: 'text' o 'json' (una riga JSON per record, con i campi strutturati)
+    LOG_FORMAT: str = "text"
+    ACCESS_LOG_ENABLED: bool = True  # Una riga per richiesta (logger backend.access) con request id e tempi
+    # Frazione di generazioni AI con log di dettaglio a INFO (0 = dettaglio solo con livello DEBUG)
+    AI_LOG_VERBOSE_SAMPLE_RATE: float = 0.0
+
     # Application
     ENVIRONMENT: str = "development"
     DEBUG: bool = True
@@ -79,6 +154,10 @@ class Settings(BaseSettings):
         """Property per compatibilità con codice esistente"""
         return self.get_allowed_origins()
     
+    def get_private_storage_buckets(self) -> List[str]:
+        """Bucket Storage privati come lista"""
+        return [b.strip() for b in self.PRIVATE_STORAGE_BUCKETS.split(",") if b.strip()]
+    
     def model_post_init(self, __context):
         """Post-init per leggere ALLOWED_ORIGINS dalla env var"""
         # Se ALLOWED_ORIGINS_STR è vuoto, leggi da env var
@@ -87,7 +166,9 @@ class Settings(BaseSettings):
             if env_value:
                 self.ALLOWED_ORIGINS_STR = env_value
     
-    @field_validator('DEBUG', mode='before')
+    @field_validator('DEBUG', 'COMPRESSION_ENABLED', 'RATE_LIMIT_ENABLED', 'CIRCUIT_BREAKER_ENABLED',
+                     'LOCAL_ENGINE_ENABLED', 'LOCAL_ENGINE_FETCH_IMAGES', 'METRICS_ENABLED', 'QUERY_STATS_ENABLED',
+                     'ACCESS_LOG_ENABLED', mode='before')
     @classmethod
     def parse_debug(cls, v):
         """Parser per DEBUG da stringa"""
@@ -95,6 +176,14 @@ class Settings(BaseSettings):
             return v.lower() in ("true", "1", "yes", "on")
         return bool(v)
     
+    @field_validator('GENERATED_IMAGE_QUALITY', mode='before')
+    @classmethod
+    def parse_image_quality(cls, v):
+        """Parser per GENERATED_IMAGE_QUALITY (limitato a 1-100)"""
+        if isinstance(v, str):
+            v = int(v)
+        return max(1, min(100, v))
+
     @field_validator('PORT', mode='before')
     @classmethod
     def parse_port(cls, v):
@@ -3,6 +3,7 @@ Configurazione database e Supabase
 """
 from supabase import create_client, Client
 from backend.config import settings
+from backend.utils.instrumentation import instrument_supabase
 import logging
 
 logger = logging.getLogger(__name__)
@@ -24,7 +25,8 @@ def init_supabase() -> Client:
                 "SUPABASE_URL e SUPABASE_KEY devono essere configurate nelle variabili d'ambiente"
             )
         
-        supabase = create_client(settings.SUPABASE_URL, settings.SUPABASE_KEY)
+        # Client avvolto per le metriche per tabella/operazione (vedi /metrics)
+        supabase = instrument_supabase(create_client(settings.SUPABASE_URL, settings.SUPABASE_KEY))
         logger.info("Client Supabase inizializzato correttamente")
     
     return supabase
@@ -54,7 +56,7 @@ def init_supabase_admin() -> Client:
             logger.warning("⚠️ SUPABASE_SERVICE_KEY è uguale a SUPABASE_KEY - potrebbe essere un errore!")
         
         logger.info(f"🔧 Creazione client admin con service key (lunghezza: {len(settings.SUPABASE_SERVICE_KEY)})")
-        supabase_admin = create_client(settings.SUPABASE_URL, settings.SUPABASE_SERVICE_KEY)
+        supabase_admin = instrument_supabase(create_client(settings.SUPABASE_URL, settings.SUPABASE_SERVICE_KEY))
         logger.info("✅ Client Supabase Admin inizializzato correttamente")
         logger.info(f"   URL: {settings.SUPABASE_URL}")
     
@@ -1,24 +1,34 @@
 """
 Backend principale per CRM Shops
 """
-from fastapi import FastAPI
+from fastapi import FastAPI, Header, HTTPException, Response, status
 from fastapi.middleware.cors import CORSMiddleware
 from backend.config import settings
 from backend.database import init_supabase, test_connection
+from backend.middleware.access_log import AccessLogMiddleware
+from backend.middleware.compression import CompressionMiddleware
+from backend.middleware.metrics import MetricsMiddleware
+from backend.middleware.query_stats import QueryStatsMiddleware
+from backend.utils.json_response import FastJSONResponse
+from backend.utils.logging_config import configure_logging
+from backend.utils.request_context import REQUEST_ID_HEADER
+from typing import Optional
+import asyncio
+import hmac
 import logging
 
-# Configurazione logging
-logging.basicConfig(
-    level=logging.DEBUG if settings.DEBUG else logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# Configurazione logging (LOG_FORMAT=json per log strutturati)
+configure_logging()
 logger = logging.getLogger(__name__)
 
 app = FastAPI(
     title="CRM Shops API",
     description="API per sistema CRM negozi con AI generativa",
     version="0.1.0",
-    debug=settings.DEBUG
+    debug=settings.DEBUG,
+    # Serializzazione JSON con orjson (UUID e datetime nativi); le route dei router
+    # usano FastJSONRoute per saltare anche jsonable_encoder
+    default_response_class=FastJSONResponse
 )
 
 # Configurazione CORS
@@ -28,8 +38,36 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[REQUEST_ID_HEADER],
 )
 
+# Compressione risposte JSON/testo (soglia minima e allowlist di Content-Type)
+if settings.COMPRESSION_ENABLED:
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=settings.COMPRESSION_MIN_SIZE,
+        gzip_level=settings.COMPRESSION_GZIP_LEVEL,
+        brotli_quality=settings.COMPRESSION_BROTLI_QUALITY,
+    )
+
+# Conteggio query Supabase per richiesta (budget, N+1, Server-Timing in debug)
+if settings.QUERY_STATS_ENABLED:
+    app.add_middleware(
+        QueryStatsMiddleware,
+        budget=settings.QUERY_BUDGET_PER_REQUEST,
+        n_plus_one_threshold=settings.QUERY_N_PLUS_ONE_THRESHOLD,
+        server_timing=settings.DEBUG,
+        report_duplicates=settings.DEBUG,
+    )
+
+# Metriche per route (misura anche la compressione)
+if settings.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
+# Request id e access log (aggiunto per ultimo: è il più esterno, il request id
+# è disponibile nei log di tutti gli altri middleware)
+app.add_middleware(AccessLogMiddleware, access_log=settings.ACCESS_LOG_ENABLED)
+
 
 @app.on_event("startup")
 async def startup_event():
@@ -57,6 +95,32 @@ async def startup_event():
     else:
         logger.warning("⚠️ Credenziali Supabase non configurate")
 
+    # Executor di default di run_in_executor: propaga il contesto del chiamante
+    # (request id nei log, query Storage contate nella richiesta) e misura coda e
+    # thread occupati. Sempre installato: AccessLogMiddleware è sempre attivo
+    from backend.utils.instrumentation import InstrumentedThreadPoolExecutor
+    asyncio.get_running_loop().set_default_executor(InstrumentedThreadPoolExecutor())
+
+    if settings.METRICS_ENABLED:
+        from backend.utils.instrumentation import event_loop_monitor
+        from backend.utils.metrics import cleanup_dead_processes
+        removed = cleanup_dead_processes()
+        if removed:
+            logger.info(f"📊 Rimosse metriche di {removed} worker terminati")
+        event_loop_monitor.interval = settings.METRICS_LOOP_LAG_INTERVAL
+        event_loop_monitor.start()
+        if settings.ENVIRONMENT == "production" and not settings.METRICS_TOKEN:
+            logger.warning("⚠️ METRICS_TOKEN non configurato: /metrics disabilitato in produzione")
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Evento eseguito alla chiusura dell'applicazione"""
+    if settings.METRICS_ENABLED:
+        from backend.utils.instrumentation import event_loop_monitor
+        await event_loop_monitor.stop()
+
+
 # Importa route
 from backend.routes import auth, products, outfits, shops, customer_photos, generated_images, customers, shop_stats, scenario_prompts
 
@@ -90,12 +154,43 @@ async def health_check():
     if settings.SUPABASE_URL and settings.SUPABASE_KEY:
         supabase_status = "connected" if test_connection() else "error"
     
+    # Backend AI e circuit breaker ("degraded" se un backend configurato ha il circuito aperto)
+    from backend.services.ai_service import ai_service
+    ai_backends = ai_service.backends_status()
+    degraded = any(b["configured"] and b["state"] != "closed" for b in ai_backends.values())
+    
     return {
-        "status": "healthy",
+        "status": "degraded" if degraded else "healthy",
         "supabase": supabase_status,
+        "ai_backends": ai_backends,
         "environment": settings.ENVIRONMENT
     }
 
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics(authorization: Optional[str] = Header(None)):
+    """Metriche Prometheus (aggregate tra i worker se PROMETHEUS_MULTIPROC_DIR è impostata)"""
+    from backend.utils.metrics import PROMETHEUS_AVAILABLE, render_metrics
+    if not settings.METRICS_ENABLED or not PROMETHEUS_AVAILABLE:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Metriche non disponibili"
+        )
+    if not settings.METRICS_TOKEN and settings.ENVIRONMENT == "production":
+        # In produzione le metriche (route, tabelle, errori dei backend) non sono pubbliche
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Metriche non disponibili: METRICS_TOKEN non configurato"
+        )
+    if settings.METRICS_TOKEN and not hmac.compare_digest(authorization or "", f"Bearer {settings.METRICS_TOKEN}"):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token metriche non valido"
+        )
+    # In multiprocess la lettura dei file dei worker è I/O su disco: fuori dall'event loop
+    body, content_type = await asyncio.get_running_loop().run_in_executor(None, render_metrics)
+    return Response(content=body, media_type=content_type)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
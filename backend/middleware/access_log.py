@@ -0,0 +1,101 @@
+"""
+Middleware per request id e access log strutturato
+
+Per ogni richiesta:
+- assegna un request id (header X-Request-ID del client se valido, altrimenti
+  nuovo), lo rende corrente per i log (backend/utils/request_context.py) e lo
+  restituisce nell'header X-Request-ID della risposta
+- al termine scrive una riga sul logger backend.access con metodo, route,
+  status, durata, query Supabase (QueryStatsMiddleware) e tempi per fase
+  della generazione immagini
+
+Va aggiunto per ultimo (middleware più esterno): così anche i log degli altri
+middleware hanno il request id.
+"""
+import logging
+import time
+from typing import Any, Dict
+
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from backend.middleware.metrics import route_template
+from backend.utils.request_context import REQUEST_ID_HEADER, new_request_id, reset_request, start_request
+
+access_logger = logging.getLogger("backend.access")
+
+_REQUEST_ID_HEADER_KEY = REQUEST_ID_HEADER.lower().encode("latin-1")
+
+
+def _incoming_request_id(scope: Scope):
+    for key, value in scope.get("headers", ()):
+        if key == _REQUEST_ID_HEADER_KEY:
+            return value.decode("latin-1")
+    return None
+
+
+class AccessLogMiddleware:
+    """Request id per richiesta e una riga di access log strutturata"""
+
+    def __init__(self, app: ASGIApp, access_log: bool = True):
+        self.app = app
+        self.access_log = access_log
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        context, token = start_request(new_request_id(_incoming_request_id(scope)))
+        status_code = 500  # Se l'app solleva prima di rispondere
+        response_bytes = 0
+        start = time.perf_counter()
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code, response_bytes
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                MutableHeaders(scope=message)[REQUEST_ID_HEADER] = context.request_id
+            elif message["type"] == "http.response.body":
+                response_bytes += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if self.access_log:
+                self._log(scope, context, status_code, response_bytes, time.perf_counter() - start)
+            reset_request(token)
+
+    def _log(self, scope: Scope, context, status_code: int, response_bytes: int, seconds: float) -> None:
+        level = logging.WARNING if status_code >= 500 else logging.INFO
+        if not access_logger.isEnabledFor(level):
+            return
+        route = route_template(scope)
+        duration_ms = round(seconds * 1000, 1)
+        fields: Dict[str, Any] = {
+            "request_id": context.request_id,
+            "method": scope["method"],
+            "path": scope["path"],
+            "route": route,
+            "status": status_code,
+            "duration_ms": duration_ms,
+            "response_bytes": response_bytes,
+            "client": scope["client"][0] if scope.get("client") else None,
+        }
+        stats = scope.get("query_stats")
+        if stats is not None:
+            fields.update(stats.summary())
+        stages = context.stages_ms()
+        if stages:
+            fields["stages"] = stages
+        # Nel formato testo i campi principali sono anche nel messaggio
+        msg = "%s %s %d %.1fms"
+        args = [scope["method"], route, status_code, duration_ms]
+        if stats is not None:
+            msg += " query=%d db=%.1fms"
+            args += [stats.query_count, stats.query_seconds * 1000]
+        if stages:
+            msg += " stages=%s"
+            args.append(stages)
+        access_logger.log(level, msg, *args, extra=fields)
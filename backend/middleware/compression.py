@@ -0,0 +1,191 @@
+"""
+Middleware per la compressione delle risposte (brotli / gzip)
+
+Comprime solo le risposte con Content-Type in allowlist (JSON, testo, ...) e
+sopra una dimensione minima: le immagini sono già compresse e le risposte
+piccole non valgono il costo della compressione. Brotli è usato se il client
+lo accetta e la libreria è installata, altrimenti gzip.
+"""
+import asyncio
+import zlib
+from typing import Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli è opzionale
+    try:
+        import brotlicffi as brotli
+    except ImportError:
+        brotli = None
+
+# Content-Type comprimibili (le voci che finiscono con '/' valgono come prefisso)
+COMPRESSIBLE_CONTENT_TYPES = (
+    "application/json",
+    "application/x-ndjson",
+    "application/javascript",
+    "application/xml",
+    "image/svg+xml",
+    "text/",
+)
+
+# Sopra questa dimensione la compressione gira in un thread per non bloccare l'event loop
+THREAD_MIN_SIZE = 256 * 1024
+
+
+def is_compressible(content_type: str) -> bool:
+    """True se il Content-Type è nell'allowlist"""
+    media_type = content_type.split(";", 1)[0].strip().lower()
+    return any(
+        media_type.startswith(allowed) if allowed.endswith("/") else media_type == allowed
+        for allowed in COMPRESSIBLE_CONTENT_TYPES
+    )
+
+
+def select_encoding(accept_encoding: str) -> Optional[str]:
+    """
+    Sceglie la codifica dall'header Accept-Encoding ('br', 'gzip' o None)
+
+    Rispetta i q-value (q=0 esclude la codifica); a parità preferisce brotli.
+    """
+    accepted = {}
+    for part in accept_encoding.lower().split(","):
+        token, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[token.strip()] = q
+
+    # '*' vale per le codifiche non elencate esplicitamente
+    wildcard = accepted.get("*", 0)
+    accepted.setdefault("br", wildcard)
+    accepted.setdefault("gzip", wildcard)
+
+    candidates = []
+    if brotli is not None and accepted.get("br", 0) > 0:
+        candidates.append((accepted["br"], 1, "br"))
+    if accepted.get("gzip", 0) > 0:
+        candidates.append((accepted["gzip"], 0, "gzip"))
+    return max(candidates)[2] if candidates else None
+
+
+class _Compressor:
+    """Interfaccia comune per compressione gzip/brotli in streaming"""
+
+    def __init__(self, encoding: str, gzip_level: int, brotli_quality: int):
+        self.encoding = encoding
+        if encoding == "br":
+            self._brotli = brotli.Compressor(quality=brotli_quality)
+        else:
+            self._zlib = zlib.compressobj(gzip_level, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        if self.encoding == "br":
+            out = self._brotli.process(data)
+            return out + (self._brotli.finish() if final else self._brotli.flush())
+        out = self._zlib.compress(data)
+        # Nei chunk intermedi forza l'uscita dei dati: lo streaming resta reattivo
+        return out + self._zlib.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+
+class CompressionMiddleware:
+    """Middleware ASGI di compressione con soglia minima e allowlist di Content-Type"""
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = 1024,
+        gzip_level: int = 6,
+        brotli_quality: int = 4,
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = select_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        responder = _CompressionResponder(self, encoding, send)
+        await self.app(scope, receive, responder.send)
+
+
+class _CompressionResponder:
+    """Stato della compressione per una singola risposta"""
+
+    def __init__(self, middleware: CompressionMiddleware, encoding: str, send: Send):
+        self.middleware = middleware
+        self.encoding = encoding
+        self._send = send
+        self.initial_message: Optional[Message] = None
+        self.compressor: Optional[_Compressor] = None
+        self.passthrough = False
+        self.started = False
+
+    async def send(self, message: Message) -> None:
+        message_type = message["type"]
+
+        if message_type == "http.response.start":
+            headers = Headers(raw=message["headers"])
+            self.passthrough = (
+                "content-encoding" in headers
+                or message["status"] in (204, 206, 304)
+                or not is_compressible(headers.get("content-type", ""))
+            )
+            if self.passthrough:
+                await self._send(message)
+            else:
+                # Gli header si inviano solo dopo aver visto il primo chunk del body
+                self.initial_message = message
+            return
+
+        if message_type != "http.response.body" or self.passthrough:
+            await self._send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if not self.started:
+            self.started = True
+            headers = MutableHeaders(raw=self.initial_message["headers"])
+            headers.add_vary_header("Accept-Encoding")
+
+            if not more_body and len(body) < self.middleware.minimum_size:
+                # Risposta piccola: non vale la pena comprimere
+                await self._send(self.initial_message)
+                await self._send(message)
+                return
+
+            self.compressor = _Compressor(self.encoding, self.middleware.gzip_level, self.middleware.brotli_quality)
+            compressed = await self._compress(body, final=not more_body)
+            headers["Content-Encoding"] = self.encoding
+            if more_body:
+                del headers["Content-Length"]
+            else:
+                headers["Content-Length"] = str(len(compressed))
+            await self._send(self.initial_message)
+            await self._send({"type": "http.response.body", "body": compressed, "more_body": more_body})
+            return
+
+        compressed = await self._compress(body, final=not more_body)
+        await self._send({"type": "http.response.body", "body": compressed, "more_body": more_body})
+
+    async def _compress(self, body: bytes, final: bool) -> bytes:
+        if len(body) < THREAD_MIN_SIZE:
+            return self.compressor.compress(body, final)
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, self.compressor.compress, body, final)
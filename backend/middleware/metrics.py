@@ -0,0 +1,55 @@
+"""
+Middleware per le metriche delle richieste HTTP
+
+Misura durata e richieste in corso: l'etichetta route è il template del path
+(/api/products/{product_id}), non il path effettivo, per non creare una serie
+per ogni ID. Il template è noto solo dopo il routing (scope["route"]), quindi
+il gauge delle richieste in corso è per metodo. Le richieste che non
+corrispondono a nessuna route sono raggruppate sotto "unmatched".
+"""
+import time
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from backend.utils.metrics import http_request_duration_seconds, http_requests_in_flight
+
+UNMATCHED_ROUTE = "unmatched"
+
+
+def route_template(scope: Scope) -> str:
+    """Template del path della route che ha gestito la richiesta"""
+    route = scope.get("route")
+    return getattr(route, "path", None) or UNMATCHED_ROUTE
+
+
+class MetricsMiddleware:
+    """Durata per route/metodo/status e gauge delle richieste in corso"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status_code = 500  # Se l'app solleva prima di rispondere
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        in_flight = http_requests_in_flight.labels(method=method)
+        in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            in_flight.dec()
+            # Il router registra la route in scope (stesso dict passato all'app)
+            http_request_duration_seconds.labels(
+                method=method, route=route_template(scope), status=str(status_code)
+            ).observe(time.perf_counter() - start)
@@ -0,0 +1,76 @@
+"""
+Middleware per il conteggio delle query Supabase per richiesta
+
+Per ogni richiesta conta e misura le query PostgREST e le chiamate Storage
+(vedi backend/utils/query_stats.py) e:
+- in modalità DEBUG aggiunge l'header Server-Timing (db, storage, app),
+  visibile nel pannello Network del browser
+- registra un warning se la richiesta supera QUERY_BUDGET_PER_REQUEST query
+- segnala query con la stessa forma ripetute almeno QUERY_N_PLUS_ONE_THRESHOLD
+  volte (possibile N+1) e, solo in modalità DEBUG, query identiche ripetute
+  altrettante volte (la firma include i valori dei filtri)
+"""
+import logging
+import time
+
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from backend.middleware.metrics import route_template
+from backend.utils.query_stats import QueryStats, format_query, reset_query_stats, start_query_stats
+
+logger = logging.getLogger(__name__)
+
+# Query ripetute riportate nei log per richiesta
+MAX_REPORTED = 3
+
+
+class QueryStatsMiddleware:
+    """Conta le query Supabase di ogni richiesta e segnala budget superati e pattern N+1"""
+
+    def __init__(self, app: ASGIApp, budget: int = 25, n_plus_one_threshold: int = 5, server_timing: bool = False,
+                 report_duplicates: bool = False):
+        self.app = app
+        self.budget = budget
+        self.n_plus_one_threshold = n_plus_one_threshold
+        self.server_timing = server_timing
+        self.report_duplicates = report_duplicates
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats, token = start_query_stats()
+        # Letto da AccessLogMiddleware (più esterno) per la riga di access log
+        scope["query_stats"] = stats
+        start = time.perf_counter()
+
+        async def send_wrapper(message: Message) -> None:
+            if self.server_timing and message["type"] == "http.response.start":
+                # Le query dopo l'inizio della risposta (streaming) non sono incluse
+                headers = MutableHeaders(scope=message)
+                app_ms = (time.perf_counter() - start) * 1000
+                headers.append("Server-Timing", f"{stats.server_timing()}, app;dur={app_ms:.1f}")
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            reset_query_stats(token)
+            if stats.query_count:
+                self._report(scope, stats)
+
+    def _report(self, scope: Scope, stats: QueryStats) -> None:
+        request = f"{scope['method']} {route_template(scope)}"
+        if stats.query_count > self.budget:
+            logger.warning(
+                f"⚠️ {request}: {stats.query_count} query Supabase "
+                f"(budget {self.budget}, {stats.query_seconds * 1000:.1f}ms)"
+            )
+        if self.report_duplicates:
+            for signature, count in stats.duplicates(self.n_plus_one_threshold)[:MAX_REPORTED]:
+                logger.warning(f"🔁 {request}: query identica eseguita {count} volte: {format_query(signature)}")
+        for shape, count in stats.repeated_shapes(self.n_plus_one_threshold)[:MAX_REPORTED]:
+            logger.warning(f"🔁 {request}: possibile N+1, {count} query con la stessa forma: {format_query(shape)}")
+        logger.debug(f"📊 {request}: {stats.summary()}")
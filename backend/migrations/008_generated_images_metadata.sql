@@ -0,0 +1,14 @@
+-- Migration 008: Metadati immagini generate
+-- Le immagini generate vengono transcodificate (WebP/AVIF/JPEG) prima del salvataggio su Storage:
+-- registra formato effettivo, dimensioni e peso per ogni immagine
+
+ALTER TABLE public.generated_images
+ADD COLUMN IF NOT EXISTS mime_type VARCHAR(50),
+ADD COLUMN IF NOT EXISTS width INTEGER,
+ADD COLUMN IF NOT EXISTS height INTEGER,
+ADD COLUMN IF NOT EXISTS byte_size INTEGER;
+
+COMMENT ON COLUMN public.generated_images.mime_type IS 'MIME type effettivo del file su Storage (es: image/webp)';
+COMMENT ON COLUMN public.generated_images.width IS 'Larghezza immagine in pixel';
+COMMENT ON COLUMN public.generated_images.height IS 'Altezza immagine in pixel';
+COMMENT ON COLUMN public.generated_images.byte_size IS 'Dimensione del file salvato su Storage in bytes';
@@ -0,0 +1,15 @@
+-- Migration 009: SKU e thumbnail prodotti
+-- Lo SKU permette di associare le immagini caricate in blocco (archivio ZIP/tar) ai prodotti;
+-- thumbnail_url contiene la variante ridotta dell'immagine per liste e gallerie
+
+ALTER TABLE public.products
+ADD COLUMN IF NOT EXISTS sku VARCHAR(100),
+ADD COLUMN IF NOT EXISTS thumbnail_url TEXT;
+
+-- Uno SKU è univoco all'interno dello stesso negozio
+CREATE UNIQUE INDEX IF NOT EXISTS idx_products_shop_sku
+    ON public.products(shop_id, sku)
+    WHERE sku IS NOT NULL;
+
+COMMENT ON COLUMN public.products.sku IS 'Codice articolo del negozio (univoco per negozio)';
+COMMENT ON COLUMN public.products.thumbnail_url IS 'URL della miniatura (lato maggiore 400px) su Supabase Storage';
@@ -0,0 +1,107 @@
+-- Migration 010: Ricerca prodotti lato server
+-- Full-text (tsvector, dizionario italiano) su nome e descrizione + trigrammi (pg_trgm)
+-- per ricerche parziali e con errori di battitura su nome e SKU.
+-- La funzione search_products applica filtri, ordinamento e paginazione in una sola query.
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+-- Indice full-text su espressione: deve coincidere con quella usata in search_products
+CREATE INDEX IF NOT EXISTS idx_products_search_fts
+    ON public.products
+    USING GIN (to_tsvector('italian', coalesce(name, '') || ' ' || coalesce(description, '')));
+
+-- Indici trigram: accelerano ILIKE '%testo%' e l'operatore di similarità (%)
+CREATE INDEX IF NOT EXISTS idx_products_name_trgm
+    ON public.products USING GIN (name gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_products_sku_trgm
+    ON public.products USING GIN (sku gin_trgm_ops);
+
+-- Filtri più usati insieme al negozio
+CREATE INDEX IF NOT EXISTS idx_products_shop_price ON public.products(shop_id, price);
+CREATE INDEX IF NOT EXISTS idx_products_shop_created ON public.products(shop_id, created_at DESC);
+
+CREATE OR REPLACE FUNCTION public.search_products(
+    p_query TEXT DEFAULT NULL,
+    p_shop_id UUID DEFAULT NULL,
+    p_category TEXT DEFAULT NULL,
+    p_season TEXT DEFAULT NULL,
+    p_occasion TEXT DEFAULT NULL,
+    p_style TEXT DEFAULT NULL,
+    p_min_price NUMERIC DEFAULT NULL,
+    p_max_price NUMERIC DEFAULT NULL,
+    p_available BOOLEAN DEFAULT NULL,
+    p_sort TEXT DEFAULT 'relevance',
+    p_limit INTEGER DEFAULT 24,
+    p_offset INTEGER DEFAULT 0
+)
+RETURNS TABLE (
+    id UUID,
+    shop_id UUID,
+    name VARCHAR,
+    sku VARCHAR,
+    description TEXT,
+    category VARCHAR,
+    season VARCHAR,
+    occasion VARCHAR,
+    style VARCHAR,
+    price DECIMAL,
+    image_url TEXT,
+    thumbnail_url TEXT,
+    available BOOLEAN,
+    created_at TIMESTAMP WITH TIME ZONE,
+    updated_at TIMESTAMP WITH TIME ZONE,
+    rank REAL,
+    total_count BIGINT
+)
+LANGUAGE sql
+STABLE
+AS $$
+    WITH params AS (
+        SELECT
+            nullif(trim(p_query), '') AS q,
+            websearch_to_tsquery('italian', coalesce(nullif(trim(p_query), ''), '')) AS tsq,
+            '%' || replace(replace(replace(coalesce(trim(p_query), ''), '\', '\\'), '%', '\%'), '_', '\_') || '%' AS pattern
+    ),
+    matches AS (
+        SELECT
+            p.*,
+            CASE WHEN params.q IS NULL THEN 0::REAL ELSE
+                ts_rank(to_tsvector('italian', coalesce(p.name, '') || ' ' || coalesce(p.description, '')), params.tsq)
+                + similarity(p.name, params.q)
+                + CASE WHEN p.sku ILIKE params.q THEN 1 ELSE 0 END
+            END AS rank
+        FROM public.products p, params
+        WHERE (p_shop_id IS NULL OR p.shop_id = p_shop_id)
+          AND (p_category IS NULL OR p.category = p_category)
+          AND (p_season IS NULL OR p.season = p_season)
+          AND (p_occasion IS NULL OR p.occasion = p_occasion)
+          AND (p_style IS NULL OR p.style ILIKE p_style)
+          AND (p_min_price IS NULL OR p.price >= p_min_price)
+          AND (p_max_price IS NULL OR p.price <= p_max_price)
+          AND (p_available IS NULL OR p.available = p_available)
+          AND (
+              params.q IS NULL
+              OR to_tsvector('italian', coalesce(p.name, '') || ' ' || coalesce(p.description, '')) @@ params.tsq
+              OR p.name ILIKE params.pattern
+              OR p.name % params.q
+              OR p.sku ILIKE params.pattern
+          )
+    )
+    SELECT
+        m.id, m.shop_id, m.name, m.sku, m.description, m.category, m.season, m.occasion,
+        m.style, m.price, m.image_url, m.thumbnail_url, m.available, m.created_at, m.updated_at,
+        m.rank,
+        count(*) OVER () AS total_count
+    FROM matches m
+    ORDER BY
+        CASE WHEN p_sort = 'relevance' THEN m.rank END DESC NULLS LAST,
+        CASE WHEN p_sort = 'price_asc' THEN m.price END ASC NULLS LAST,
+        CASE WHEN p_sort = 'price_desc' THEN m.price END DESC NULLS LAST,
+        CASE WHEN p_sort = 'newest' THEN m.created_at END DESC NULLS LAST,
+        m.name ASC,
+        m.id ASC
+    LIMIT greatest(p_limit, 1)
+    OFFSET greatest(p_offset, 0);
+$$;
+
+COMMENT ON FUNCTION public.search_products IS 'Ricerca prodotti con full-text + trigrammi, filtri combinabili e paginazione (total_count su ogni riga)';
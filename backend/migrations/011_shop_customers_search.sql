@@ -0,0 +1,18 @@
+-- Migration 011: Ricerca clienti negozio lato server
+-- Indici trigram (pg_trgm) su nome, email e telefono: accelerano ILIKE sia per
+-- prefisso ('mar%') che per sottostringa ('%rossi%'), usati da GET /api/customers/search.
+-- Indici composti per ordinamento e paginazione all'interno del negozio.
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX IF NOT EXISTS idx_shop_customers_full_name_trgm
+    ON public.shop_customers USING GIN (full_name gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_shop_customers_email_trgm
+    ON public.shop_customers USING GIN (email gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_shop_customers_phone_trgm
+    ON public.shop_customers USING GIN (phone gin_trgm_ops);
+
+CREATE INDEX IF NOT EXISTS idx_shop_customers_shop_full_name
+    ON public.shop_customers(shop_id, full_name);
+CREATE INDEX IF NOT EXISTS idx_shop_customers_shop_created
+    ON public.shop_customers(shop_id, created_at DESC);
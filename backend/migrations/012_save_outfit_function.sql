@@ -0,0 +1,126 @@
+-- Migration 012: Creazione/aggiornamento outfit in una sola chiamata transazionale
+-- save_outfit sostituisce la sequenza di chiamate (insert outfit, insert outfit_products,
+-- verifica scenari, insert outfit_scenarios, select finale) con una funzione eseguita in
+-- un'unica transazione: se un passo fallisce non restano outfit scritti a metà.
+-- Le tabelle di join vengono allineate con una differenza di insiemi (solo le righe
+-- da rimuovere o da aggiungere), non con delete + reinsert completo.
+
+CREATE OR REPLACE FUNCTION public.save_outfit(
+    p_outfit_id UUID DEFAULT NULL,      -- NULL = crea un nuovo outfit
+    p_shop_id UUID DEFAULT NULL,        -- Obbligatorio in creazione
+    p_customer_id UUID DEFAULT NULL,    -- Cliente shop_customers (verificato in creazione)
+    p_name TEXT DEFAULT NULL,
+    p_update_name BOOLEAN DEFAULT FALSE, -- In aggiornamento: TRUE per scrivere p_name
+    p_product_ids UUID[] DEFAULT NULL,  -- NULL = prodotti invariati
+    p_scenarios JSONB DEFAULT NULL      -- [{"scenario_prompt_id": ..., "custom_text": ...}], NULL = invariati
+)
+RETURNS JSONB
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_outfit_id UUID;
+    v_shop_id UUID;
+    v_scenario_id UUID;
+BEGIN
+    IF p_outfit_id IS NULL THEN
+        IF p_shop_id IS NULL THEN
+            RAISE EXCEPTION 'shop_id obbligatorio per creare un outfit' USING ERRCODE = '22023';
+        END IF;
+        v_shop_id := p_shop_id;
+
+        IF p_customer_id IS NOT NULL AND NOT EXISTS (
+            SELECT 1 FROM public.shop_customers
+            WHERE id = p_customer_id AND shop_id = v_shop_id
+        ) THEN
+            RAISE EXCEPTION 'Cliente non trovato per questo negozio' USING ERRCODE = 'P0002';
+        END IF;
+    ELSE
+        -- Blocca la riga: aggiornamenti concorrenti dello stesso outfit vengono serializzati
+        SELECT shop_id INTO v_shop_id FROM public.outfits WHERE id = p_outfit_id FOR UPDATE;
+        IF NOT FOUND THEN
+            RAISE EXCEPTION 'Outfit non trovato' USING ERRCODE = 'P0002';
+        END IF;
+    END IF;
+
+    -- Verifica che gli scenari esistano e appartengano al negozio
+    IF p_scenarios IS NOT NULL THEN
+        SELECT (s ->> 'scenario_prompt_id')::UUID INTO v_scenario_id
+        FROM jsonb_array_elements(p_scenarios) AS s
+        WHERE NOT EXISTS (
+            SELECT 1 FROM public.scenario_prompts sp WHERE sp.id = (s ->> 'scenario_prompt_id')::UUID
+        )
+        LIMIT 1;
+        IF v_scenario_id IS NOT NULL THEN
+            RAISE EXCEPTION 'Scenario prompt % non trovato', v_scenario_id USING ERRCODE = 'P0002';
+        END IF;
+
+        SELECT sp.id INTO v_scenario_id
+        FROM jsonb_array_elements(p_scenarios) AS s
+        JOIN public.scenario_prompts sp ON sp.id = (s ->> 'scenario_prompt_id')::UUID
+        WHERE sp.shop_id IS DISTINCT FROM v_shop_id
+        LIMIT 1;
+        IF v_scenario_id IS NOT NULL THEN
+            RAISE EXCEPTION 'Lo scenario % non appartiene a questo negozio', v_scenario_id USING ERRCODE = '22023';
+        END IF;
+    END IF;
+
+    IF p_outfit_id IS NULL THEN
+        INSERT INTO public.outfits (shop_id, name, user_id)
+        VALUES (v_shop_id, p_name, NULL)  -- Per clienti shop_customers non abbiamo user_id
+        RETURNING id INTO v_outfit_id;
+    ELSE
+        v_outfit_id := p_outfit_id;
+        IF p_update_name THEN
+            UPDATE public.outfits SET name = p_name WHERE id = v_outfit_id;
+        END IF;
+    END IF;
+
+    -- Prodotti: rimuovi solo quelli non più presenti, aggiungi solo i nuovi
+    IF p_product_ids IS NOT NULL THEN
+        DELETE FROM public.outfit_products
+        WHERE outfit_id = v_outfit_id
+          AND product_id <> ALL (p_product_ids);
+
+        INSERT INTO public.outfit_products (outfit_id, product_id)
+        SELECT v_outfit_id, pid FROM unnest(p_product_ids) AS pid
+        ON CONFLICT (outfit_id, product_id) DO NOTHING;
+    END IF;
+
+    -- Scenari: stessa logica, il testo libero viene aggiornato sulle righe esistenti
+    IF p_scenarios IS NOT NULL THEN
+        DELETE FROM public.outfit_scenarios
+        WHERE outfit_id = v_outfit_id
+          AND scenario_prompt_id NOT IN (
+              SELECT (s ->> 'scenario_prompt_id')::UUID FROM jsonb_array_elements(p_scenarios) AS s
+          );
+
+        INSERT INTO public.outfit_scenarios (outfit_id, scenario_prompt_id, custom_text)
+        SELECT v_outfit_id, (s ->> 'scenario_prompt_id')::UUID, s ->> 'custom_text'
+        FROM jsonb_array_elements(p_scenarios) AS s
+        ON CONFLICT (outfit_id, scenario_prompt_id) DO UPDATE
+            SET custom_text = EXCLUDED.custom_text;
+    END IF;
+
+    -- Outfit finale nello stesso formato restituito dalle API
+    RETURN (
+        SELECT to_jsonb(o) || jsonb_build_object(
+            'product_ids', coalesce(
+                (SELECT jsonb_agg(op.product_id) FROM public.outfit_products op WHERE op.outfit_id = o.id),
+                '[]'::jsonb
+            ),
+            'scenarios', coalesce(
+                (SELECT jsonb_agg(jsonb_build_object(
+                    'scenario_prompt_id', os.scenario_prompt_id,
+                    'custom_text', os.custom_text
+                 ))
+                 FROM public.outfit_scenarios os WHERE os.outfit_id = o.id),
+                '[]'::jsonb
+            )
+        )
+        FROM public.outfits o
+        WHERE o.id = v_outfit_id
+    );
+END;
+$$;
+
+COMMENT ON FUNCTION public.save_outfit IS 'Crea o aggiorna un outfit con prodotti e scenari in una sola transazione; restituisce l''outfit finale';
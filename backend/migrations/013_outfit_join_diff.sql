@@ -0,0 +1,169 @@
+-- Migration 013: Aggiornamento incrementale delle tabelle di join degli outfit
+-- Le funzioni sync_outfit_products e sync_outfit_scenarios calcolano la differenza tra
+-- righe attuali e richieste e scrivono solo quello che cambia:
+--   - DELETE solo delle righe rimosse
+--   - INSERT solo delle righe nuove (nessun tentativo su righe già presenti)
+--   - UPDATE di custom_text solo se il testo è cambiato
+-- Gli input duplicati vengono ignorati. save_outfit (migration 012) viene ridefinita per usarle.
+
+CREATE OR REPLACE FUNCTION public.sync_outfit_products(p_outfit_id UUID, p_product_ids UUID[])
+RETURNS VOID
+LANGUAGE sql
+AS $$
+    WITH wanted AS (
+        SELECT DISTINCT pid AS product_id FROM unnest(p_product_ids) AS pid
+    ),
+    removed AS (
+        DELETE FROM public.outfit_products op
+        WHERE op.outfit_id = p_outfit_id
+          AND NOT EXISTS (SELECT 1 FROM wanted w WHERE w.product_id = op.product_id)
+    )
+    INSERT INTO public.outfit_products (outfit_id, product_id)
+    SELECT p_outfit_id, w.product_id
+    FROM wanted w
+    WHERE NOT EXISTS (
+        SELECT 1 FROM public.outfit_products op
+        WHERE op.outfit_id = p_outfit_id AND op.product_id = w.product_id
+    );
+$$;
+
+CREATE OR REPLACE FUNCTION public.sync_outfit_scenarios(p_outfit_id UUID, p_scenarios JSONB)
+RETURNS VOID
+LANGUAGE sql
+AS $$
+    WITH wanted AS (
+        -- In caso di scenario ripetuto vale l'ultima occorrenza
+        SELECT DISTINCT ON (scenario_prompt_id) scenario_prompt_id, custom_text
+        FROM (
+            SELECT (s ->> 'scenario_prompt_id')::UUID AS scenario_prompt_id,
+                   s ->> 'custom_text' AS custom_text,
+                   ord
+            FROM jsonb_array_elements(p_scenarios) WITH ORDINALITY AS t(s, ord)
+        ) items
+        ORDER BY scenario_prompt_id, ord DESC
+    ),
+    removed AS (
+        DELETE FROM public.outfit_scenarios os
+        WHERE os.outfit_id = p_outfit_id
+          AND NOT EXISTS (SELECT 1 FROM wanted w WHERE w.scenario_prompt_id = os.scenario_prompt_id)
+    ),
+    changed AS (
+        UPDATE public.outfit_scenarios os
+        SET custom_text = w.custom_text
+        FROM wanted w
+        WHERE os.outfit_id = p_outfit_id
+          AND os.scenario_prompt_id = w.scenario_prompt_id
+          AND os.custom_text IS DISTINCT FROM w.custom_text
+    )
+    INSERT INTO public.outfit_scenarios (outfit_id, scenario_prompt_id, custom_text)
+    SELECT p_outfit_id, w.scenario_prompt_id, w.custom_text
+    FROM wanted w
+    WHERE NOT EXISTS (
+        SELECT 1 FROM public.outfit_scenarios os
+        WHERE os.outfit_id = p_outfit_id AND os.scenario_prompt_id = w.scenario_prompt_id
+    );
+$$;
+
+CREATE OR REPLACE FUNCTION public.save_outfit(
+    p_outfit_id UUID DEFAULT NULL,      -- NULL = crea un nuovo outfit
+    p_shop_id UUID DEFAULT NULL,        -- Obbligatorio in creazione
+    p_customer_id UUID DEFAULT NULL,    -- Cliente shop_customers (verificato in creazione)
+    p_name TEXT DEFAULT NULL,
+    p_update_name BOOLEAN DEFAULT FALSE, -- In aggiornamento: TRUE per scrivere p_name
+    p_product_ids UUID[] DEFAULT NULL,  -- NULL = prodotti invariati
+    p_scenarios JSONB DEFAULT NULL      -- [{"scenario_prompt_id": ..., "custom_text": ...}], NULL = invariati
+)
+RETURNS JSONB
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_outfit_id UUID;
+    v_shop_id UUID;
+    v_scenario_id UUID;
+BEGIN
+    IF p_outfit_id IS NULL THEN
+        IF p_shop_id IS NULL THEN
+            RAISE EXCEPTION 'shop_id obbligatorio per creare un outfit' USING ERRCODE = '22023';
+        END IF;
+        v_shop_id := p_shop_id;
+
+        IF p_customer_id IS NOT NULL AND NOT EXISTS (
+            SELECT 1 FROM public.shop_customers
+            WHERE id = p_customer_id AND shop_id = v_shop_id
+        ) THEN
+            RAISE EXCEPTION 'Cliente non trovato per questo negozio' USING ERRCODE = 'P0002';
+        END IF;
+    ELSE
+        -- Blocca la riga: aggiornamenti concorrenti dello stesso outfit vengono serializzati
+        SELECT shop_id INTO v_shop_id FROM public.outfits WHERE id = p_outfit_id FOR UPDATE;
+        IF NOT FOUND THEN
+            RAISE EXCEPTION 'Outfit non trovato' USING ERRCODE = 'P0002';
+        END IF;
+    END IF;
+
+    -- Verifica che gli scenari esistano e appartengano al negozio
+    IF p_scenarios IS NOT NULL THEN
+        SELECT (s ->> 'scenario_prompt_id')::UUID INTO v_scenario_id
+        FROM jsonb_array_elements(p_scenarios) AS s
+        WHERE NOT EXISTS (
+            SELECT 1 FROM public.scenario_prompts sp WHERE sp.id = (s ->> 'scenario_prompt_id')::UUID
+        )
+        LIMIT 1;
+        IF v_scenario_id IS NOT NULL THEN
+            RAISE EXCEPTION 'Scenario prompt % non trovato', v_scenario_id USING ERRCODE = 'P0002';
+        END IF;
+
+        SELECT sp.id INTO v_scenario_id
+        FROM jsonb_array_elements(p_scenarios) AS s
+        JOIN public.scenario_prompts sp ON sp.id = (s ->> 'scenario_prompt_id')::UUID
+        WHERE sp.shop_id IS DISTINCT FROM v_shop_id
+        LIMIT 1;
+        IF v_scenario_id IS NOT NULL THEN
+            RAISE EXCEPTION 'Lo scenario % non appartiene a questo negozio', v_scenario_id USING ERRCODE = '22023';
+        END IF;
+    END IF;
+
+    IF p_outfit_id IS NULL THEN
+        INSERT INTO public.outfits (shop_id, name, user_id)
+        VALUES (v_shop_id, p_name, NULL)  -- Per clienti shop_customers non abbiamo user_id
+        RETURNING id INTO v_outfit_id;
+    ELSE
+        v_outfit_id := p_outfit_id;
+        IF p_update_name THEN
+            UPDATE public.outfits SET name = p_name
+            WHERE id = v_outfit_id AND name IS DISTINCT FROM p_name;
+        END IF;
+    END IF;
+
+    IF p_product_ids IS NOT NULL THEN
+        PERFORM public.sync_outfit_products(v_outfit_id, p_product_ids);
+    END IF;
+
+    IF p_scenarios IS NOT NULL THEN
+        PERFORM public.sync_outfit_scenarios(v_outfit_id, p_scenarios);
+    END IF;
+
+    -- Outfit finale nello stesso formato restituito dalle API
+    RETURN (
+        SELECT to_jsonb(o) || jsonb_build_object(
+            'product_ids', coalesce(
+                (SELECT jsonb_agg(op.product_id) FROM public.outfit_products op WHERE op.outfit_id = o.id),
+                '[]'::jsonb
+            ),
+            'scenarios', coalesce(
+                (SELECT jsonb_agg(jsonb_build_object(
+                    'scenario_prompt_id', os.scenario_prompt_id,
+                    'custom_text', os.custom_text
+                 ))
+                 FROM public.outfit_scenarios os WHERE os.outfit_id = o.id),
+                '[]'::jsonb
+            )
+        )
+        FROM public.outfits o
+        WHERE o.id = v_outfit_id
+    );
+END;
+$$;
+
+COMMENT ON FUNCTION public.sync_outfit_products IS 'Allinea outfit_products alla lista richiesta scrivendo solo le differenze';
+COMMENT ON FUNCTION public.sync_outfit_scenarios IS 'Allinea outfit_scenarios alla lista richiesta scrivendo solo le differenze';
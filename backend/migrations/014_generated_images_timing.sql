@@ -0,0 +1,12 @@
+-- Migration 014: Tempi per fase delle immagini generate
+-- Ogni immagine generata registra quanto è durata ciascuna fase della pipeline
+-- (query, download, decodifica, prompt, chiamata al modello, parsing della risposta,
+-- transcodifica, upload) per capire dove si perde tempo nelle generazioni lente.
+-- Formato: {"total_ms": 8421.3, "backend": "banana_pro",
+--           "stages": {"db_fetch": 35.2, "download": 412.8, "model_call": 7650.1, ...},
+--           "spans": [{"stage": "download", "ms": 120.4, "detail": "foto cliente 1"}, ...]}
+
+ALTER TABLE public.generated_images
+ADD COLUMN IF NOT EXISTS timing JSONB;
+
+COMMENT ON COLUMN public.generated_images.timing IS 'Durata delle fasi di generazione in millisecondi (totale, per fase e singole fasi)';
@@ -0,0 +1,23 @@
+-- Migration 015: Aggiornamento a blocchi delle immagini prodotto
+-- update_product_images scrive solo image_url e thumbnail_url dei prodotti esistenti
+-- del negozio: a differenza di un upsert non riscrive gli altri campi (modifiche
+-- fatte durante l'import restano) e non ricrea prodotti eliminati nel frattempo.
+-- Formato: [{"id": "uuid", "image_url": "https://...", "thumbnail_url": "https://..."}, ...]
+
+CREATE OR REPLACE FUNCTION public.update_product_images(
+    p_shop_id UUID,
+    p_images JSONB
+)
+RETURNS TABLE (id UUID)
+LANGUAGE sql
+AS $$
+    UPDATE public.products AS p
+    SET image_url = i.image_url,
+        thumbnail_url = i.thumbnail_url
+    FROM jsonb_to_recordset(p_images) AS i(id UUID, image_url TEXT, thumbnail_url TEXT)
+    WHERE p.id = i.id
+      AND p.shop_id = p_shop_id
+    RETURNING p.id;
+$$;
+
+COMMENT ON FUNCTION public.update_product_images IS 'Aggiorna image_url e thumbnail_url dei prodotti esistenti di un negozio; restituisce gli ID aggiornati';
@@ -69,6 +69,8 @@ class Product(Base):
     style = Column(String(50))
     price = Column(Float)
     image_url = Column(Text)
+    thumbnail_url = Column(Text)
+    sku = Column(String(100))  # Univoco per negozio
     available = Column(Boolean, default=True)
     created_at = Column(DateTime(timezone=True), default=datetime.utcnow)
     updated_at = Column(DateTime(timezone=True), default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -140,6 +142,10 @@ class GeneratedImage(Base):
     prompt_used = Column(Text)
     scenario = Column(String(255))
     ai_service = Column(String(50))  # 'banana_pro', 'gemini'
+    mime_type = Column(String(50))  # Formato effettivo su Storage, es: 'image/webp'
+    width = Column(Integer)
+    height = Column(Integer)
+    byte_size = Column(Integer)
     generated_at = Column(DateTime(timezone=True), default=datetime.utcnow)
     
     # Relazioni
@@ -6,11 +6,12 @@ from pydantic import BaseModel, EmailStr
 from typing import Optional
 from supabase import Client
 from backend.database import get_supabase
+from backend.utils.json_response import FastJSONRoute
 import logging
 
 logger = logging.getLogger(__name__)
 
-router = APIRouter(prefix="/api/auth", tags=["autenticazione"])
+router = APIRouter(prefix="/api/auth", tags=["autenticazione"], route_class=FastJSONRoute)
 
 
 class LoginRequest(BaseModel):
@@ -8,11 +8,13 @@ from uuid import UUID
 from supabase import Client
 from backend.database import get_supabase
 from backend.middleware.auth import get_current_user
+from backend.services.signed_urls import signed_url_service
+from backend.utils.json_response import FastJSONRoute
 import logging
 
 logger = logging.getLogger(__name__)
 
-router = APIRouter(prefix="/api/customer-photos", tags=["foto-clienti"])
+router = APIRouter(prefix="/api/customer-photos", tags=["foto-clienti"], route_class=FastJSONRoute)
 
 
 class CustomerPhotoCreate(BaseModel):
@@ -42,9 +44,11 @@ async def list_customer_photos(
             query = query.eq("shop_id", str(shop_id))
         
         result = query.execute()
+        # Con bucket privato sostituisce gli URL con URL firmati (firma bulk + cache)
+        photos = await signed_url_service.sign_rows("customer-photos", result.data)
         return {
-            "photos": result.data,
-            "count": len(result.data)
+            "photos": photos,
+            "count": len(photos)
         }
     except Exception as e:
         logger.error(f"Errore lista foto: {e}")
@@ -101,6 +105,7 @@ async def get_customer_photo(
                         detail="Accesso negato"
                     )
         
+        await signed_url_service.sign_rows("customer-photos", [photo])
         return {"photo": photo}
     except HTTPException:
         raise
@@ -174,7 +179,7 @@ async def upload_customer_photo(
         
         return {
             "message": "Foto caricata con successo",
-            "photo": result.data[0]
+            "photo": (await signed_url_service.sign_rows("customer-photos", [result.data[0]]))[0]
         }
     except HTTPException:
         raise
@@ -236,6 +241,7 @@ async def delete_customer_photo(
         
         # Elimina dal database (il file su Storage può rimanere per ora)
         result = supabase.table("customer_photos").delete().eq("id", str(photo_id)).execute()
+        signed_url_service.invalidate("customer-photos", photo.get("image_url"))
         
         return {
             "message": "Foto eliminata con successo",
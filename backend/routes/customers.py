@@ -1,17 +1,25 @@
 """
 Route per gestione clienti (solo negozianti)
 """
-from fastapi import APIRouter, HTTPException, Depends, UploadFile, File, status
+from fastapi import APIRouter, HTTPException, Depends, UploadFile, File, Query, status
 from pydantic import BaseModel, EmailStr
 from typing import Optional, List
 from uuid import UUID
 from backend.database import get_supabase
 from backend.middleware.auth import get_current_shop_owner
+from backend.services.signed_urls import signed_url_service
+from backend.utils.json_response import FastJSONRoute
+from postgrest.exceptions import APIError
 import logging
 import os
 
 logger = logging.getLogger(__name__)
-router = APIRouter(prefix="/api/customers", tags=["clienti"])
+router = APIRouter(prefix="/api/customers", tags=["clienti"], route_class=FastJSONRoute)
+
+# Ricerca: colonne restituite nelle liste e ordinamenti ammessi ('-' = decrescente)
+CUSTOMER_LIST_COLUMNS = "id, shop_id, email, full_name, phone, created_at, updated_at"
+CUSTOMER_RESPONSE_COLUMNS = "id, shop_id, email, full_name, phone, address, notes, created_at, updated_at"
+CUSTOMER_SORT_OPTIONS = ["full_name", "-full_name", "email", "-email", "created_at", "-created_at"]
 
 
 class CustomerBase(BaseModel):
@@ -46,6 +54,27 @@ class CustomerResponse(CustomerBase):
         from_attributes = True
 
 
+def _customer_response_row(customer_data: dict) -> dict:
+    """
+    Proiezione diretta di una riga shop_customers nella forma di CustomerResponse
+    
+    I dati arrivano già validati dal database: evita la doppia conversione
+    model_validate/model_dump per ogni riga delle liste.
+    """
+    return {
+        'id': customer_data['id'],
+        'shop_id': customer_data['shop_id'],
+        'email': customer_data['email'],
+        'full_name': customer_data.get('full_name'),
+        'phone': customer_data.get('phone'),
+        'address': customer_data.get('address'),
+        'notes': customer_data.get('notes'),
+        'created_at': customer_data.get('created_at'),
+        'updated_at': customer_data.get('updated_at') or customer_data.get('created_at'),
+        'user_id': None  # I clienti shop_customers non hanno user_id
+    }
+
+
 @router.get("/")
 async def list_customers(
     shop_id: Optional[UUID] = None,
@@ -76,7 +105,7 @@ async def list_customers(
         
         # I clienti creati dal negoziante sono nella tabella shop_customers
         # Non nella tabella users (quelli sono clienti esterni con account)
-        query = supabase.from_('shop_customers').select('*')
+        query = supabase.from_('shop_customers').select(CUSTOMER_RESPONSE_COLUMNS)
         
         # Filtra per shop_id se specificato, altrimenti tutti i negozi del negoziante
         if shop_id:
@@ -98,27 +127,12 @@ async def list_customers(
                 "count": 0
             }
         
-        # Converti i dati in CustomerResponse
-        customers = []
-        for customer_data in customers_response.data:
-            # Aggiungi campi mancanti per compatibilità con CustomerResponse
-            customer_dict = {
-                'id': customer_data.get('id'),
-                'shop_id': customer_data.get('shop_id'),
-                'email': customer_data.get('email'),
-                'full_name': customer_data.get('full_name'),
-                'phone': customer_data.get('phone'),
-                'address': customer_data.get('address'),
-                'notes': customer_data.get('notes'),
-                'created_at': customer_data.get('created_at', customer_data.get('created_at')),
-                'updated_at': customer_data.get('updated_at', customer_data.get('created_at')),
-                'user_id': None  # I clienti shop_customers non hanno user_id
-            }
-            customers.append(CustomerResponse.model_validate(customer_dict))
+        # Proiezione diretta nella forma di CustomerResponse (niente Pydantic per riga)
+        customers = [_customer_response_row(customer_data) for customer_data in customers_response.data]
         
         # Restituisci un oggetto con la chiave 'customers' per coerenza con altri endpoint
         return {
-            "customers": [c.model_dump() for c in customers],
+            "customers": customers,
             "count": len(customers)
         }
         
@@ -130,6 +144,105 @@ async def list_customers(
         )
 
 
+def _search_filter(q: str) -> str:
+    """
+    Filtro PostgREST 'or' per la ricerca su nome, email e telefono
+    
+    Il testo viene messo tra virgolette così virgole e parentesi non rompono la
+    sintassi del filtro; i caratteri jolly digitati dall'utente vengono rimossi.
+    """
+    term = q.replace("*", "").replace("%", "").replace("\\", "").replace('"', "").strip()
+    return ",".join([
+        f'full_name.ilike."*{term}*"',
+        f'email.ilike."{term}*"',
+        f'phone.ilike."*{term}*"',
+    ])
+
+
+@router.get("/search")
+async def search_customers(
+    q: Optional[str] = Query(None, max_length=100),
+    shop_id: Optional[UUID] = None,
+    sort: str = "full_name",
+    page: int = Query(1, ge=1),
+    page_size: int = Query(50, ge=1, le=200),
+    current_user: dict = Depends(get_current_shop_owner)
+):
+    """
+    Ricerca clienti dei negozi del negoziante con paginazione e ordinamento
+    
+    Cerca per sottostringa su nome e telefono e per prefisso sull'email (indici
+    trigram, migration 011). Le righe sono restituite così come arrivano dal
+    database, solo con le colonne necessarie alla lista.
+    """
+    if sort not in CUSTOMER_SORT_OPTIONS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Ordinamento non valido. Usa uno tra: {', '.join(CUSTOMER_SORT_OPTIONS)}"
+        )
+    
+    supabase = get_supabase()
+    
+    try:
+        shops_response = supabase.from_('shops').select('id').eq('owner_id', current_user['id']).execute()
+        shop_ids = [str(shop['id']) for shop in shops_response.data]
+    except Exception as e:
+        logger.error(f"Errore nella ricerca clienti: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Errore nella ricerca dei clienti"
+        )
+    
+    if shop_id and str(shop_id) not in shop_ids:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Non autorizzato a vedere i clienti di questo negozio"
+        )
+    
+    if not shop_ids:
+        return {"customers": [], "count": 0, "total": 0, "page": page, "page_size": page_size, "total_pages": 0}
+    
+    def apply_filters(query):
+        query = query.eq('shop_id', str(shop_id)) if shop_id else query.in_('shop_id', shop_ids)
+        if q and q.strip():
+            query = query.or_(_search_filter(q))
+        return query
+    
+    try:
+        query = apply_filters(supabase.from_('shop_customers').select(CUSTOMER_LIST_COLUMNS, count='exact'))
+        
+        # Ordinamento stabile: a parità di valore decide l'id
+        column = sort.lstrip('-')
+        query = query.order(column, desc=sort.startswith('-')).order('id')
+        
+        offset = (page - 1) * page_size
+        try:
+            result = query.range(offset, offset + page_size - 1).execute()
+            rows = result.data or []
+            total = result.count if result.count is not None else len(rows)
+        except APIError as e:
+            # Pagina oltre l'ultima: PostgREST risponde 416 (PGRST103), il totale va letto a parte
+            if e.code != 'PGRST103':
+                raise
+            rows = []
+            total = apply_filters(supabase.from_('shop_customers').select('id', count='exact', head=True)).execute().count or 0
+        
+        return {
+            "customers": rows,
+            "count": len(rows),
+            "total": total,
+            "page": page,
+            "page_size": page_size,
+            "total_pages": (total + page_size - 1) // page_size
+        }
+    except Exception as e:
+        logger.error(f"Errore nella ricerca clienti: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Errore nella ricerca dei clienti"
+        )
+
+
 @router.post("/", response_model=CustomerResponse)
 async def create_customer(
     customer: CustomerCreate,
@@ -473,7 +586,7 @@ async def upload_customer_photo(
         
         return {
             "message": "Foto caricata con successo",
-            "photo": insert_response.data[0]
+            "photo": (await signed_url_service.sign_rows(bucket_name, [insert_response.data[0]]))[0]
         }
         
     except HTTPException:
@@ -505,8 +618,9 @@ async def get_customer_photos(
         # Recupera foto usando customer_id (cliente negozio) invece di user_id
         response = supabase.from_('customer_photos').select('*').eq('customer_id', str(customer_id)).in_('shop_id', [str(sid) for sid in shop_ids]).execute()
         
+        # Con bucket privato sostituisce gli URL con URL firmati (firma bulk + cache)
         return {
-            "photos": response.data or []
+            "photos": await signed_url_service.sign_rows("customer-photos", response.data or [])
         }
         
     except HTTPException:
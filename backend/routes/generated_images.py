@@ -6,14 +6,20 @@ from pydantic import BaseModel
 from typing import Optional, List
 from uuid import UUID
 from supabase import Client
+from backend.config import settings
 from backend.database import get_supabase
 from backend.middleware.auth import get_current_user
 from backend.services.ai_service import ai_service
+from backend.services.signed_urls import signed_url_service
+from backend.services.scenario_cache import scenario_prompt_cache
+from backend.services.admission import admission_controller, AdmissionDenied, generation_cost
+from backend.utils.json_response import FastJSONRoute
+from backend.utils.timing import StageTimer, use_timer
 import logging
 
 logger = logging.getLogger(__name__)
 
-router = APIRouter(prefix="/api/generated-images", tags=["immagini-generate"])
+router = APIRouter(prefix="/api/generated-images", tags=["immagini-generate"], route_class=FastJSONRoute)
 
 
 class GenerateImageRequest(BaseModel):
@@ -39,6 +45,66 @@ class GenerateOutfitImageRequest(BaseModel):
     prompt_override: Optional[str] = None
 
 
+ADMISSION_SCOPES = {"user": "utente", "shop": "negozio", "global": "servizio"}
+
+
+def _admit_generation(current_user: dict, shop_id: Optional[str], input_images: int, generations: int):
+    """Controllo di ammissione prima di chiamare il servizio AI: 429 con Retry-After se oltre il limite"""
+    try:
+        admission_controller.admit(current_user["id"], shop_id, generation_cost(input_images, generations))
+    except AdmissionDenied as e:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=f"Limite di generazione immagini raggiunto per {ADMISSION_SCOPES[e.scope]}: riprova tra {e.retry_after_seconds} secondi",
+            headers={"Retry-After": str(e.retry_after_seconds)}
+        )
+
+
+def _is_http_url(url) -> bool:
+    """True se url è una stringa non vuota che inizia con http:// o https://"""
+    return isinstance(url, str) and bool(url.strip()) and url.startswith(("http://", "https://"))
+
+
+def _split_product_image_urls(products: List[dict]):
+    """
+    Separa gli URL immagine validi dei prodotti da quelli mancanti o non validi
+    
+    Returns:
+        (URL validi, descrizioni dei prodotti senza immagine valida)
+    """
+    product_image_urls = []
+    products_without_images = []
+    
+    for p in products:
+        image_url = p.get("image_url")
+        if not image_url:
+            products_without_images.append(p.get("name", "Sconosciuto"))
+            continue
+        if not isinstance(image_url, str):
+            products_without_images.append(f"{p.get('name', 'Sconosciuto')} (URL non stringa: {type(image_url)})")
+            continue
+        if not image_url.strip():
+            products_without_images.append(f"{p.get('name', 'Sconosciuto')} (URL vuoto)")
+            continue
+        if not image_url.startswith(("http://", "https://")):
+            products_without_images.append(f"{p.get('name', 'Sconosciuto')} (URL non valido: {image_url[:50]}...)")
+            continue
+        product_image_urls.append(image_url)
+    
+    return product_image_urls, products_without_images
+
+
+def _invalid_image_urls(urls: List[str]) -> List[str]:
+    """Descrizioni degli URL non validi (numerati da 1) da riportare nell'errore"""
+    invalid_urls = []
+    for idx, url in enumerate(urls, 1):
+        if not url or not isinstance(url, str) or not url.strip():
+            invalid_urls.append(f"URL {idx}: {url}")
+        elif not url.startswith(("http://", "https://")):
+            invalid_urls.append(f"URL {idx}: {url[:50]}... (non inizia con http/https)")
+    return invalid_urls
+
+
 @router.get("/")
 async def list_generated_images(
     customer_photo_id: Optional[UUID] = None,
@@ -59,9 +125,11 @@ async def list_generated_images(
             query = query.eq("outfit_id", str(outfit_id))
         
         result = query.execute()
+        # Con bucket privato sostituisce gli URL con URL firmati (firma bulk + cache)
+        images = await signed_url_service.sign_rows("generated-images", result.data)
         return {
-            "images": result.data,
-            "count": len(result.data)
+            "images": images,
+            "count": len(images)
         }
     except Exception as e:
         logger.error(f"Errore lista immagini generate: {e}")
@@ -87,7 +155,7 @@ async def get_generated_image(
                 detail="Immagine non trovata"
             )
         
-        return {"image": result.data[0]}
+        return {"image": (await signed_url_service.sign_rows("generated-images", [result.data[0]]))[0]}
     except HTTPException:
         raise
     except Exception as e:
@@ -106,8 +174,12 @@ async def generate_image(
 ):
     """Genera un'immagine AI combinando foto cliente e prodotto/outfit"""
     try:
+        # Durate delle fasi (query, download, modello, upload, ...) salvate nella riga generata
+        timer = StageTimer()
+        
         # Verifica che la foto cliente esista e appartenga all'utente
-        photo_result = supabase.table("customer_photos").select("*").eq("id", str(request.customer_photo_id)).execute()
+        with timer.span("db_fetch", "customer_photos"):
+            photo_result = supabase.table("customer_photos").select("*").eq("id", str(request.customer_photo_id)).execute()
         
         if not photo_result.data:
             raise HTTPException(
@@ -127,26 +199,29 @@ async def generate_image(
         # Ottieni informazioni prodotto/outfit per costruire il prompt
         product_data = None
         if request.product_id:
-            product_result = supabase.table("products").select("*").eq("id", str(request.product_id)).execute()
+            with timer.span("db_fetch", "products"):
+                product_result = supabase.table("products").select("*").eq("id", str(request.product_id)).execute()
             if product_result.data:
                 product_data = product_result.data[0]
         
         # Costruisci prompt
         prompt = request.prompt_override
         if not prompt and product_data:
-            prompt = ai_service.build_prompt(
-                product_category=product_data.get("category"),
-                product_style=product_data.get("style"),
-                scenario=request.scenario
-            )
+            with timer.span("prompt_build"):
+                prompt = ai_service.build_prompt(
+                    product_category=product_data.get("category"),
+                    product_style=product_data.get("style"),
+                    scenario=request.scenario
+                )
         
         # Genera immagine usando servizio AI
         # NOTA: Gemini non può generare immagini, solo analizzarle
-        # Usa Banana Pro per generazione immagini (default)
-        ai_model = "banana_pro"  # Banana Pro usa Stable Diffusion per generare immagini
+        # Backend configurato in AI_BACKEND (default Banana Pro), con fallback
+        ai_model = settings.AI_BACKEND
         
         # Per compatibilità con endpoint singolo prodotto, usa liste con un elemento
-        customer_photo_urls = [photo["image_url"]]
+        # Con bucket privato il servizio AI può scaricare la foto solo tramite URL firmato
+        customer_photo_urls = [await signed_url_service.resolve_url("customer-photos", photo["image_url"])]
         product_image_urls = [product_data.get("image_url")] if product_data and product_data.get("image_url") else []
         
         if not product_image_urls:
@@ -155,14 +230,33 @@ async def generate_image(
                 detail="Prodotto non ha un'immagine disponibile"
             )
         
-        ai_result = await ai_service.generate_image_with_product(
-            customer_photo_urls=customer_photo_urls,
-            product_image_urls=product_image_urls,
-            prompt=prompt,
-            scenario=request.scenario,
-            ai_model=ai_model
+        _admit_generation(
+            current_user,
+            product_data.get("shop_id"),
+            input_images=len(customer_photo_urls) + len(product_image_urls),
+            generations=1
         )
         
+        with use_timer(timer):
+            ai_result = await ai_service.generate_image_with_product(
+                customer_photo_urls=customer_photo_urls,
+                product_image_urls=product_image_urls,
+                prompt=prompt,
+                scenario=request.scenario,
+                ai_model=ai_model
+            )
+        
+        # Generazione fallita su tutta la catena (o circuiti aperti): non salvare il placeholder
+        if ai_result.get("status") == "error":
+            # Dettagli (e traceback) solo nei log: il messaggio del backend può contenere URL e API key
+            logger.error("❌ Generazione immagine fallita: %s", ai_result.get("error"))
+            retry_after = ai_result.get("retry_after")
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Servizi AI temporaneamente non disponibili, riprova più tardi",
+                headers={"Retry-After": str(retry_after)} if retry_after else None
+            )
+        
         generated_image_url = ai_result.get("image_url", "")
         prompt_used = prompt or ai_result.get("prompt_used", "")
         ai_service_used = ai_result.get("ai_service", ai_model)
@@ -180,7 +274,14 @@ async def generate_image(
         if request.outfit_id:
             image_data["outfit_id"] = str(request.outfit_id)
         
-        result = supabase.table("generated_images").insert(image_data).execute()
+        # Formato, dimensioni e peso dell'immagine salvata su Storage
+        if ai_result.get("image_metadata"):
+            image_data.update(ai_result["image_metadata"])
+        
+        # La durata dell'insert stesso è solo nell'istogramma Prometheus
+        image_data["timing"] = timer.breakdown()
+        with timer.span("db_insert", "generated_images"):
+            result = supabase.table("generated_images").insert(image_data).execute()
         
         if not result.data:
             raise HTTPException(
@@ -190,7 +291,7 @@ async def generate_image(
         
         return {
             "message": "Immagine generata con successo (placeholder - implementare AI service)",
-            "image": result.data[0]
+            "image": (await signed_url_service.sign_rows("generated-images", [result.data[0]]))[0]
         }
     except HTTPException:
         raise
@@ -223,8 +324,12 @@ async def generate_outfit_image(
                 detail="Seleziona almeno un prodotto"
             )
         
+        # Durate delle fasi comuni (query); ogni immagine ne parte per le proprie
+        timer = StageTimer()
+        
         # Verifica che il cliente appartenga al negozio
-        customer_response = supabase.table("shop_customers").select("*").eq("id", str(request.customer_id)).eq("shop_id", str(request.shop_id)).execute()
+        with timer.span("db_fetch", "shop_customers"):
+            customer_response = supabase.table("shop_customers").select("*").eq("id", str(request.customer_id)).eq("shop_id", str(request.shop_id)).execute()
         if not customer_response.data:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -234,7 +339,8 @@ async def generate_outfit_image(
         customer = customer_response.data[0]
         
         # Recupera tutte le foto del cliente (fino a 3)
-        customer_photos_response = supabase.table("customer_photos").select("*").eq("customer_id", str(request.customer_id)).limit(3).execute()
+        with timer.span("db_fetch", "customer_photos"):
+            customer_photos_response = supabase.table("customer_photos").select("*").eq("customer_id", str(request.customer_id)).limit(3).execute()
         if not customer_photos_response.data:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -243,6 +349,8 @@ async def generate_outfit_image(
         
         customer_photos = customer_photos_response.data
         customer_photo_urls = [photo.get("image_url") for photo in customer_photos if photo.get("image_url")]
+        # Con bucket privato il servizio AI può scaricare le foto solo tramite URL firmati
+        customer_photo_urls = await signed_url_service.resolve_urls("customer-photos", customer_photo_urls)
         
         if not customer_photo_urls:
             raise HTTPException(
@@ -250,8 +358,8 @@ async def generate_outfit_image(
                 detail="Nessuna foto cliente valida trovata"
             )
         
-        logger.info(f"📸 Foto cliente recuperate: {len(customer_photo_urls)}")
-        logger.info(f"   URL foto cliente: {customer_photo_urls}")
+        logger.info("📸 Foto cliente recuperate: %d", len(customer_photo_urls))
+        logger.debug("   URL foto cliente: %s", customer_photo_urls)
         
         # Verifica che le foto cliente siano valide
         if not customer_photo_urls or len(customer_photo_urls) == 0:
@@ -261,7 +369,8 @@ async def generate_outfit_image(
             )
         
         # Recupera prodotti
-        products_response = supabase.table("products").select("*").in_("id", [str(pid) for pid in request.product_ids]).execute()
+        with timer.span("db_fetch", "products"):
+            products_response = supabase.table("products").select("*").in_("id", [str(pid) for pid in request.product_ids]).execute()
         if not products_response.data:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -270,31 +379,17 @@ async def generate_outfit_image(
         
         products = products_response.data
         
-        # Log dettagliato per debug
-        logger.info(f"🛍️ Prodotti recuperati dal database: {len(products)}")
-        for idx, p in enumerate(products, 1):
-            image_url = p.get("image_url")
-            logger.info(f"   Prodotto {idx}: {p.get('name', 'Sconosciuto')} ({p.get('category', 'N/A')}) - URL: {image_url if image_url else 'NON DISPONIBILE'}")
+        logger.info("🛍️ Prodotti recuperati dal database: %d", len(products))
+        # Dettaglio per prodotto solo a DEBUG (evita il ciclo di formattazione in produzione)
+        if logger.isEnabledFor(logging.DEBUG):
+            for idx, p in enumerate(products, 1):
+                logger.debug(
+                    "   Prodotto %d: %s (%s) - URL: %s",
+                    idx, p.get('name', 'Sconosciuto'), p.get('category', 'N/A'), p.get("image_url") or 'NON DISPONIBILE'
+                )
         
         # Filtra solo prodotti con URL immagine validi (non None, non vuoti, e che iniziano con http)
-        product_image_urls = []
-        products_without_images = []
-        
-        for p in products:
-            image_url = p.get("image_url")
-            if not image_url:
-                products_without_images.append(p.get("name", "Sconosciuto"))
-                continue
-            if not isinstance(image_url, str):
-                products_without_images.append(f"{p.get('name', 'Sconosciuto')} (URL non stringa: {type(image_url)})")
-                continue
-            if not image_url.strip():
-                products_without_images.append(f"{p.get('name', 'Sconosciuto')} (URL vuoto)")
-                continue
-            if not (image_url.startswith("http://") or image_url.startswith("https://")):
-                products_without_images.append(f"{p.get('name', 'Sconosciuto')} (URL non valido: {image_url[:50]}...)")
-                continue
-            product_image_urls.append(image_url)
+        product_image_urls, products_without_images = _split_product_image_urls(products)
         
         if not product_image_urls:
             product_names = [p.get("name", "Sconosciuto") for p in products]
@@ -310,59 +405,61 @@ async def generate_outfit_image(
         if products_without_images:
             logger.warning(f"⚠️  {len(products_without_images)} prodotti senza immagini valide: {', '.join(products_without_images)}")
         
-        logger.info(f"✅ {len(product_image_urls)} prodotti con immagini valide su {len(products)} totali")
-        logger.info(f"   URL immagini prodotto: {product_image_urls}")
+        logger.info("✅ %d prodotti con immagini valide su %d totali", len(product_image_urls), len(products))
+        logger.debug("   URL immagini prodotto: %s", product_image_urls)
         
         # Recupera dettagli scenari se outfit_id è presente o se scenarios è fornito
         scenario_details = []
         logger.info(f"🔍 Recupero scenari: outfit_id={request.outfit_id}, scenarios forniti={len(request.scenarios) if request.scenarios else 0}")
         
+        # Dettagli degli scenari dalla cache per negozio (nessuna query se già in cache)
+        # Gli scenari devono appartenere al negozio, come richiesto anche per gli outfit
+        def scenario_detail_from_prompt(scenario_prompt: dict, custom_text: Optional[str]) -> dict:
+            return {
+                "description": scenario_prompt.get("description", ""),
+                "position": scenario_prompt.get("position"),
+                "environment": scenario_prompt.get("environment"),
+                "lighting": scenario_prompt.get("lighting"),
+                "background": scenario_prompt.get("background"),
+                "custom_text": custom_text
+            }
+        
         if request.outfit_id:
-            # Recupera scenari dall'outfit
+            # Recupera scenari dall'outfit (solo le righe di join, i dettagli arrivano dalla cache)
             logger.info(f"📋 Recupero scenari dall'outfit {request.outfit_id}")
-            outfit_result = supabase.table("outfits").select(
-                "outfit_scenarios(scenario_prompt_id, custom_text, scenario_prompts(*))"
-            ).eq("id", str(request.outfit_id)).execute()
+            with timer.span("db_fetch", "outfits"):
+                outfit_result = supabase.table("outfits").select(
+                    "outfit_scenarios(scenario_prompt_id, custom_text)"
+                ).eq("id", str(request.outfit_id)).execute()
             
             logger.info(f"   Risultato outfit: {len(outfit_result.data) if outfit_result.data else 0} outfit trovati")
             if outfit_result.data and outfit_result.data[0].get("outfit_scenarios"):
-                logger.info(f"   Scenari trovati nell'outfit: {len(outfit_result.data[0]['outfit_scenarios'])}")
-                for os in outfit_result.data[0]["outfit_scenarios"]:
-                    scenario_prompt = os.get("scenario_prompts", {})
-                    scenario_details.append({
-                        "description": scenario_prompt.get("description", ""),
-                        "position": scenario_prompt.get("position"),
-                        "environment": scenario_prompt.get("environment"),
-                        "lighting": scenario_prompt.get("lighting"),
-                        "background": scenario_prompt.get("background"),
-                        "custom_text": os.get("custom_text")
-                    })
+                outfit_scenarios = outfit_result.data[0]["outfit_scenarios"]
+                logger.info(f"   Scenari trovati nell'outfit: {len(outfit_scenarios)}")
+                with timer.span("db_fetch", "scenario_prompts"):
+                    shop_scenarios = scenario_prompt_cache.get_shop_scenarios(supabase, request.shop_id)
+                for os in outfit_scenarios:
+                    scenario_prompt = shop_scenarios.get(str(os["scenario_prompt_id"]))
+                    if not scenario_prompt:
+                        logger.warning(f"   ⚠️ Scenario {os['scenario_prompt_id']} non trovato per questo negozio")
+                        continue
+                    scenario_details.append(scenario_detail_from_prompt(scenario_prompt, os.get("custom_text")))
                     logger.info(f"   ✅ Scenario aggiunto: {scenario_prompt.get('description', 'N/A')}")
             else:
                 logger.warning(f"   ⚠️ Nessuno scenario trovato nell'outfit")
         elif request.scenarios and len(request.scenarios) > 0:
             # Recupera dettagli scenari dalla lista fornita
             logger.info(f"📋 Recupero scenari dalla richiesta: {len(request.scenarios)} scenari")
-            scenario_ids = [str(s.scenario_prompt_id) for s in request.scenarios]
-            logger.info(f"   ID scenari: {scenario_ids}")
-            scenarios_result = supabase.table("scenario_prompts").select("*").in_("id", scenario_ids).execute()
-            logger.info(f"   Scenari trovati nel database: {len(scenarios_result.data)}")
-            scenarios_dict = {s["id"]: s for s in scenarios_result.data}
+            with timer.span("db_fetch", "scenario_prompts"):
+                shop_scenarios = scenario_prompt_cache.get_shop_scenarios(supabase, request.shop_id)
             
             for scenario_request in request.scenarios:
-                scenario_prompt = scenarios_dict.get(str(scenario_request.scenario_prompt_id), {})
+                scenario_prompt = shop_scenarios.get(str(scenario_request.scenario_prompt_id))
                 if scenario_prompt:
-                    scenario_details.append({
-                        "description": scenario_prompt.get("description", ""),
-                        "position": scenario_prompt.get("position"),
-                        "environment": scenario_prompt.get("environment"),
-                        "lighting": scenario_prompt.get("lighting"),
-                        "background": scenario_prompt.get("background"),
-                        "custom_text": scenario_request.custom_text
-                    })
+                    scenario_details.append(scenario_detail_from_prompt(scenario_prompt, scenario_request.custom_text))
                     logger.info(f"   ✅ Scenario aggiunto: {scenario_prompt.get('description', 'N/A')} (custom_text: {scenario_request.custom_text})")
                 else:
-                    logger.warning(f"   ⚠️ Scenario {scenario_request.scenario_prompt_id} non trovato nel database")
+                    logger.warning(f"   ⚠️ Scenario {scenario_request.scenario_prompt_id} non trovato per questo negozio")
         else:
             logger.info(f"📋 Nessuno scenario fornito, genererò una sola immagine (default)")
         
@@ -376,12 +473,7 @@ async def generate_outfit_image(
             )
         
         # Verifica che tutti gli URL siano stringhe valide
-        invalid_urls = []
-        for idx, url in enumerate(product_image_urls, 1):
-            if not url or not isinstance(url, str) or not url.strip():
-                invalid_urls.append(f"URL {idx}: {url}")
-            elif not (url.startswith("http://") or url.startswith("https://")):
-                invalid_urls.append(f"URL {idx}: {url[:50]}... (non inizia con http/https)")
+        invalid_urls = _invalid_image_urls(product_image_urls)
         
         if invalid_urls:
             logger.error(f"❌ URL immagini prodotto non validi: {invalid_urls}")
@@ -399,26 +491,37 @@ async def generate_outfit_image(
             scenarios_to_generate = scenarios_to_generate[:3]
             logger.warning(f"⚠️  Più di 3 scenari forniti, genero solo i primi 3")
         
-        logger.info(f"📋 Scenari da generare: {len(scenarios_to_generate)}")
-        for idx, sc in enumerate(scenarios_to_generate, 1):
-            if sc:
-                logger.info(f"   Scenario {idx}: {sc.get('description', 'N/A')} - {sc.get('environment', 'N/A')}")
-            else:
-                logger.info(f"   Scenario {idx}: Default (nessuno scenario)")
+        logger.info("📋 Scenari da generare: %d", len(scenarios_to_generate))
+        if logger.isEnabledFor(logging.DEBUG):
+            for idx, sc in enumerate(scenarios_to_generate, 1):
+                if sc:
+                    logger.debug("   Scenario %d: %s - %s", idx, sc.get('description', 'N/A'), sc.get('environment', 'N/A'))
+                else:
+                    logger.debug("   Scenario %d: Default (nessuno scenario)", idx)
         
         product_names = [p.get("name", "") for p in products]
         product_categories = [p.get("category", "") for p in products]
         
-        logger.info(f"🎨 Inizio generazione {len(scenarios_to_generate)} immagine/i")
-        logger.info(f"   📸 Foto cliente: {len(customer_photo_urls)} immagini")
-        logger.info(f"   🛍️ Immagini prodotto: {len(product_image_urls)} immagini")
-        logger.info(f"   📦 Prodotti: {', '.join(product_names)}")
+        logger.info(
+            "🎨 Inizio generazione %d immagine/i: %d foto cliente, %d immagini prodotto",
+            len(scenarios_to_generate), len(customer_photo_urls), len(product_image_urls)
+        )
+        logger.debug("   📦 Prodotti: %s", product_names)
+        
+        # Costo pesato su immagini in input e numero di scenari
+        _admit_generation(
+            current_user,
+            str(request.shop_id),
+            input_images=len(customer_photo_urls) + len(product_image_urls),
+            generations=len(scenarios_to_generate)
+        )
         
         generated_images = []
         errors = []
         
         # Genera una foto per ogni scenario
         for idx, scenario_detail in enumerate(scenarios_to_generate):
+            image_timer = timer.fork()
             try:
                 # Costruisci prompt per questo scenario specifico
                 prompt = request.prompt_override
@@ -426,21 +529,20 @@ async def generate_outfit_image(
                     # Usa build_prompt con questo scenario specifico
                     from backend.services.ai_service import ai_service
                     scenario_list = [scenario_detail] if scenario_detail else None
-                    prompt = ai_service.build_prompt(
-                        product_category=", ".join(set(product_categories)) if product_categories else None,
-                        scenario_details=scenario_list,
-                        scenario=request.scenario  # Fallback per retrocompatibilità
-                    )
+                    with image_timer.span("prompt_build"):
+                        prompt = ai_service.build_prompt(
+                            product_category=", ".join(set(product_categories)) if product_categories else None,
+                            scenario_details=scenario_list,
+                            scenario=request.scenario  # Fallback per retrocompatibilità
+                        )
                     
                     # Aggiungi nomi prodotti al prompt
                     if product_names:
                         prompt += f" Articoli indossati: {', '.join(product_names)}."
                 
                 scenario_name = scenario_detail.get('description', 'Nessuno') if scenario_detail else 'Default'
-                logger.info(f"🎨 Generazione immagine {idx + 1}/{len(scenarios_to_generate)} per scenario: {scenario_name}")
-                logger.info(f"   📸 Foto cliente da usare: {len(customer_photo_urls)} immagini - URL: {customer_photo_urls}")
-                logger.info(f"   🛍️ Immagini prodotto da usare: {len(product_image_urls)} immagini - URL: {product_image_urls}")
-                logger.info(f"   📝 Prompt: {prompt[:300]}...")
+                logger.info("🎨 Generazione immagine %d/%d per scenario: %s", idx + 1, len(scenarios_to_generate), scenario_name)
+                logger.debug("   📝 Prompt: %.300s...", prompt)
                 
                 # Verifica che le foto cliente siano valide
                 if not customer_photo_urls or len(customer_photo_urls) == 0:
@@ -450,7 +552,7 @@ async def generate_outfit_image(
                     continue
                 
                 # Verifica che le foto cliente siano URL validi
-                invalid_customer_urls = [url for url in customer_photo_urls if not url or not isinstance(url, str) or not url.strip() or not (url.startswith("http://") or url.startswith("https://"))]
+                invalid_customer_urls = [url for url in customer_photo_urls if not _is_http_url(url)]
                 if invalid_customer_urls:
                     error_msg = f"URL foto cliente non validi per la generazione immagine {idx + 1}: {invalid_customer_urls}"
                     logger.error(f"❌ {error_msg}")
@@ -461,14 +563,15 @@ async def generate_outfit_image(
                 from backend.services.ai_service import ai_service
                 
                 # Passa anche i nomi dei prodotti per un prompt più specifico
-                ai_result = await ai_service.generate_image_with_product(
-                    customer_photo_urls=customer_photo_urls,  # Lista di tutte le foto cliente (fino a 3)
-                    product_image_urls=product_image_urls,  # Lista di tutte le immagini prodotto (fino a 10)
-                    prompt=prompt,
-                    scenario=request.scenario,  # Mantenuto per retrocompatibilità
-                    product_names=product_names,  # Nomi dei prodotti per prompt più specifico
-                    ai_model="banana_pro"  # Usa Banana Pro per generazione immagini
-                )
+                with use_timer(image_timer):
+                    ai_result = await ai_service.generate_image_with_product(
+                        customer_photo_urls=customer_photo_urls,  # Lista di tutte le foto cliente (fino a 3)
+                        product_image_urls=product_image_urls,  # Lista di tutte le immagini prodotto (fino a 10)
+                        prompt=prompt,
+                        scenario=request.scenario,  # Mantenuto per retrocompatibilità
+                        product_names=product_names,  # Nomi dei prodotti per prompt più specifico
+                        ai_model=settings.AI_BACKEND  # Backend configurato (default Banana Pro), con fallback
+                    )
                 
                 generated_image_url = ai_result.get("image_url", "")
                 
@@ -500,6 +603,10 @@ async def generate_outfit_image(
                 if request.outfit_id:
                     image_data["outfit_id"] = str(request.outfit_id)
                 
+                # Formato, dimensioni e peso dell'immagine salvata su Storage
+                if ai_result.get("image_metadata"):
+                    image_data.update(ai_result["image_metadata"])
+                
                 # Se c'è un errore nel risultato, loggalo
                 if ai_result.get("status") == "error":
                     error_msg = f"Errore durante generazione immagine {idx + 1}: {ai_result.get('error', 'Unknown error')}"
@@ -509,7 +616,10 @@ async def generate_outfit_image(
                     errors.append(error_msg)
                     continue
                 
-                result = supabase.table("generated_images").insert(image_data).execute()
+                # La durata dell'insert stesso è solo nell'istogramma Prometheus
+                image_data["timing"] = image_timer.breakdown()
+                with image_timer.span("db_insert", "generated_images"):
+                    result = supabase.table("generated_images").insert(image_data).execute()
                 
                 if result.data:
                     generated_images.append(result.data[0])
@@ -533,7 +643,7 @@ async def generate_outfit_image(
         
         return {
             "message": f"{len(generated_images)} immagine/i outfit generate con successo",
-            "images": generated_images,
+            "images": await signed_url_service.sign_rows("generated-images", generated_images),
             "count": len(generated_images),
             "errors": errors if errors else None
         }
@@ -6,12 +6,14 @@ from pydantic import BaseModel
 from typing import Optional, List
 from uuid import UUID
 from supabase import Client
+from postgrest.exceptions import APIError
 from backend.database import get_supabase
+from backend.utils.json_response import FastJSONRoute
 import logging
 
 logger = logging.getLogger(__name__)
 
-router = APIRouter(prefix="/api/outfits", tags=["outfit"])
+router = APIRouter(prefix="/api/outfits", tags=["outfit"], route_class=FastJSONRoute)
 
 
 class OutfitScenario(BaseModel):
@@ -27,6 +29,59 @@ class OutfitCreate(BaseModel):
     scenarios: Optional[List[OutfitScenario]] = []  # Max 3 scenari con testo libero
 
 
+# Relazioni espandibili con ?expand= (embedding PostgREST, una sola query)
+EXPANDABLE_RELATIONS = {"products", "scenarios"}
+PRODUCT_EMBED_COLUMNS = "id, name, category, thumbnail_url, image_url"
+SCENARIO_EMBED_COLUMNS = "id, name"
+
+
+def _parse_expand(expand: Optional[str]) -> set:
+    """Valida il parametro expand ('products,scenarios')"""
+    if not expand:
+        return set()
+    relations = {r.strip() for r in expand.split(",") if r.strip()}
+    invalid = relations - EXPANDABLE_RELATIONS
+    if invalid:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Valori expand non validi: {', '.join(sorted(invalid))}. Usa: {', '.join(sorted(EXPANDABLE_RELATIONS))}"
+        )
+    return relations
+
+
+def _outfit_select(expand: set = frozenset()) -> str:
+    """Select PostgREST dell'outfit con le tabelle di join (ed eventuali dettagli embedded)"""
+    products = "outfit_products(product_id"
+    if "products" in expand:
+        products += f", products({PRODUCT_EMBED_COLUMNS})"
+    scenarios = "outfit_scenarios(scenario_prompt_id, custom_text"
+    if "scenarios" in expand:
+        scenarios += f", scenario_prompts({SCENARIO_EMBED_COLUMNS})"
+    return f"*, {products}), {scenarios})"
+
+
+def _format_outfit(outfit: dict, expand: set = frozenset()) -> dict:
+    """Converte le righe di join embedded in product_ids/scenarios (e products se richiesto)"""
+    outfit_products = outfit.pop("outfit_products", None) or []
+    outfit_scenarios = outfit.pop("outfit_scenarios", None) or []
+    
+    outfit["product_ids"] = [op["product_id"] for op in outfit_products]
+    if "products" in expand:
+        outfit["products"] = [op["products"] for op in outfit_products if op.get("products")]
+    
+    scenarios = []
+    for os in outfit_scenarios:
+        scenario = {
+            "scenario_prompt_id": os["scenario_prompt_id"],
+            "custom_text": os.get("custom_text")
+        }
+        if "scenarios" in expand:
+            scenario["name"] = (os.get("scenario_prompts") or {}).get("name")
+        scenarios.append(scenario)
+    outfit["scenarios"] = scenarios
+    return outfit
+
+
 class OutfitResponse(BaseModel):
     id: UUID
     user_id: UUID
@@ -40,13 +95,18 @@ class OutfitResponse(BaseModel):
 async def list_outfits(
     user_id: Optional[UUID] = None,
     shop_id: Optional[UUID] = None,
+    expand: Optional[str] = None,
     supabase: Client = Depends(get_supabase)
 ):
-    """Lista outfit con filtri opzionali"""
+    """
+    Lista outfit con filtri opzionali
+    
+    Con expand=products,scenarios i dettagli di prodotti (nome, categoria,
+    miniatura) e scenari sono inclusi nella stessa query.
+    """
+    relations = _parse_expand(expand)
     try:
-        query = supabase.table("outfits").select(
-            "*, outfit_products(product_id), outfit_scenarios(scenario_prompt_id, custom_text)"
-        )
+        query = supabase.table("outfits").select(_outfit_select(relations))
         
         if user_id:
             query = query.eq("user_id", str(user_id))
@@ -56,24 +116,7 @@ async def list_outfits(
         result = query.execute()
         
         # Formatta i risultati per includere product_ids e scenari
-        outfits = []
-        for outfit in result.data:
-            outfit_data = {**outfit}
-            outfit_data["product_ids"] = [
-                op["product_id"] for op in outfit.get("outfit_products", [])
-            ]
-            outfit_data["scenarios"] = [
-                {
-                    "scenario_prompt_id": os["scenario_prompt_id"],
-                    "custom_text": os.get("custom_text")
-                }
-                for os in outfit.get("outfit_scenarios", [])
-            ]
-            if "outfit_products" in outfit_data:
-                del outfit_data["outfit_products"]
-            if "outfit_scenarios" in outfit_data:
-                del outfit_data["outfit_scenarios"]
-            outfits.append(outfit_data)
+        outfits = [_format_outfit(outfit, relations) for outfit in result.data]
         
         return {
             "outfits": outfits,
@@ -88,12 +131,15 @@ async def list_outfits(
 
 
 @router.get("/{outfit_id}")
-async def get_outfit(outfit_id: UUID, supabase: Client = Depends(get_supabase)):
-    """Ottieni dettagli di un outfit"""
+async def get_outfit(
+    outfit_id: UUID,
+    expand: Optional[str] = None,
+    supabase: Client = Depends(get_supabase)
+):
+    """Ottieni dettagli di un outfit (expand come in list_outfits)"""
+    relations = _parse_expand(expand)
     try:
-        result = supabase.table("outfits").select(
-            "*, outfit_products(product_id), outfit_scenarios(scenario_prompt_id, custom_text)"
-        ).eq("id", str(outfit_id)).execute()
+        result = supabase.table("outfits").select(_outfit_select(relations)).eq("id", str(outfit_id)).execute()
         
         if not result.data:
             raise HTTPException(
@@ -101,23 +147,7 @@ async def get_outfit(outfit_id: UUID, supabase: Client = Depends(get_supabase)):
                 detail="Outfit non trovato"
             )
         
-        outfit = result.data[0]
-        outfit["product_ids"] = [
-            op["product_id"] for op in outfit.get("outfit_products", [])
-        ]
-        outfit["scenarios"] = [
-            {
-                "scenario_prompt_id": os["scenario_prompt_id"],
-                "custom_text": os.get("custom_text")
-            }
-            for os in outfit.get("outfit_scenarios", [])
-        ]
-        if "outfit_products" in outfit:
-            del outfit["outfit_products"]
-        if "outfit_scenarios" in outfit:
-            del outfit["outfit_scenarios"]
-        
-        return {"outfit": outfit}
+        return {"outfit": _format_outfit(result.data[0], relations)}
     except HTTPException:
         raise
     except Exception as e:
@@ -128,123 +158,92 @@ async def get_outfit(outfit_id: UUID, supabase: Client = Depends(get_supabase)):
         )
 
 
-@router.post("/", status_code=status.HTTP_201_CREATED)
-async def create_outfit(outfit: OutfitCreate, supabase: Client = Depends(get_supabase)):
-    """Crea un nuovo outfit"""
-    try:
-        # Valida numero prodotti (max 10)
-        if len(outfit.product_ids) > 10:
+# Codici SQLSTATE sollevati da save_outfit (migration 012) -> status HTTP
+# (messaggio None = usa quello sollevato dalla funzione)
+SAVE_OUTFIT_ERRORS = {
+    "P0002": (status.HTTP_404_NOT_FOUND, None),    # outfit, cliente o scenario non trovato
+    "22023": (status.HTTP_400_BAD_REQUEST, None),  # scenario di un altro negozio, parametri non validi
+    "23503": (status.HTTP_400_BAD_REQUEST, "Uno o più prodotti selezionati non esistono"),  # foreign key
+}
+
+
+def _validate_outfit_items(product_ids: Optional[List[UUID]], scenarios: Optional[List[OutfitScenario]]):
+    """Limiti su prodotti (1-10) e scenari (max 3), verificati prima di chiamare il database"""
+    if product_ids is not None:
+        if len(product_ids) > 10:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Puoi selezionare massimo 10 prodotti"
             )
-        
-        if len(outfit.product_ids) == 0:
+        if len(product_ids) == 0:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Seleziona almeno un prodotto"
             )
-        
-        # Valida numero scenari (max 3)
-        scenarios = outfit.scenarios or []
-        if len(scenarios) > 3:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Puoi selezionare massimo 3 scenari"
-            )
-        
-        # Verifica che gli scenari esistano e appartengano al negozio
-        if scenarios:
-            scenario_ids = [str(s.scenario_prompt_id) for s in scenarios]
-            scenarios_result = supabase.table("scenario_prompts").select("*").in_("id", scenario_ids).execute()
-            found_scenario_ids = {s["id"] for s in scenarios_result.data}
-            
-            for scenario in scenarios:
-                if str(scenario.scenario_prompt_id) not in found_scenario_ids:
-                    raise HTTPException(
-                        status_code=status.HTTP_404_NOT_FOUND,
-                        detail=f"Scenario prompt {scenario.scenario_prompt_id} non trovato"
-                    )
-                # Verifica che lo scenario appartenga al negozio
-                scenario_data = next(s for s in scenarios_result.data if s["id"] == str(scenario.scenario_prompt_id))
-                if scenario_data["shop_id"] != str(outfit.shop_id):
-                    raise HTTPException(
-                        status_code=status.HTTP_400_BAD_REQUEST,
-                        detail=f"Lo scenario {scenario.scenario_prompt_id} non appartiene a questo negozio"
-                    )
-        
-        # Verifica che il cliente appartenga al negozio
-        customer_response = supabase.table("shop_customers").select("*").eq("id", str(outfit.customer_id)).eq("shop_id", str(outfit.shop_id)).execute()
-        if not customer_response.data:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Cliente non trovato per questo negozio"
-            )
-        
-        # Crea l'outfit
-        # Nota: la tabella outfits potrebbe avere solo user_id, quindi per ora usiamo NULL
-        # In futuro possiamo aggiungere customer_id alla tabella outfits
-        outfit_data = {
-            "shop_id": str(outfit.shop_id),
-            "name": outfit.name,
-            "user_id": None  # Per clienti shop_customers non abbiamo user_id
-        }
-        
-        result = supabase.table("outfits").insert(outfit_data).execute()
-        
-        if not result.data:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Errore durante la creazione dell'outfit"
-            )
-        
-        created_outfit = result.data[0]
-        outfit_id = created_outfit["id"]
-        
-        # Aggiungi i prodotti all'outfit
-        if outfit.product_ids:
-            outfit_products = [
-                {"outfit_id": outfit_id, "product_id": str(pid)}
-                for pid in outfit.product_ids
-            ]
-            supabase.table("outfit_products").insert(outfit_products).execute()
-        
-        # Aggiungi gli scenari all'outfit
-        if scenarios:
-            outfit_scenarios = [
-                {
-                    "outfit_id": outfit_id,
-                    "scenario_prompt_id": str(s.scenario_prompt_id),
-                    "custom_text": s.custom_text
-                }
-                for s in scenarios
-            ]
-            supabase.table("outfit_scenarios").insert(outfit_scenarios).execute()
-        
-        # Recupera l'outfit completo con i prodotti e scenari
-        final_result = supabase.table("outfits").select(
-            "*, outfit_products(product_id), outfit_scenarios(scenario_prompt_id, custom_text)"
-        ).eq("id", outfit_id).execute()
-        
-        final_outfit = final_result.data[0]
-        final_outfit["product_ids"] = [
-            op["product_id"] for op in final_outfit.get("outfit_products", [])
-        ]
-        final_outfit["scenarios"] = [
-            {
-                "scenario_prompt_id": os["scenario_prompt_id"],
-                "custom_text": os.get("custom_text")
-            }
-            for os in final_outfit.get("outfit_scenarios", [])
-        ]
-        if "outfit_products" in final_outfit:
-            del final_outfit["outfit_products"]
-        if "outfit_scenarios" in final_outfit:
-            del final_outfit["outfit_scenarios"]
+    if scenarios is not None and len(scenarios) > 3:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Puoi selezionare massimo 3 scenari"
+        )
+
+
+def _save_outfit(supabase: Client, params: dict) -> dict:
+    """
+    Chiama la funzione SQL save_outfit: outfit, prodotti e scenari vengono
+    scritti in un'unica transazione e l'outfit finale torna nella stessa risposta
+    """
+    try:
+        result = supabase.rpc("save_outfit", params).execute()
+    except APIError as e:
+        if e.code not in SAVE_OUTFIT_ERRORS:
+            raise
+        status_code, detail = SAVE_OUTFIT_ERRORS[e.code]
+        raise HTTPException(status_code=status_code, detail=detail or e.message)
+    
+    if not result.data:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Errore durante il salvataggio dell'outfit"
+        )
+    return result.data
+
+
+def _product_ids_param(product_ids: Optional[List[UUID]]) -> Optional[List[str]]:
+    # Duplicati rimossi mantenendo l'ordine: la funzione SQL scrive solo le differenze
+    if product_ids is None:
+        return None
+    return list(dict.fromkeys(str(pid) for pid in product_ids))
+
+
+def _scenarios_param(scenarios: Optional[List[OutfitScenario]]) -> Optional[list]:
+    if scenarios is None:
+        return None
+    return [
+        {"scenario_prompt_id": str(s.scenario_prompt_id), "custom_text": s.custom_text}
+        for s in scenarios
+    ]
+
+
+@router.post("/", status_code=status.HTTP_201_CREATED)
+async def create_outfit(outfit: OutfitCreate, supabase: Client = Depends(get_supabase)):
+    """Crea un nuovo outfit (con prodotti e scenari) in una sola transazione"""
+    scenarios = outfit.scenarios or []
+    _validate_outfit_items(outfit.product_ids, scenarios)
+    
+    try:
+        # Nota: la tabella outfits non ha customer_id, il cliente viene solo verificato
+        created_outfit = _save_outfit(supabase, {
+            "p_outfit_id": None,
+            "p_shop_id": str(outfit.shop_id),
+            "p_customer_id": str(outfit.customer_id),
+            "p_name": outfit.name,
+            "p_product_ids": _product_ids_param(outfit.product_ids),
+            "p_scenarios": _scenarios_param(scenarios)
+        })
         
         return {
             "message": "Outfit creato con successo",
-            "outfit": final_outfit
+            "outfit": created_outfit
         }
     except HTTPException:
         raise
@@ -268,121 +267,27 @@ async def update_outfit(
     outfit_update: OutfitUpdate,
     supabase: Client = Depends(get_supabase)
 ):
-    """Aggiorna un outfit esistente"""
+    """
+    Aggiorna un outfit esistente in una sola transazione
+    
+    I campi non forniti restano invariati; prodotti e scenari forniti
+    sostituiscono quelli attuali, ma sul database vengono scritte solo le
+    righe aggiunte, rimosse o con testo cambiato.
+    """
+    _validate_outfit_items(outfit_update.product_ids, outfit_update.scenarios)
+    
     try:
-        # Verifica che l'outfit esista
-        existing_outfit = supabase.table("outfits").select("*").eq("id", str(outfit_id)).execute()
-        if not existing_outfit.data:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Outfit non trovato"
-            )
-        
-        outfit = existing_outfit.data[0]
-        
-        # Aggiorna nome se fornito
-        update_data = {}
-        if outfit_update.name is not None:
-            update_data["name"] = outfit_update.name
-        
-        if update_data:
-            supabase.table("outfits").update(update_data).eq("id", str(outfit_id)).execute()
-        
-        # Aggiorna prodotti se forniti
-        if outfit_update.product_ids is not None:
-            # Valida numero prodotti (max 10)
-            if len(outfit_update.product_ids) > 10:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail="Puoi selezionare massimo 10 prodotti"
-                )
-            
-            if len(outfit_update.product_ids) == 0:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail="Seleziona almeno un prodotto"
-                )
-            
-            # Elimina prodotti esistenti
-            supabase.table("outfit_products").delete().eq("outfit_id", str(outfit_id)).execute()
-            
-            # Inserisci nuovi prodotti
-            outfit_products = [
-                {"outfit_id": str(outfit_id), "product_id": str(pid)}
-                for pid in outfit_update.product_ids
-            ]
-            if outfit_products:
-                supabase.table("outfit_products").insert(outfit_products).execute()
-        
-        # Aggiorna scenari se forniti
-        if outfit_update.scenarios is not None:
-            # Valida numero scenari (max 3)
-            scenarios = outfit_update.scenarios
-            if len(scenarios) > 3:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail="Puoi selezionare massimo 3 scenari"
-                )
-            
-            # Verifica che gli scenari esistano e appartengano al negozio
-            if scenarios:
-                scenario_ids = [str(s.scenario_prompt_id) for s in scenarios]
-                scenarios_result = supabase.table("scenario_prompts").select("*").in_("id", scenario_ids).execute()
-                found_scenario_ids = {s["id"] for s in scenarios_result.data}
-                
-                for scenario in scenarios:
-                    if str(scenario.scenario_prompt_id) not in found_scenario_ids:
-                        raise HTTPException(
-                            status_code=status.HTTP_404_NOT_FOUND,
-                            detail=f"Scenario prompt {scenario.scenario_prompt_id} non trovato"
-                        )
-                    # Verifica che lo scenario appartenga al negozio
-                    scenario_data = next(s for s in scenarios_result.data if s["id"] == str(scenario.scenario_prompt_id))
-                    if scenario_data["shop_id"] != str(outfit["shop_id"]):
-                        raise HTTPException(
-                            status_code=status.HTTP_400_BAD_REQUEST,
-                            detail=f"Lo scenario {scenario.scenario_prompt_id} non appartiene a questo negozio"
-                        )
-            
-            # Elimina scenari esistenti
-            supabase.table("outfit_scenarios").delete().eq("outfit_id", str(outfit_id)).execute()
-            
-            # Inserisci nuovi scenari
-            if scenarios:
-                outfit_scenarios = [
-                    {
-                        "outfit_id": str(outfit_id),
-                        "scenario_prompt_id": str(s.scenario_prompt_id),
-                        "custom_text": s.custom_text
-                    }
-                    for s in scenarios
-                ]
-                supabase.table("outfit_scenarios").insert(outfit_scenarios).execute()
-        
-        # Recupera l'outfit aggiornato con i prodotti e scenari
-        final_result = supabase.table("outfits").select(
-            "*, outfit_products(product_id), outfit_scenarios(scenario_prompt_id, custom_text)"
-        ).eq("id", str(outfit_id)).execute()
-        
-        final_outfit = final_result.data[0]
-        final_outfit["product_ids"] = [
-            op["product_id"] for op in final_outfit.get("outfit_products", [])
-        ]
-        final_outfit["scenarios"] = [
-            {
-                "scenario_prompt_id": os["scenario_prompt_id"],
-                "custom_text": os.get("custom_text")
-            }
-            for os in final_outfit.get("outfit_scenarios", [])
-        ]
-        if "outfit_products" in final_outfit:
-            del final_outfit["outfit_products"]
-        if "outfit_scenarios" in final_outfit:
-            del final_outfit["outfit_scenarios"]
+        updated_outfit = _save_outfit(supabase, {
+            "p_outfit_id": str(outfit_id),
+            "p_name": outfit_update.name,
+            "p_update_name": outfit_update.name is not None,
+            "p_product_ids": _product_ids_param(outfit_update.product_ids),
+            "p_scenarios": _scenarios_param(outfit_update.scenarios)
+        })
         
         return {
             "message": "Outfit aggiornato con successo",
-            "outfit": final_outfit
+            "outfit": updated_outfit
         }
     except HTTPException:
         raise
@@ -1,23 +1,52 @@
 """
 Route per gestione prodotti
 """
-from fastapi import APIRouter, HTTPException, Depends, status
-from pydantic import BaseModel
-from typing import Optional, List
-from uuid import UUID
+from fastapi import APIRouter, HTTPException, Depends, status, Request, Query, UploadFile, File
+from pydantic import BaseModel, ValidationError
+from typing import Optional, List, AsyncIterator, Iterator, Tuple
+from uuid import UUID, uuid4
 from supabase import Client
-from backend.database import get_supabase
+from backend.database import get_supabase, get_supabase_admin
 from backend.middleware.auth import get_current_user
+from backend.services.image_processing import make_product_derivatives
+from backend.utils.json_response import FastJSONRoute
+from backend.utils.retry import storage_retry_policy
+import asyncio
+import codecs
+import csv
+import json
 import logging
+import os
+import tarfile
+import zipfile
 
 logger = logging.getLogger(__name__)
 
-router = APIRouter(prefix="/api/products", tags=["prodotti"])
+router = APIRouter(prefix="/api/products", tags=["prodotti"], route_class=FastJSONRoute)
+
+VALID_CATEGORIES = [
+    "giacche", "blazer", "maglieria", "felpe&ibridi", 
+    "camicie", "shirty", "pantaloni", "calzini", 
+    "short", "scarpe", "copricapi", "accessori"
+]
+
+# Import massivo: limiti per richiesta
+MAX_IMPORT_ROWS = 20000
+MAX_REPORTED_ERRORS = 500
+
+# Import immagini da archivio: limiti per richiesta e per singolo file
+MAX_ARCHIVE_IMAGES = 5000
+MAX_ARCHIVE_MEMBER_BYTES = 25 * 1024 * 1024
+ARCHIVE_IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp", ".avif", ".gif", ".bmp", ".tif", ".tiff"}
+
+# Ricerca: ordinamenti supportati dalla funzione SQL search_products (migration 010)
+SEARCH_SORT_OPTIONS = ["relevance", "name", "price_asc", "price_desc", "newest"]
 
 
 class ProductCreate(BaseModel):
     shop_id: UUID
     name: str
+    sku: Optional[str] = None  # Codice articolo (univoco per negozio)
     description: Optional[str] = None
     category: str  # 'giacche', 'blazer', 'maglieria', 'felpe&ibridi', 'camicie', 'shirty', 'pantaloni', 'calzini', 'short', 'scarpe', 'copricapi', 'accessori'
     season: Optional[str] = None
@@ -31,6 +60,7 @@ class ProductCreate(BaseModel):
 
 class ProductUpdate(BaseModel):
     name: Optional[str] = None
+    sku: Optional[str] = None
     description: Optional[str] = None
     category: Optional[str] = None
     season: Optional[str] = None
@@ -72,6 +102,89 @@ async def list_products(
         )
 
 
+@router.get("/search")
+async def search_products(
+    q: Optional[str] = Query(None, max_length=200),
+    shop_id: Optional[UUID] = None,
+    category: Optional[str] = None,
+    season: Optional[str] = None,
+    occasion: Optional[str] = None,
+    style: Optional[str] = None,
+    min_price: Optional[float] = Query(None, ge=0),
+    max_price: Optional[float] = Query(None, ge=0),
+    available: Optional[bool] = None,
+    sort: str = "relevance",
+    page: int = Query(1, ge=1),
+    page_size: int = Query(24, ge=1, le=100),
+    supabase: Client = Depends(get_supabase)
+):
+    """
+    Ricerca prodotti lato server con filtri combinabili e paginazione
+    
+    Il testo viene cercato su nome e descrizione (full-text italiano) e su nome
+    e SKU per corrispondenza parziale (trigrammi). Filtri, ordinamento e
+    conteggio totale sono calcolati da una sola chiamata alla funzione SQL
+    search_products.
+    """
+    if sort not in SEARCH_SORT_OPTIONS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Ordinamento non valido. Usa uno tra: {', '.join(SEARCH_SORT_OPTIONS)}"
+        )
+    if min_price is not None and max_price is not None and min_price > max_price:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="min_price non può essere maggiore di max_price"
+        )
+    
+    params = {
+        "p_query": q.strip() if q and q.strip() else None,
+        "p_shop_id": str(shop_id) if shop_id else None,
+        "p_category": category,
+        "p_season": season,
+        "p_occasion": occasion,
+        "p_style": style,
+        "p_min_price": min_price,
+        "p_max_price": max_price,
+        "p_available": available,
+        # Senza testo non c'è rilevanza: ordina per nome
+        "p_sort": sort if sort != "relevance" or q else "name",
+        "p_limit": page_size,
+        "p_offset": (page - 1) * page_size
+    }
+    
+    try:
+        result = supabase.rpc("search_products", params).execute()
+        rows = result.data or []
+        
+        if rows:
+            total = rows[0]["total_count"]
+        elif page > 1:
+            # Pagina oltre la fine: il totale va letto dalla prima pagina
+            first = supabase.rpc("search_products", {**params, "p_limit": 1, "p_offset": 0}).execute()
+            total = first.data[0]["total_count"] if first.data else 0
+        else:
+            total = 0
+        
+        for row in rows:
+            row.pop("total_count", None)
+        
+        return {
+            "products": rows,
+            "count": len(rows),
+            "total": total,
+            "page": page,
+            "page_size": page_size,
+            "total_pages": (total + page_size - 1) // page_size
+        }
+    except Exception as e:
+        logger.error(f"Errore ricerca prodotti: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Errore durante la ricerca prodotti: {str(e)}"
+        )
+
+
 @router.get("/{product_id}")
 async def get_product(product_id: UUID, supabase: Client = Depends(get_supabase)):
     """Ottieni dettagli di un prodotto"""
@@ -125,15 +238,10 @@ async def create_product(
             )
         
         # Valida categoria
-        valid_categories = [
-            "giacche", "blazer", "maglieria", "felpe&ibridi", 
-            "camicie", "shirty", "pantaloni", "calzini", 
-            "short", "scarpe", "copricapi", "accessori"
-        ]
-        if product.category not in valid_categories:
+        if product.category not in VALID_CATEGORIES:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Categoria non valida. Categorie valide: {', '.join(valid_categories)}"
+                detail=f"Categoria non valida. Categorie valide: {', '.join(VALID_CATEGORIES)}"
             )
         
         # Valida numero immagini (max 3)
@@ -179,6 +287,458 @@ async def create_product(
         )
 
 
+def _import_product_row(product: ProductCreate) -> dict:
+    """Converte un prodotto validato nella riga da inserire (stesse regole di create_product)"""
+    images = list(product.images or [])
+    if product.image_url:
+        images.append(product.image_url)
+    images = list(dict.fromkeys(images))[:3]  # Rimuovi duplicati mantenendo l'ordine, max 3
+    
+    product_data = product.model_dump(exclude={'images'})
+    product_data["shop_id"] = str(product_data["shop_id"])
+    product_data["image_url"] = images[0] if images else None
+    return product_data
+
+
+def _detect_import_format(format: Optional[str], content_type: str) -> str:
+    """Determina il formato del body (csv o ndjson) da parametro o Content-Type"""
+    if format:
+        format = format.lower()
+    else:
+        content_type = (content_type or "").split(";")[0].strip().lower()
+        if content_type in ("text/csv", "application/csv"):
+            format = "csv"
+        elif content_type in ("application/x-ndjson", "application/ndjson", "application/jsonl", "application/json-lines"):
+            format = "ndjson"
+    
+    if format not in ("csv", "ndjson"):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Formato non supportato. Usa format=csv o format=ndjson (oppure Content-Type text/csv / application/x-ndjson)"
+        )
+    return format
+
+
+async def _iter_body_lines(request: Request) -> AsyncIterator[str]:
+    """Legge il body in streaming e restituisce una riga di testo alla volta"""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    async for chunk in request.stream():
+        pending += decoder.decode(chunk)
+        lines = pending.split("\n")
+        pending = lines.pop()
+        for line in lines:
+            yield line.rstrip("\r")
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending.rstrip("\r")
+
+
+async def _iter_import_records(request: Request, format: str) -> AsyncIterator[Tuple[int, Optional[dict], Optional[str]]]:
+    """
+    Restituisce (numero_riga, record, errore) per ogni record del body
+    
+    Il numero di riga è 1-based e non conta l'intestazione CSV.
+    """
+    row_number = 0
+    
+    if format == "ndjson":
+        async for line in _iter_body_lines(request):
+            if not line.strip():
+                continue
+            row_number += 1
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                yield row_number, None, f"JSON non valido: {e.msg}"
+                continue
+            if not isinstance(record, dict):
+                yield row_number, None, "Ogni riga deve essere un oggetto JSON"
+                continue
+            yield row_number, record, None
+        return
+    
+    # CSV: un record può occupare più righe se contiene campi tra virgolette con a capo,
+    # quindi accumula le righe finché il numero di virgolette non è pari
+    header = None
+    buffer = []
+    quotes = 0
+    async for line in _iter_body_lines(request):
+        buffer.append(line)
+        quotes += line.count('"')
+        if quotes % 2:
+            continue
+        text = "\n".join(buffer)
+        buffer, quotes = [], 0
+        if not text.strip():
+            continue
+        values = next(csv.reader([text]))
+        if header is None:
+            header = [h.strip() for h in values]
+            continue
+        row_number += 1
+        if len(values) > len(header):
+            yield row_number, None, f"Attese {len(header)} colonne, trovate {len(values)}"
+            continue
+        # Le celle vuote vengono omesse così si applicano i default del modello
+        record = {key: value for key, value in zip(header, values) if key and value.strip() != ""}
+        if "images" in record:
+            record["images"] = [url.strip() for url in record["images"].split("|") if url.strip()]
+        yield row_number, record, None
+    
+    if buffer:
+        row_number += 1
+        yield row_number, None, "Record CSV incompleto (virgolette non chiuse)"
+
+
+@router.post("/import")
+async def import_products(
+    request: Request,
+    shop_id: UUID,
+    format: Optional[str] = None,
+    batch_size: int = Query(500, ge=1, le=1000),
+    current_user: dict = Depends(get_current_user),
+    supabase: Client = Depends(get_supabase)
+):
+    """
+    Import massivo di prodotti da CSV o NDJSON inviato come body della richiesta
+    
+    Il body viene letto in streaming, ogni riga è validata con ProductCreate e le righe
+    valide sono inserite a blocchi di batch_size. Il negozio viene verificato una sola volta.
+    Nel CSV il campo 'images' accetta più URL separati da '|'.
+    """
+    # Solo negozianti possono creare prodotti
+    if current_user["role"] != "negoziante":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Solo i negozianti possono creare prodotti"
+        )
+    
+    import_format = _detect_import_format(format, request.headers.get("content-type"))
+    
+    # Verifica una sola volta che il negozio appartenga all'utente corrente
+    shop_result = supabase.table("shops").select("owner_id").eq("id", str(shop_id)).execute()
+    if not shop_result.data:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Negozio non trovato"
+        )
+    if shop_result.data[0]["owner_id"] != current_user["id"]:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Puoi creare prodotti solo per i tuoi negozi"
+        )
+    
+    errors = []
+    error_count = 0
+    imported_count = 0
+    total_rows = 0
+    batch = []  # Lista di (numero_riga, dati_prodotto)
+    
+    def add_error(row_number: int, message: str):
+        nonlocal error_count
+        error_count += 1
+        if len(errors) < MAX_REPORTED_ERRORS:
+            errors.append({"row": row_number, "error": message})
+    
+    def flush_batch():
+        """Inserisce il blocco corrente; se fallisce, riprova riga per riga per isolare gli errori"""
+        nonlocal imported_count
+        if not batch:
+            return
+        try:
+            result = supabase.table("products").insert([data for _, data in batch]).execute()
+            imported_count += len(result.data or [])
+        except Exception as batch_error:
+            logger.warning(f"⚠️ Insert a blocchi fallito ({len(batch)} righe), riprovo riga per riga: {batch_error}")
+            for row_number, data in batch:
+                try:
+                    result = supabase.table("products").insert(data).execute()
+                    imported_count += len(result.data or [])
+                except Exception as row_error:
+                    add_error(row_number, f"Errore database: {row_error}")
+        batch.clear()
+    
+    try:
+        async for row_number, record, parse_error in _iter_import_records(request, import_format):
+            total_rows = row_number
+            if total_rows > MAX_IMPORT_ROWS:
+                raise HTTPException(
+                    status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                    detail=f"Massimo {MAX_IMPORT_ROWS} prodotti per import ({imported_count} già importati)"
+                )
+            if parse_error:
+                add_error(row_number, parse_error)
+                continue
+            
+            record["shop_id"] = str(shop_id)
+            try:
+                product = ProductCreate.model_validate(record)
+            except ValidationError as e:
+                add_error(row_number, "; ".join(
+                    f"{'.'.join(str(loc) for loc in err['loc'])}: {err['msg']}" for err in e.errors()
+                ))
+                continue
+            
+            if product.category not in VALID_CATEGORIES:
+                add_error(row_number, f"Categoria non valida: {product.category}")
+                continue
+            
+            batch.append((row_number, _import_product_row(product)))
+            if len(batch) >= batch_size:
+                flush_batch()
+        
+        flush_batch()
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Errore import prodotti: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Errore durante l'import dei prodotti: {str(e)} ({imported_count} prodotti già importati)"
+        )
+    
+    logger.info(f"📦 Import prodotti negozio {shop_id}: {imported_count}/{total_rows} importati, {error_count} errori")
+    
+    return {
+        "message": f"{imported_count} prodotti importati con successo",
+        "total_rows": total_rows,
+        "imported_count": imported_count,
+        "error_count": error_count,
+        "errors": errors,
+        "errors_truncated": error_count > len(errors)
+    }
+
+
+def _iter_archive_images(fileobj, filename: str) -> Iterator[Tuple[str, Optional[bytes], Optional[str]]]:
+    """
+    Estrae in streaming le immagini da un archivio ZIP o tar (anche compresso)
+    
+    Restituisce (nome_file, bytes, errore) un file alla volta, così in memoria
+    c'è solo l'immagine in lavorazione. Cartelle, file nascosti e file non
+    immagine vengono ignorati.
+    """
+    def is_image(name: str) -> bool:
+        base = os.path.basename(name)
+        if not base or base.startswith(".") or name.startswith("__MACOSX/"):
+            return False
+        return os.path.splitext(base)[1].lower() in ARCHIVE_IMAGE_EXTENSIONS
+    
+    if zipfile.is_zipfile(fileobj):
+        fileobj.seek(0)
+        with zipfile.ZipFile(fileobj) as archive:
+            for info in archive.infolist():
+                if info.is_dir() or not is_image(info.filename):
+                    continue
+                if info.file_size > MAX_ARCHIVE_MEMBER_BYTES:
+                    yield info.filename, None, f"File troppo grande ({info.file_size} bytes)"
+                    continue
+                yield info.filename, archive.read(info), None
+        return
+    
+    fileobj.seek(0)
+    try:
+        archive = tarfile.open(fileobj=fileobj, mode="r|*")
+    except tarfile.TarError:
+        raise ValueError(f"Archivio non supportato: {filename}. Usa ZIP o tar (.tar, .tar.gz, .tgz)")
+    with archive:
+        for member in archive:
+            if not member.isfile() or not is_image(member.name):
+                continue
+            if member.size > MAX_ARCHIVE_MEMBER_BYTES:
+                yield member.name, None, f"File troppo grande ({member.size} bytes)"
+                continue
+            extracted = archive.extractfile(member)
+            yield member.name, extracted.read() if extracted else None, None if extracted else "File non leggibile"
+
+
+@router.post("/images/import")
+async def import_product_images(
+    shop_id: UUID,
+    file: UploadFile = File(...),
+    concurrency: int = Query(4, ge=1, le=8),
+    current_user: dict = Depends(get_current_user),
+    supabase: Client = Depends(get_supabase)
+):
+    """
+    Import massivo di immagini prodotto da un archivio ZIP o tar
+    
+    Ogni file deve chiamarsi con lo SKU o l'ID del prodotto (es: 'ABC-123.jpg').
+    Per ogni immagine vengono generate la variante principale e la miniatura,
+    caricate su Storage con concorrenza limitata; image_url e thumbnail_url dei
+    prodotti vengono poi aggiornati a blocchi.
+    """
+    # Solo negozianti possono modificare prodotti
+    if current_user["role"] != "negoziante":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Solo i negozianti possono caricare immagini prodotto"
+        )
+    
+    # Verifica che il negozio appartenga all'utente corrente
+    shop_result = supabase.table("shops").select("owner_id").eq("id", str(shop_id)).execute()
+    if not shop_result.data:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Negozio non trovato"
+        )
+    if shop_result.data[0]["owner_id"] != current_user["id"]:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Puoi caricare immagini solo per i prodotti dei tuoi negozi"
+        )
+    
+    try:
+        supabase_admin = get_supabase_admin()
+        
+        # Un'unica query per associare i nomi file ai prodotti (per ID o SKU)
+        products_result = supabase.table("products").select("id, sku, name, category").eq("shop_id", str(shop_id)).execute()
+        products_by_key = {}
+        for product in products_result.data or []:
+            products_by_key[str(product["id"]).lower()] = product
+            if product.get("sku"):
+                products_by_key[str(product["sku"]).strip().lower()] = product
+        
+        bucket_name = "product-images"
+        loop = asyncio.get_event_loop()
+        semaphore = asyncio.Semaphore(concurrency)
+        updates = []
+        errors = []
+        seen_products = set()
+        uploaded_paths = {}  # product_id -> file caricati, per rimuoverli se l'aggiornamento non avviene
+        
+        def upload(path: str, variant: dict) -> str:
+            supabase_admin.storage.from_(bucket_name).upload(
+                path,
+                variant["data"],
+                file_options={"content-type": variant["mime_type"], "upsert": "true"}
+            )
+            return supabase_admin.storage.from_(bucket_name).get_public_url(path)
+        
+        def remove_uploads(product_ids: list) -> None:
+            paths = [path for product_id in product_ids for path in uploaded_paths.get(product_id, [])]
+            if not paths:
+                return
+            try:
+                supabase_admin.storage.from_(bucket_name).remove(paths)
+            except Exception as e:
+                logger.warning(f"⚠️ Impossibile rimuovere {len(paths)} immagini non utilizzate: {e}")
+        
+        async def process(member_name: str, product: dict, image_bytes: bytes):
+            try:
+                variants = await loop.run_in_executor(None, make_product_derivatives, image_bytes)
+                base_path = f"{shop_id}/{product['id']}/{uuid4().hex}"
+                main, thumbnail = variants["main"], variants["thumbnail"]
+                main_path = f"{base_path}.{main['extension']}"
+                thumbnail_path = f"{base_path}_thumb.{thumbnail['extension']}"
+                uploaded_paths[product["id"]] = [main_path, thumbnail_path]
+                image_url, thumbnail_url = await asyncio.gather(
+                    storage_retry_policy.run_in_executor(upload, main_path, main),
+                    storage_retry_policy.run_in_executor(upload, thumbnail_path, thumbnail)
+                )
+                updates.append({
+                    "id": product["id"],
+                    "file": member_name,
+                    "image_url": image_url,
+                    "thumbnail_url": thumbnail_url
+                })
+            except Exception as e:
+                logger.error(f"❌ Errore elaborazione immagine {member_name}: {e}")
+                errors.append({"file": member_name, "error": str(e)})
+            finally:
+                semaphore.release()
+        
+        archive_iter = _iter_archive_images(file.file, file.filename or "")
+        tasks = []
+        image_count = 0
+        try:
+            while True:
+                # Non estrarre il file successivo finché non c'è uno slot libero:
+                # in memoria restano al massimo `concurrency` immagini
+                await semaphore.acquire()
+                item = await loop.run_in_executor(None, next, archive_iter, None)
+                if item is None:
+                    semaphore.release()
+                    break
+                member_name, image_bytes, extract_error = item
+                image_count += 1
+                if image_count > MAX_ARCHIVE_IMAGES:
+                    semaphore.release()
+                    errors.append({"file": member_name, "error": f"Superato il limite di {MAX_ARCHIVE_IMAGES} immagini per archivio"})
+                    break
+                
+                key = os.path.splitext(os.path.basename(member_name))[0].strip().lower()
+                product = products_by_key.get(key)
+                error = extract_error
+                if not error and not product:
+                    error = "Nessun prodotto del negozio con questo SKU o ID"
+                elif not error and product["id"] in seen_products:
+                    error = "Immagine duplicata per lo stesso prodotto, ignorata"
+                if error:
+                    semaphore.release()
+                    errors.append({"file": member_name, "error": error})
+                    continue
+                
+                seen_products.add(product["id"])
+                tasks.append(asyncio.create_task(process(member_name, product, image_bytes)))
+        except (ValueError, zipfile.BadZipFile, tarfile.TarError) as e:
+            # Archivio non valido o danneggiato a metà: si attendono le elaborazioni
+            # avviate e si rimuovono le immagini già caricate, che non verranno usate
+            await asyncio.gather(*tasks)
+            await loop.run_in_executor(None, remove_uploads, list(uploaded_paths))
+            if isinstance(e, ValueError):
+                raise
+            raise ValueError(f"Archivio danneggiato: {e}")
+        finally:
+            # Nessuna elaborazione resta in volo senza essere attesa
+            await asyncio.gather(*tasks)
+        
+        # Aggiornamento a blocchi: una chiamata per blocco invece di un update per prodotto.
+        # Scrive solo image_url e thumbnail_url dei prodotti ancora esistenti
+        updated_ids = set()
+        batch_size = 500
+        for start in range(0, len(updates), batch_size):
+            result = supabase.rpc("update_product_images", {
+                "p_shop_id": str(shop_id),
+                "p_images": updates[start:start + batch_size]
+            }).execute()
+            updated_ids.update(row["id"] for row in result.data or [])
+        
+        # Prodotti eliminati durante l'import: niente riga da aggiornare, file rimossi
+        missing = [u for u in updates if u["id"] not in updated_ids]
+        if missing:
+            for u in missing:
+                errors.append({"file": u["file"], "error": "Prodotto eliminato durante l'import"})
+            updates = [u for u in updates if u["id"] in updated_ids]
+            await loop.run_in_executor(None, remove_uploads, [u["id"] for u in missing])
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Errore import immagini prodotto: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Errore durante l'import delle immagini: {str(e)}"
+        )
+    
+    logger.info(f"🖼️ Import immagini negozio {shop_id}: {len(updates)} prodotti aggiornati, {len(errors)} errori")
+    
+    return {
+        "message": f"{len(updates)} immagini prodotto importate con successo",
+        "updated_count": len(updates),
+        "error_count": len(errors),
+        "errors": errors[:MAX_REPORTED_ERRORS],
+        "products": [
+            {"id": u["id"], "image_url": u["image_url"], "thumbnail_url": u["thumbnail_url"]}
+            for u in updates
+        ]
+    }
+
+
 @router.put("/{product_id}")
 async def update_product(product_id: UUID, product: ProductUpdate, supabase: Client = Depends(get_supabase)):
     """Aggiorna un prodotto"""
@@ -193,15 +753,10 @@ async def update_product(product_id: UUID, product: ProductUpdate, supabase: Cli
         
         # Valida categoria se presente negli aggiornamenti
         if "category" in updates:
-            valid_categories = [
-                "giacche", "blazer", "maglieria", "felpe&ibridi", 
-                "camicie", "shirty", "pantaloni", "calzini", 
-                "short", "scarpe", "copricapi", "accessori"
-            ]
-            if updates["category"] not in valid_categories:
+            if updates["category"] not in VALID_CATEGORIES:
                 raise HTTPException(
                     status_code=status.HTTP_400_BAD_REQUEST,
-                    detail=f"Categoria non valida. Categorie valide: {', '.join(valid_categories)}"
+                    detail=f"Categoria non valida. Categorie valide: {', '.join(VALID_CATEGORIES)}"
                 )
         
         result = supabase.table("products").update(updates).eq("id", str(product_id)).execute()
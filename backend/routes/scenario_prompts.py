@@ -8,11 +8,13 @@ from uuid import UUID
 from supabase import Client
 from backend.database import get_supabase
 from backend.middleware.auth import get_current_shop_owner
+from backend.services.scenario_cache import load_scenarios, scenario_prompt_cache
+from backend.utils.json_response import FastJSONRoute
 import logging
 
 logger = logging.getLogger(__name__)
 
-router = APIRouter(prefix="/api/scenario-prompts", tags=["scenario-prompts"])
+router = APIRouter(prefix="/api/scenario-prompts", tags=["scenario-prompts"], route_class=FastJSONRoute)
 
 
 class ScenarioPromptCreate(BaseModel):
@@ -42,8 +44,6 @@ async def list_scenario_prompts(
 ):
     """Lista scenario prompts con filtri opzionali"""
     try:
-        query = supabase.table("scenario_prompts").select("*")
-        
         if shop_id:
             # Verifica che il negozio appartenga al negoziante
             shop_result = supabase.table("shops").select("owner_id").eq("id", str(shop_id)).single().execute()
@@ -52,20 +52,24 @@ async def list_scenario_prompts(
                     status_code=status.HTTP_403_FORBIDDEN,
                     detail="Accesso negato a questo negozio"
                 )
-            query = query.eq("shop_id", str(shop_id))
+            shop_ids = [str(shop_id)]
         else:
             # Se non specificato shop_id, mostra solo scenari dei negozi del negoziante
             shops_result = supabase.table("shops").select("id").eq("owner_id", current_user["id"]).execute()
-            shop_ids = [shop["id"] for shop in shops_result.data]
-            if shop_ids:
-                query = query.in_("shop_id", [str(sid) for sid in shop_ids])
-            else:
+            shop_ids = [str(shop["id"]) for shop in shops_result.data]
+            if not shop_ids:
                 return {"scenarios": [], "count": 0}
         
-        result = query.execute()
+        # Sempre dal database (una sola query): con più worker la cache di questo
+        # processo potrebbe non vedere le scritture fatte dagli altri
+        rows = load_scenarios(supabase, shop_ids)
+        scenarios_by_shop = {}
+        for row in rows:
+            scenarios_by_shop.setdefault(str(row["shop_id"]), []).append(row)
+        scenarios = [scenario for sid in shop_ids for scenario in scenarios_by_shop.get(sid, [])]
         return {
-            "scenarios": result.data,
-            "count": len(result.data)
+            "scenarios": scenarios,
+            "count": len(scenarios)
         }
     except HTTPException:
         raise
@@ -154,6 +158,8 @@ async def create_scenario_prompt(
                 detail="Errore durante la creazione dello scenario prompt"
             )
         
+        scenario_prompt_cache.store(result.data[0])
+        
         return {
             "message": "Scenario prompt creato con successo",
             "scenario": result.data[0]
@@ -208,6 +214,8 @@ async def update_scenario_prompt(
                 detail="Scenario prompt non trovato"
             )
         
+        scenario_prompt_cache.store(result.data[0])
+        
         return {
             "message": "Scenario prompt aggiornato con successo",
             "scenario": result.data[0]
@@ -246,6 +254,7 @@ async def delete_scenario_prompt(
             )
         
         result = supabase.table("scenario_prompts").delete().eq("id", str(scenario_id)).execute()
+        scenario_prompt_cache.remove(existing_result.data[0]["shop_id"], scenario_id)
         
         return {
             "message": "Scenario prompt eliminato con successo",
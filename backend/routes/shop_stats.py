@@ -7,11 +7,12 @@ from typing import Optional, List, Dict
 from uuid import UUID
 from backend.database import get_supabase
 from backend.middleware.auth import get_current_shop_owner
+from backend.utils.json_response import FastJSONRoute
 import logging
 from datetime import datetime, timedelta
 
 logger = logging.getLogger(__name__)
-router = APIRouter(prefix="/api/shop-stats", tags=["statistiche"])
+router = APIRouter(prefix="/api/shop-stats", tags=["statistiche"], route_class=FastJSONRoute)
 
 
 class ShopStatsResponse(BaseModel):
@@ -8,11 +8,12 @@ from uuid import UUID
 from supabase import Client
 from backend.database import get_supabase
 from backend.middleware.auth import get_current_user
+from backend.utils.json_response import FastJSONRoute
 import logging
 
 logger = logging.getLogger(__name__)
 
-router = APIRouter(prefix="/api/shops", tags=["negozi"])
+router = APIRouter(prefix="/api/shops", tags=["negozi"], route_class=FastJSONRoute)
 
 
 class ShopCreate(BaseModel):
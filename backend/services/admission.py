@@ -0,0 +1,141 @@
+"""
+Controllo di ammissione per la generazione immagini AI
+
+Ogni richiesta di generazione consuma unità da tre token bucket: uno per
+utente, uno per negozio e uno globale. Il costo è pesato sul lavoro richiesto
+al modello: immagini in input (foto cliente + prodotti) per numero di scenari
+da generare. Se anche un solo bucket non ha unità sufficienti la richiesta è
+rifiutata senza consumare nulla, indicando dopo quanti secondi riprovare.
+
+I bucket sono in memoria e per processo: con N worker il limite effettivo
+globale è N volte quello configurato.
+"""
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+from backend.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Attesa indicata quando un bucket non si ricarica (*_PER_MINUTE = 0): un valore
+# finito, così Retry-After resta un intero valido
+MAX_WAIT_SECONDS = 3600.0
+
+
+class AdmissionDenied(Exception):
+    """Richiesta rifiutata: limite di generazione superato"""
+
+    def __init__(self, scope: str, retry_after: float):
+        self.scope = scope  # 'user', 'shop' o 'global'
+        self.retry_after = retry_after
+        super().__init__(f"Limite generazione superato ({scope}), riprova tra {retry_after:.1f}s")
+
+    @property
+    def retry_after_seconds(self) -> int:
+        """Secondi interi per l'header Retry-After (almeno 1)"""
+        return max(1, math.ceil(self.retry_after))
+
+
+class TokenBucket:
+    """Token bucket: capacità massima (burst) e ricarica continua in unità al secondo"""
+
+    __slots__ = ("capacity", "rate", "tokens", "updated_at")
+
+    def __init__(self, capacity: float, rate: float, now: float):
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = capacity
+        self.updated_at = now
+
+    def refill(self, now: float) -> None:
+        elapsed = now - self.updated_at
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+            self.updated_at = now
+
+    def wait_time(self, cost: float) -> float:
+        """Secondi da attendere prima di poter consumare cost (0 se subito)"""
+        # Una richiesta più grande della capacità attende il bucket pieno
+        cost = min(cost, self.capacity)
+        if self.tokens >= cost:
+            return 0.0
+        if self.rate <= 0:
+            return MAX_WAIT_SECONDS
+        return min((cost - self.tokens) / self.rate, MAX_WAIT_SECONDS)
+
+    def consume(self, cost: float) -> None:
+        self.tokens -= min(cost, self.capacity)
+
+
+def generation_cost(input_images: int, generations: int = 1) -> int:
+    """Costo di una richiesta: immagini in input per numero di immagini da generare"""
+    return max(1, input_images) * max(1, generations)
+
+
+class AdmissionController:
+    """Token bucket per utente, per negozio e globale"""
+
+    def __init__(self, max_keys: int = 10000):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[Tuple[str, str], TokenBucket]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _limits(scope: str) -> Tuple[float, float]:
+        """(capacità, ricarica al secondo) configurate per lo scope"""
+        if scope == "user":
+            return settings.RATE_LIMIT_USER_BURST, settings.RATE_LIMIT_USER_PER_MINUTE / 60
+        if scope == "shop":
+            return settings.RATE_LIMIT_SHOP_BURST, settings.RATE_LIMIT_SHOP_PER_MINUTE / 60
+        return settings.RATE_LIMIT_GLOBAL_BURST, settings.RATE_LIMIT_GLOBAL_PER_MINUTE / 60
+
+    def _bucket(self, scope: str, key: str, now: float) -> TokenBucket:
+        bucket = self._buckets.get((scope, key))
+        if bucket is None:
+            capacity, rate = self._limits(scope)
+            bucket = TokenBucket(capacity, rate, now)
+            self._buckets[(scope, key)] = bucket
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end((scope, key))
+        bucket.refill(now)
+        return bucket
+
+    def admit(self, user_id: Optional[str], shop_id: Optional[str], cost: int) -> None:
+        """
+        Consuma cost unità da tutti i bucket coinvolti
+
+        Raises:
+            AdmissionDenied: se un bucket non ha unità sufficienti (nessun bucket viene toccato)
+        """
+        if not settings.RATE_LIMIT_ENABLED:
+            return
+
+        keys: List[Tuple[str, str]] = [("global", "*")]
+        if shop_id:
+            keys.append(("shop", str(shop_id)))
+        if user_id:
+            keys.append(("user", str(user_id)))
+
+        now = time.monotonic()
+        with self._lock:
+            buckets = [(scope, self._bucket(scope, key, now)) for scope, key in keys]
+            waits = [(bucket.wait_time(cost), scope) for scope, bucket in buckets]
+            retry_after, scope = max(waits)
+            if retry_after > 0:
+                logger.warning(f"⛔ Generazione rifiutata: limite {scope} superato (costo {cost}, riprova tra {retry_after:.1f}s)")
+                raise AdmissionDenied(scope, retry_after)
+            for _, bucket in buckets:
+                bucket.consume(cost)
+
+    def reset(self) -> None:
+        """Svuota tutti i bucket (tornano pieni al prossimo uso)"""
+        with self._lock:
+            self._buckets.clear()
+
+
+admission_controller = AdmissionController()
@@ -1,10 +1,23 @@
 """
 Servizio principale per l'integrazione con AI generativa (Banana Pro, Google Gemini)
+
+I backend di generazione sono plugin registrati in generation_backends
+(banana_pro, gemini, local): il servizio sceglie il backend richiesto o quello
+configurato in AI_BACKEND e ripiega sulla catena AI_BACKEND_FALLBACKS, anche
+quando la chiamata al backend scelto fallisce per un problema del backend.
 """
 import logging
+import traceback
 from typing import Optional, Dict, Any, List
+from backend.config import settings
 from backend.services.banana_pro import banana_pro_service
+from backend.services.circuit_breaker import CircuitOpenError, describe_error, is_backend_failure
 from backend.services.gemini import gemini_service
+from backend.services.generation_backends import get_backend, registered_backends
+from backend.services.prompt_templates import build_scene_prompt
+from backend.utils.ai_logging import lazy
+from backend.utils.timing import set_stage_backend
+from backend.services import local_engine  # noqa: F401 - registra il motore locale
 
 logger = logging.getLogger(__name__)
 
@@ -17,6 +30,13 @@ class AIService:
         self.banana_pro = banana_pro_service
         self.gemini = gemini_service
 
+    @staticmethod
+    def backend_chain(ai_model: Optional[str] = None) -> List[str]:
+        """Backend da provare in ordine: quello richiesto, poi la catena di fallback"""
+        chain = [ai_model or settings.AI_BACKEND]
+        chain += [b.strip() for b in settings.AI_BACKEND_FALLBACKS.split(",") if b.strip()]
+        return list(dict.fromkeys(chain))
+
     async def generate_image_with_product(
         self,
         customer_photo_urls: list[str],  # Lista di URL foto cliente (fino a 3)
@@ -24,7 +44,7 @@ class AIService:
         prompt: Optional[str] = None,
         scenario: Optional[str] = None,
         product_names: Optional[list[str]] = None,  # Nomi dei prodotti per prompt più specifico
-        ai_model: Optional[str] = "banana_pro"  # Default: Banana Pro (Gemini non può generare immagini)
+        ai_model: Optional[str] = None  # Default: settings.AI_BACKEND (banana_pro)
     ) -> Dict[str, Any]:
         """
         Genera un'immagine di un cliente che indossa prodotti usando l'AI.
@@ -35,73 +55,112 @@ class AIService:
             prompt: Prompt personalizzato (opzionale)
             scenario: Scenario/contesto (montagna, spiaggia, etc.)
             product_names: Lista di nomi dei prodotti (opzionale, usato per prompt più specifico)
-            ai_model: Modello AI da usare ('banana_pro' o 'gemini')
+            ai_model: Backend da usare ('banana_pro', 'gemini', 'local'); se non configurato,
+                con circuito aperto o se la chiamata fallisce (timeout, 429, 5xx) si passa
+                al successivo della catena di fallback
         
         Returns:
-            Dict con 'image_url', 'status', 'ai_service'
+            Dict con 'image_url', 'status', 'ai_service'; con status 'error' anche 'error'
+            e, se tutti i circuiti sono aperti, 'retry_after' (secondi)
         """
-        logger.info(f"Generazione immagine AI richiesta con modello: {ai_model}")
-        logger.info(f"Foto cliente: {len(customer_photo_urls)} immagini")
-        logger.info(f"Immagini prodotto: {len(product_image_urls)} immagini")
-        logger.info(f"Prompt: {prompt}, Scenario: {scenario}")
+        chain = self.backend_chain(ai_model)
+        logger.info(
+            "Generazione immagine AI richiesta con backend: %s (%d foto cliente, %d prodotti, scenario: %s)",
+            lazy(lambda: " -> ".join(chain)), len(customer_photo_urls), len(product_image_urls), scenario,
+            extra={"backend_chain": chain, "customer_photos": len(customer_photo_urls), "products": len(product_image_urls)},
+        )
+        # Il prompt può essere lungo: solo a DEBUG
+        logger.debug("Prompt: %s", prompt)
 
-        try:
-            # Seleziona il servizio AI
-            if ai_model == "banana_pro":
-                if not self.banana_pro.api_key:
-                    logger.warning("Banana Pro API key non configurata, uso Gemini")
-                    ai_model = "gemini"
-                else:
-                    result = await self.banana_pro.generate_image(
-                        customer_photo_urls=customer_photo_urls,
-                        product_image_urls=product_image_urls,
-                        prompt=prompt,
-                        scenario=scenario,
-                        product_names=product_names
-                    )
-                    return result
+        unavailable = []  # Retry-After dei backend con circuito aperto
+        last_error = None
+        last_trace = None
+        failed_backend = chain[0]
+        # Prova i backend in ordine: si passa al successivo se non configurato,
+        # con circuito aperto o se la chiamata fallisce per un problema del backend
+        for backend_name in chain:
+            backend = get_backend(backend_name)
+            if backend is None:
+                logger.warning(f"Backend AI '{backend_name}' non registrato, provo il successivo")
+                continue
+            if not backend.is_configured():
+                logger.warning(f"Backend AI '{backend_name}' non configurato, provo il successivo")
+                continue
+            if not backend.breaker.is_available():
+                # Circuito aperto: non attendere il timeout, prova subito il successivo
+                logger.warning(f"Backend AI '{backend_name}' non disponibile (circuito aperto), provo il successivo")
+                unavailable.append(backend.breaker.retry_after())
+                continue
             
-            if ai_model == "gemini":
-                if not self.gemini.api_key:
-                    logger.warning("Gemini API key non configurata, uso placeholder")
-                    return {
-                        "image_url": "https://via.placeholder.com/1024x1024?text=AI+Generated+Image+Placeholder",
-                        "status": "placeholder",
-                        "ai_service": "none",
-                        "error": "Gemini API key non configurata"
-                    }
-                
-                # Gemini non supporta generazione immagini, usa solo la prima foto e prodotto
-                result = await self.gemini.generate_image(
-                    customer_photo_url=customer_photo_urls[0] if customer_photo_urls else "",
-                    product_image_url=product_image_urls[0] if product_image_urls else "",
+            set_stage_backend(backend_name)
+            try:
+                return await backend.generate(
+                    customer_photo_urls=customer_photo_urls,
+                    product_image_urls=product_image_urls,
                     prompt=prompt,
-                    scenario=scenario
+                    scenario=scenario,
+                    product_names=product_names
                 )
-                return result
-            
-            # Fallback a placeholder se modello non riconosciuto
-            logger.warning(f"Modello AI '{ai_model}' non riconosciuto, uso placeholder")
-            return {
-                "image_url": "https://via.placeholder.com/1024x1024?text=AI+Generated+Image+Placeholder",
-                "status": "placeholder",
-                "ai_service": "none",
-                "error": f"Modello '{ai_model}' non supportato"
-            }
-            
-        except Exception as e:
-            import traceback
-            error_trace = traceback.format_exc()
-            logger.error(f"❌ Errore generazione immagine AI: {e}")
-            logger.error(f"   Traceback completo:\n{error_trace}")
+            except CircuitOpenError as e:
+                # Slot di prova occupati tra is_available e la chiamata
+                logger.warning("Backend AI '%s' non disponibile (%s), provo il successivo", backend_name, e)
+                unavailable.append(e.retry_after)
+            except Exception as e:
+                last_error, last_trace, failed_backend = e, traceback.format_exc(), backend_name
+                if not is_backend_failure(e):
+                    # Errore di input: gli altri backend fallirebbero allo stesso modo
+                    break
+                logger.warning("Backend AI '%s' fallito (%s), provo il successivo", backend_name, describe_error(e))
+        
+        # Secondi prima che almeno un backend con circuito aperto torni disponibile
+        retry_after = max(1, round(min(unavailable))) if unavailable else None
+        
+        if last_error is not None:
+            logger.error("❌ Errore generazione immagine AI: %s", last_error)
+            logger.error("   Traceback completo:\n%s", last_trace)
             # Restituisci placeholder in caso di errore, ma includi dettagli dell'errore
-            return {
+            result = {
                 "image_url": "https://via.placeholder.com/1024x1024?text=Error+Generating+Image",
                 "status": "error",
-                "ai_service": ai_model,
-                "error": str(e),
-                "error_details": error_trace  # Includi traceback per debug
+                "ai_service": failed_backend,
+                # Messaggio senza dettagli (URL con API key): il traceback resta nei log del server
+                "error": f"Generazione fallita con {failed_backend}: {describe_error(last_error)}",
+                "error_details": last_trace  # Solo per i log, non restituito al client
             }
+            if retry_after is not None:
+                result["retry_after"] = retry_after
+            return result
+        
+        if unavailable:
+            logger.error("❌ Nessun backend AI disponibile (circuiti aperti), riprova tra %ds", retry_after)
+            return {
+                "image_url": "https://via.placeholder.com/1024x1024?text=AI+Service+Unavailable",
+                "status": "error",
+                "ai_service": "none",
+                "error": "Servizi AI temporaneamente non disponibili, riprova tra qualche secondo",
+                "retry_after": retry_after
+            }
+        
+        # Nessun backend configurato: placeholder
+        logger.warning(f"Nessun backend AI configurato tra {', '.join(chain)}, uso placeholder")
+        return {
+            "image_url": "https://via.placeholder.com/1024x1024?text=AI+Generated+Image+Placeholder",
+            "status": "placeholder",
+            "ai_service": "none",
+            "error": f"Nessun backend AI configurato ({', '.join(chain)})"
+        }
+
+    def backends_status(self) -> Dict[str, Dict[str, Any]]:
+        """Backend registrati: configurazione, capacità e stato del circuit breaker"""
+        return {
+            name: {
+                "configured": backend.is_configured(),
+                "max_customer_photos": backend.capabilities.max_customer_photos,
+                "max_product_images": backend.capabilities.max_product_images,
+                **backend.breaker.snapshot()
+            }
+            for name, backend in registered_backends().items()
+        }
 
     def build_prompt(
         self,
@@ -122,62 +181,13 @@ class AIService:
         Returns:
             Prompt formattato
         """
-        # Prompt base che enfatizza l'uso delle foto del cliente
-        # IMPORTANTE: Le foto cliente vengono passate come {image1}, {image2}, {image3}
-        # e devono essere utilizzate per mantenere il volto e la forma fisica della persona
-        base_prompt = "Immagine professionale che ritrae fedelmente la persona dalle foto cliente fornite, mantenendo esattamente lo stesso volto, la stessa forma fisica e le stesse caratteristiche fisiche della persona nelle foto"
-        
-        if product_category:
-            base_prompt += f" con indossato {product_category}"
-        if product_style:
-            base_prompt += f" in stile {product_style}"
-        
-        # Se ci sono scenari dettagliati, costruisci il prompt con i dettagli
-        if scenario_details and len(scenario_details) > 0:
-            scenario_parts = []
-            for scenario_detail in scenario_details:
-                parts = []
-                
-                if scenario_detail.get("description"):
-                    parts.append(scenario_detail["description"])
-                
-                if scenario_detail.get("position"):
-                    parts.append(f"posizione: {scenario_detail['position']}")
-                
-                if scenario_detail.get("environment"):
-                    parts.append(f"ambiente: {scenario_detail['environment']}")
-                
-                if scenario_detail.get("lighting"):
-                    parts.append(f"illuminazione: {scenario_detail['lighting']}")
-                
-                if scenario_detail.get("background"):
-                    parts.append(f"sfondo: {scenario_detail['background']}")
-                
-                if scenario_detail.get("custom_text"):
-                    parts.append(scenario_detail["custom_text"])
-                
-                if parts:
-                    scenario_parts.append(", ".join(parts))
-            
-            if scenario_parts:
-                base_prompt += ". " + ". ".join(scenario_parts)
-        elif scenario:
-            # Fallback per scenario semplice (retrocompatibilità)
-            scenario_prompts = {
-                "montagna": "in un ambiente montano con neve e alberi, atmosfera invernale",
-                "spiaggia": "su una bellissima spiaggia con sabbia e oceano, atmosfera estiva",
-                "città": "in un ambiente urbano cittadino, architettura moderna",
-                "festa": "a una festa o celebrazione, atmosfera festosa",
-                "lavoro": "in un ambiente professionale d'ufficio",
-                "casual": "in un ambiente casual quotidiano"
-            }
-            
-            if scenario.lower() in scenario_prompts:
-                base_prompt += f". {scenario_prompts[scenario.lower()]}"
-        
-        base_prompt += ". IMPORTANTE: Il volto della persona deve essere identico a quello nelle foto cliente fornite. La forma fisica, l'altezza, la corporatura e tutte le caratteristiche fisiche devono corrispondere esattamente alle foto cliente. Gli articoli di abbigliamento devono essere indossati sulla persona reale dalle foto, non su una persona generica. Alta qualità, stile fotografia professionale con illuminazione e composizione appropriate. La persona deve essere chiaramente visibile e gli articoli devono essere ben indossati."
-        
-        return base_prompt
+        # Template precompilati e memoizzati (vedi prompt_templates)
+        return build_scene_prompt(
+            product_category=product_category,
+            product_style=product_style,
+            scenario=scenario,
+            scenario_details=scenario_details
+        )
 
 
 ai_service = AIService()
@@ -5,6 +5,13 @@ Usa la libreria google.generativeai per generare immagini con Gemini 3 Pro Image
 import logging
 from typing import Optional, Dict, Any
 from backend.config import settings
+from backend.services.image_processing import transcode_image
+from backend.services.prompt_templates import build_full_prompt, PROMPT_TEMPLATE_VERSION
+from backend.services.circuit_breaker import get_circuit_breaker
+from backend.utils.ai_logging import GenerationLog, lazy
+from backend.utils.instrumentation import instrumented_async_client
+from backend.utils.retry import model_retry_policy, storage_retry_policy
+from backend.utils.timing import begin_stage, current_timer, end_stage, stage
 import base64
 import asyncio
 import httpx
@@ -40,6 +47,7 @@ class BananaProService:
         self.model = None
         self.model_name = None
         self.use_new_api = False
+        self.breaker = get_circuit_breaker("banana_pro")
         
         if not GENAI_AVAILABLE:
             raise ImportError("google.genai non disponibile. Installa con: pip install google-generativeai")
@@ -112,6 +120,9 @@ class BananaProService:
         if len(product_image_urls) > 10:
             raise ValueError("Massimo 10 prodotti consentiti")
         
+        # Log della generazione: dettaglio a DEBUG (o campionato, vedi ai_logging)
+        log = GenerationLog(logger, "banana_pro")
+        
         try:
             # Pulisci URL rimuovendo parametri di query e valida
             def clean_url(url: str) -> str:
@@ -122,10 +133,11 @@ class BananaProService:
                     return None
                 # Verifica che sia un URL valido
                 if not (url.startswith("http://") or url.startswith("https://")):
-                    logger.warning(f"⚠️  URL non valido (non inizia con http/https): {url[:50]}...")
+                    log.warning("⚠️  URL non valido (non inizia con http/https): %.50s...", url)
                     return None
-                # Rimuovi parametri di query
-                url = url.split('?')[0]
+                # Rimuovi parametri di query (tranne per URL firmati: il token è nella query)
+                if "/object/sign/" not in url:
+                    url = url.split('?')[0]
                 return url.strip()
             
             # Pulisci e valida tutti gli URL
@@ -141,75 +153,71 @@ class BananaProService:
             if not product_image_urls_clean:
                 raise ValueError("Nessuna immagine prodotto valida dopo la pulizia degli URL")
             
-            logger.info(f"📥 Download immagini per Banana Pro:")
-            logger.info(f"   Foto cliente: {len(customer_photo_urls_clean)} immagini")
-            logger.info(f"   Prodotti: {len(product_image_urls_clean)} immagini")
+            log.info(
+                "📥 Download immagini per Banana Pro: %d foto cliente, %d prodotti",
+                len(customer_photo_urls_clean), len(product_image_urls_clean),
+                customer_photos=len(customer_photo_urls_clean), products=len(product_image_urls_clean),
+            )
             
             # Scarica tutte le immagini
-            import httpx
             customer_images_bytes = []
             product_images_bytes = []
             
-            async with httpx.AsyncClient(timeout=30.0) as client:
+            async with instrumented_async_client("image_download", timeout=30.0) as client:
                 # Scarica tutte le foto cliente
-                logger.info(f"📥 Download {len(customer_photo_urls_clean)} foto cliente...")
                 for i, url in enumerate(customer_photo_urls_clean, 1):
                     try:
                         if not url or not isinstance(url, str) or len(url.strip()) == 0:
-                            logger.error(f"❌ URL foto cliente {i} non valido: {url}")
+                            log.error("❌ URL foto cliente %d non valido: %s", i, url)
                             raise Exception(f"URL foto cliente {i} non valido o vuoto")
                         
-                        logger.info(f"📥 Download foto cliente {i}/{len(customer_photo_urls_clean)}: {url[:100]}...")
-                        response = await client.get(url, follow_redirects=True)
-                        response.raise_for_status()
+                        log.detail("📥 Download foto cliente %d/%d: %.100s", i, len(customer_photo_urls_clean), url)
+                        with stage("download", f"foto cliente {i}"):
+                            response = await client.get(url, follow_redirects=True)
+                            response.raise_for_status()
                         
                         if not response.content or len(response.content) == 0:
-                            logger.error(f"❌ Foto cliente {i} scaricata ma vuota")
+                            log.error("❌ Foto cliente %d scaricata ma vuota", i)
                             raise Exception(f"Foto cliente {i} scaricata ma vuota")
                         
                         customer_images_bytes.append(response.content)
-                        logger.info(f"✅ Foto cliente {i}/{len(customer_photo_urls_clean)} scaricata con successo: {len(response.content)} bytes")
+                        log.detail("✅ Foto cliente %d/%d scaricata: %d bytes", i, len(customer_photo_urls_clean), len(response.content))
                     except httpx.HTTPError as e:
-                        logger.error(f"❌ Errore HTTP download foto cliente {i} ({url[:50]}...): {e}")
+                        log.error("❌ Errore HTTP download foto cliente %d (%.50s...): %s", i, url, e)
                         if hasattr(e, 'response') and e.response is not None:
-                            logger.error(f"   Status code: {e.response.status_code}")
-                            logger.error(f"   Response: {e.response.text[:200]}")
+                            log.error("   Status code: %s, response: %.200s", e.response.status_code, e.response.text)
                         raise Exception(f"Impossibile scaricare foto cliente {i} da {url[:50]}...: {str(e)}")
                     except Exception as e:
-                        logger.error(f"❌ Errore download foto cliente {i} ({url[:50] if url else 'URL None'}...): {e}")
-                        import traceback
-                        logger.error(f"   Traceback: {traceback.format_exc()}")
+                        log.error("❌ Errore download foto cliente %d (%.50s...): %s", i, url, e, exc_info=True)
                         raise Exception(f"Impossibile scaricare foto cliente {i}: {str(e)}")
                 
-                logger.info(f"✅ Tutte le {len(customer_images_bytes)} foto cliente scaricate con successo")
+                log.detail("✅ Tutte le %d foto cliente scaricate", len(customer_images_bytes))
                 
                 # Scarica tutte le immagini prodotto
                 for i, url in enumerate(product_image_urls_clean, 1):
                     try:
                         if not url or not isinstance(url, str) or len(url.strip()) == 0:
-                            logger.error(f"❌ URL immagine prodotto {i} non valido: {url}")
+                            log.error("❌ URL immagine prodotto %d non valido: %s", i, url)
                             raise Exception(f"URL immagine prodotto {i} non valido o vuoto")
                         
-                        logger.info(f"📥 Download immagine prodotto {i}/{len(product_image_urls_clean)}: {url[:100]}...")
-                        response = await client.get(url, follow_redirects=True)
-                        response.raise_for_status()
+                        log.detail("📥 Download immagine prodotto %d/%d: %.100s", i, len(product_image_urls_clean), url)
+                        with stage("download", f"prodotto {i}"):
+                            response = await client.get(url, follow_redirects=True)
+                            response.raise_for_status()
                         
                         if not response.content or len(response.content) == 0:
-                            logger.error(f"❌ Immagine prodotto {i} scaricata ma vuota")
+                            log.error("❌ Immagine prodotto %d scaricata ma vuota", i)
                             raise Exception(f"Immagine prodotto {i} scaricata ma vuota")
                         
                         product_images_bytes.append(response.content)
-                        logger.info(f"✅ Immagine prodotto {i}/{len(product_image_urls_clean)} scaricata: {len(response.content)} bytes")
+                        log.detail("✅ Immagine prodotto %d/%d scaricata: %d bytes", i, len(product_image_urls_clean), len(response.content))
                     except httpx.HTTPError as e:
-                        logger.error(f"❌ Errore HTTP download immagine prodotto {i} ({url[:50]}...): {e}")
+                        log.error("❌ Errore HTTP download immagine prodotto %d (%.50s...): %s", i, url, e)
                         if hasattr(e, 'response') and e.response is not None:
-                            logger.error(f"   Status code: {e.response.status_code}")
-                            logger.error(f"   Response: {e.response.text[:200]}")
+                            log.error("   Status code: %s, response: %.200s", e.response.status_code, e.response.text)
                         raise Exception(f"Impossibile scaricare immagine prodotto {i} da {url[:50]}...: {str(e)}")
                     except Exception as e:
-                        logger.error(f"❌ Errore download immagine prodotto {i} ({url[:50] if url else 'URL None'}...): {e}")
-                        import traceback
-                        logger.error(f"   Traceback: {traceback.format_exc()}")
+                        log.error("❌ Errore download immagine prodotto %d (%.50s...): %s", i, url, e, exc_info=True)
                         raise Exception(f"Impossibile scaricare immagine prodotto {i}: {str(e)}")
             
             # Costruisci prompt se non fornito
@@ -221,110 +229,27 @@ class BananaProService:
             # Le immagini vengono passate nell'ordine: prima tutte le foto cliente, poi tutti i prodotti
             # Il modello associa automaticamente le immagini ai placeholder {image1}, {image2}, etc.
             
-            logger.info(f"📝 Prompt ricevuto: {prompt[:200]}...")
-            logger.info(f"📸 Foto cliente da usare: {len(customer_images_bytes)} immagini")
-            logger.info(f"🛍️ Immagini prodotto da usare: {len(product_images_bytes)} immagini")
-            
-            # Costruisci riferimenti alle immagini cliente
-            # IMPORTANTE: Usa singole graffe {image1} non doppie {{image1}}
-            # Le doppie graffe vengono interpretate come testo letterale, non come placeholder
-            customer_refs = []
-            for i in range(len(customer_images_bytes)):
-                # Costruisci "{image1}", "{image2}", etc. senza f-string per evitare escape
-                customer_refs.append("{" + f"image{i+1}" + "}")
-            
-            # Costruisci riferimenti alle immagini prodotto
-            product_refs = []
-            start_idx = len(customer_images_bytes) + 1
-            for i in range(len(product_images_bytes)):
-                product_refs.append("{" + f"image{start_idx + i}" + "}")
-            
-            # Costruisci prompt seguendo il formato del notebook funzionante
-            # Nel notebook: "la persona {image1} con indossati i pantaloni come da immagine {image2}"
-            # Usa concatenazione invece di f-string per preservare le graffe singole
-            if len(customer_images_bytes) == 1:
-                customer_part = "la persona dalla foto " + customer_refs[0] + " (USA QUESTA FOTO COME RIFERIMENTO PRINCIPALE PER IL VOLTO E LA FORMA FISICA)"
-            else:
-                customer_refs_str = ", ".join(customer_refs)
-                customer_part = "la persona dalle foto " + customer_refs_str + " (USA QUESTE FOTO COME RIFERIMENTO PRINCIPALE PER IL VOLTO E LA FORMA FISICA)"
-            
-            # Costruisci riferimenti espliciti a ogni prodotto
-            # IMPORTANTE: Ogni prodotto deve essere menzionato esplicitamente nel prompt
-            # Se abbiamo i nomi dei prodotti, usali per essere più specifici
-            if product_names and len(product_names) == len(product_images_bytes):
-                # Usa i nomi reali dei prodotti per essere più specifici
-                if len(product_images_bytes) == 1:
-                    product_part = f"l'articolo '{product_names[0]}' come da immagine " + product_refs[0] + " (DEVE essere chiaramente visibile e indossato)"
-                else:
-                    # Costruisci una lista esplicita di ogni prodotto con il suo nome
-                    product_refs_list = []
-                    for idx, (ref, name) in enumerate(zip(product_refs, product_names), 1):
-                        product_refs_list.append(f"'{name}' come da immagine {ref}")
-                    product_refs_str = ", ".join(product_refs_list)
-                    product_part = f"TUTTI gli articoli di abbigliamento: {product_refs_str} (OGNI prodotto DEVE essere chiaramente visibile e indossato, nessun prodotto può essere omesso o nascosto)"
-            else:
-                # Fallback senza nomi prodotti
-                if len(product_images_bytes) == 1:
-                    product_part = "TUTTI gli articoli di abbigliamento come da immagine " + product_refs[0] + " (DEVE essere chiaramente visibile e indossato)"
-                else:
-                    # Costruisci una lista esplicita di ogni prodotto
-                    product_refs_list = []
-                    for idx, ref in enumerate(product_refs, 1):
-                        product_refs_list.append(f"prodotto {idx} come da immagine {ref}")
-                    product_refs_str = ", ".join(product_refs_list)
-                    product_part = f"TUTTI gli articoli di abbigliamento: {product_refs_str} (OGNI prodotto DEVE essere chiaramente visibile e indossato, nessun prodotto può essere omesso)"
-            
-            # Costruisci prompt completo usando concatenazione per preservare {image1}, {image2}, etc.
-            # Segue il formato del notebook funzionante che è più specifico e descrittivo
-            # Nel notebook: "Immagine professionale che ritrae la persona {image1} con indossati i pantaloni come da immagine {image2}"
-            # IMPORTANTE: Enfatizza che le foto cliente devono essere utilizzate per mantenere volto e forma fisica
-            # Il prompt deve essere molto esplicito: PRIMA le foto cliente, POI il resto
-            # IMPORTANTE: Ogni prodotto deve essere esplicitamente menzionato e deve essere visibile
-            
-            # Costruisci lista esplicita dei prodotti se disponibili
-            products_list_text = ""
-            if product_names and len(product_names) > 0:
-                products_list_text = f" I prodotti che DEBBONO essere presenti e completamente visibili sono: {', '.join(product_names)}. "
-                # Aggiungi enfasi per prodotti specifici
-                if any("scarpe" in name.lower() or "shoe" in name.lower() for name in product_names):
-                    products_list_text += " Le scarpe DEBBONO essere chiaramente visibili ai piedi della persona. "
-                if any("giacca" in name.lower() or "jacket" in name.lower() or "blazer" in name.lower() for name in product_names):
-                    products_list_text += " La giacca/blazer DEVE essere chiaramente visibile sul busto della persona. "
-                if any("pantaloni" in name.lower() or "pants" in name.lower() or "trousers" in name.lower() for name in product_names):
-                    products_list_text += " I pantaloni DEBBONO essere chiaramente visibili sulle gambe della persona. "
-            
-            full_prompt = (
-                "CRITICO: L'immagine generata DEVE mostrare la STESSA PERSONA delle foto cliente fornite. "
-                + "Immagine professionale che ritrae " + customer_part + " con indossato " + product_part + ". "
-                + products_list_text
-                + "REQUISITI OBBLIGATORI PER IL VOLTO E LA FORMA FISICA: "
-                + "1. Il volto della persona nell'immagine generata DEVE essere IDENTICO al volto nelle foto cliente fornite. "
-                + "2. La forma fisica, l'altezza, la corporatura e tutte le caratteristiche fisiche DEBBONO corrispondere esattamente alle foto cliente. "
-                + "3. La persona nell'immagine generata DEVE essere la STESSA persona delle foto cliente, NON una persona generica o diversa. "
-                + "REQUISITI OBBLIGATORI PER I PRODOTTI: "
-                + "4. TUTTI gli articoli di abbigliamento dalle immagini prodotto fornite DEBBONO essere chiaramente visibili e indossati nella persona. "
-                + "5. NESSUN prodotto può essere omesso, nascosto o parzialmente visibile. Ogni prodotto deve essere completamente visibile e riconoscibile. "
-                + "6. Se ci sono più prodotti (es: giacca, pantaloni, scarpe), TUTTI devono essere presenti e completamente visibili nell'immagine generata. "
-                + "7. Gli articoli di abbigliamento devono essere indossati sulla persona reale dalle foto cliente, non su una persona diversa. "
-                + "8. Le scarpe devono essere chiaramente visibili ai piedi della persona. "
-                + "9. Le giacche o capi superiori devono essere chiaramente visibili sul busto della persona. "
-                + "10. I pantaloni devono essere chiaramente visibili sulle gambe della persona. "
-                + prompt + " "
-                + "Il volto deve essere fedele alla foto così come la forma fisica. "
-                + "TUTTI i prodotti devono essere chiaramente visibili e ben indossati. "
-                + "L'immagine deve essere di alta qualità, stile fotografia professionale con illuminazione e composizione appropriate. "
-                + "La persona deve essere chiaramente visibile e TUTTI gli articoli devono essere ben indossati sulla persona reale dalle foto cliente."
+            log.detail("📝 Prompt ricevuto: %.200s...", prompt)
+            
+            # Template precompilati e memoizzati (vedi prompt_templates)
+            with stage("prompt_build", "prompt completo"):
+                full_prompt = build_full_prompt(
+                    customer_count=len(customer_images_bytes),
+                    product_count=len(product_images_bytes),
+                    product_names=product_names,
+                    prompt=prompt
+                )
+            
+            # Prompt completo (diversi KB) solo nel dettaglio, una volta
+            log.detail("📝 Prompt completo (template v%s): %s", PROMPT_TEMPLATE_VERSION, full_prompt)
+            log.info(
+                "🚀 Generazione immagine con %s: %d foto cliente, %d prodotti, prompt di %d caratteri",
+                self.model_name, len(customer_images_bytes), len(product_images_bytes), len(full_prompt),
+                model=self.model_name, prompt_chars=len(full_prompt),
             )
             
-            logger.info(f"📝 Prompt completo costruito: {full_prompt[:300]}...")
-            
-            # Log del prompt completo per debug
-            logger.info(f"   📝 Prompt completo: {full_prompt}")
-            
-            logger.info(f"🚀 Generazione immagine con {self.model_name}")
-            logger.info(f"   Foto cliente: {len(customer_images_bytes)} immagini")
-            logger.info(f"   Prodotti: {len(product_images_bytes)} immagini")
-            logger.info(f"   Prompt: {full_prompt[:200]}...")
+            # Il thread dell'executor non vede il contextvar: timer passato esplicitamente
+            timer = current_timer()
             
             # Usa il formato corretto come nel notebook funzionante
             def generate_image_sync():
@@ -332,9 +257,12 @@ class BananaProService:
                 from PIL import Image
                 import io
                 
-                # Converti tutte le immagini bytes in PIL Images
-                customer_images = [Image.open(io.BytesIO(img_bytes)) for img_bytes in customer_images_bytes]
-                product_images = [Image.open(io.BytesIO(img_bytes)) for img_bytes in product_images_bytes]
+                # Converti tutte le immagini bytes in PIL Images (decodificate qui per misurarne il costo)
+                with stage("decode", timer=timer):
+                    customer_images = [Image.open(io.BytesIO(img_bytes)) for img_bytes in customer_images_bytes]
+                    product_images = [Image.open(io.BytesIO(img_bytes)) for img_bytes in product_images_bytes]
+                    for img in customer_images + product_images:
+                        img.load()
                 
                 # IMPORTANTE: L'ordine delle immagini deve corrispondere ai riferimenti nel prompt
                 # Nel notebook: [prompt, image, image2, image3] dove:
@@ -344,10 +272,11 @@ class BananaProService:
                 # Quindi: prima tutte le foto cliente, poi tutti i prodotti
                 all_images = customer_images + product_images
                 
-                logger.info(f"   📸 Immagini preparate per il modello AI:")
-                logger.info(f"      - Foto cliente: {len(customer_images)} immagini (riferimenti: {', '.join([f'{{image{i+1}}}' for i in range(len(customer_images))])})")
-                logger.info(f"      - Prodotti: {len(product_images)} immagini (riferimenti: {', '.join([f'{{image{len(customer_images)+i+1}}}' for i in range(len(product_images))])})")
-                logger.info(f"      - Totale: {len(all_images)} immagini")
+                log.detail(
+                    "   📸 Immagini per il modello AI: %d foto cliente ({image1}-{image%d}), %d prodotti ({image%d}-{image%d})",
+                    len(customer_images), len(customer_images),
+                    len(product_images), len(customer_images) + 1, len(all_images),
+                )
                 
                 # Verifica che ci siano foto cliente
                 if len(customer_images) == 0:
@@ -357,11 +286,12 @@ class BananaProService:
                 if len(product_images) == 0:
                     raise ValueError("Nessuna immagine prodotto disponibile per la generazione!")
                 
-                # Log dimensioni immagini per debug
-                for idx, img in enumerate(customer_images, 1):
-                    logger.info(f"      Foto cliente {idx}: {img.size if hasattr(img, 'size') else 'N/A'}")
-                for idx, img in enumerate(product_images, 1):
-                    logger.info(f"      Prodotto {idx}: {img.size if hasattr(img, 'size') else 'N/A'}")
+                # Dimensioni immagini: calcolate solo se il dettaglio viene emesso
+                log.detail(
+                    "      Dimensioni: foto cliente %s, prodotti %s",
+                    lazy(lambda: [img.size for img in customer_images]),
+                    lazy(lambda: [img.size for img in product_images]),
+                )
                 
                 # Genera immagine usando il formato corretto in base all'API disponibile
                 if self.use_new_api:
@@ -369,94 +299,69 @@ class BananaProService:
                     # Passa prompt con riferimenti espliciti + tutte le immagini nell'ordine corretto
                     # Formato: [prompt, image1, image2, ...] dove image1, image2 corrispondono a {image1}, {image2} nel prompt
                     contents = [full_prompt] + all_images
-                    logger.info(f"   🔄 Chiamata API con {len(contents)} elementi (1 prompt + {len(all_images)} immagini)")
-                    logger.info(f"   📋 Contenuto: prompt ({len(full_prompt)} caratteri) + {len(all_images)} immagini PIL")
+                    log.detail("   🔄 Chiamata API con %d elementi (1 prompt + %d immagini)", len(contents), len(all_images))
                     
                     try:
-                        response = self.client.models.generate_content(
-                            model=self.model_name,
-                            contents=contents,
-                        )
-                        logger.info(f"   ✅ Chiamata API completata, tipo risposta: {type(response)}")
+                        with stage("model_call", self.model_name, timer=timer):
+                            response = self.client.models.generate_content(
+                                model=self.model_name,
+                                contents=contents,
+                            )
+                        log.detail("   ✅ Chiamata API completata, tipo risposta: %s", type(response))
                     except Exception as api_error:
-                        logger.error(f"   ❌ Errore nella chiamata API: {api_error}")
-                        import traceback
-                        logger.error(f"   Traceback: {traceback.format_exc()}")
+                        log.error("   ❌ Errore nella chiamata API: %s", api_error, exc_info=True)
                         raise
                 else:
                     # Formato vecchio: google.generativeai.GenerativeModel
                     contents = [full_prompt] + all_images
-                    logger.info(f"   🔄 Chiamata API legacy con {len(contents)} elementi (1 prompt + {len(all_images)} immagini)")
+                    log.detail("   🔄 Chiamata API legacy con %d elementi (1 prompt + %d immagini)", len(contents), len(all_images))
                     
                     try:
-                        response = self.model.generate_content(contents)
-                        logger.info(f"   ✅ Chiamata API completata, tipo risposta: {type(response)}")
+                        with stage("model_call", self.model_name, timer=timer):
+                            response = self.model.generate_content(contents)
+                        log.detail("   ✅ Chiamata API completata, tipo risposta: %s", type(response))
                     except Exception as api_error:
-                        logger.error(f"   ❌ Errore nella chiamata API: {api_error}")
-                        import traceback
-                        logger.error(f"   Traceback: {traceback.format_exc()}")
+                        log.error("   ❌ Errore nella chiamata API: %s", api_error, exc_info=True)
                         raise
                 
                 return response
             
             # Esegui in thread separato per non bloccare l'event loop
+            # Il circuit breaker fallisce subito se il backend è in errore; gli errori
+            # transitori (429/503, timeout) vengono ritentati con backoff
             loop = asyncio.get_event_loop()
-            response = await loop.run_in_executor(None, generate_image_sync)
             
-            logger.info(f"   ✅ Risposta ricevuta da Gemini API")
+            async def call_model():
+                async with self.breaker.guard():
+                    return await loop.run_in_executor(None, generate_image_sync)
             
-            # Log dettagliato della risposta per debug
-            if self.use_new_api:
-                logger.info(f"   📋 Struttura risposta (nuova API):")
-                logger.info(f"      - Tipo risposta: {type(response)}")
-                if hasattr(response, 'parts'):
-                    logger.info(f"      - Numero parts: {len(response.parts)}")
-                    for idx, part in enumerate(response.parts, 1):
-                        logger.info(f"      - Part {idx}: tipo={type(part)}")
-                        if hasattr(part, 'text') and part.text is not None:
-                            logger.info(f"         Contiene testo: {part.text[:300]}...")
-                        if hasattr(part, 'inline_data') and part.inline_data is not None:
-                            logger.info(f"         Contiene inline_data: tipo={type(part.inline_data)}")
-                            if hasattr(part.inline_data, 'data'):
-                                logger.info(f"            Dati: tipo={type(part.inline_data.data)}, lunghezza={len(part.inline_data.data) if isinstance(part.inline_data.data, (str, bytes)) else 'N/A'}")
-                        if hasattr(part, 'mime_type'):
-                            logger.info(f"         MIME type: {part.mime_type}")
-                else:
-                    logger.warning(f"      - Risposta non ha attributo 'parts'")
-                    logger.info(f"      - Attributi disponibili: {dir(response)}")
-            else:
-                logger.info(f"   📋 Struttura risposta (legacy API):")
-                if hasattr(response, 'candidates') and response.candidates:
-                    logger.info(f"      - Numero candidates: {len(response.candidates)}")
-                    candidate = response.candidates[0]
-                    if hasattr(candidate, 'content') and candidate.content:
-                        if hasattr(candidate.content, 'parts'):
-                            logger.info(f"      - Numero parts: {len(candidate.content.parts)}")
-                            for idx, part in enumerate(candidate.content.parts, 1):
-                                logger.info(f"      - Part {idx}: tipo={type(part)}")
-                                if hasattr(part, 'text'):
-                                    logger.info(f"         Contiene testo: {part.text[:300] if part.text else 'None'}...")
-                                if hasattr(part, 'inline_data') and part.inline_data:
-                                    logger.info(f"         Contiene inline_data")
+            response = await model_retry_policy.run(call_model)
+            
+            # Fino alla decodifica dell'immagine in _save_to_supabase_storage
+            begin_stage("response_parse")
+            log.detail("   ✅ Risposta ricevuta da Gemini API")
+            
+            # Struttura della risposta: percorsa solo se il dettaglio viene emesso
+            if log.detail_enabled:
+                self._log_response_structure(log, response)
             
             # Estrai immagine dalla risposta usando il formato corretto in base all'API disponibile
             if self.use_new_api:
                 # Formato nuovo: response.parts contiene le parti della risposta
                 if not hasattr(response, 'parts') or not response.parts:
-                    logger.error(f"   ❌ Risposta non ha parts o parts è vuoto")
+                    log.error("   ❌ Risposta non ha parts o parts è vuoto")
                     raise ValueError("Risposta Gemini non valida: nessuna part trovata")
                 
                 found_image = False
                 text_messages = []
                 
                 for idx, part in enumerate(response.parts, 1):
-                    logger.info(f"   🔍 Analisi part {idx}/{len(response.parts)}")
-                    logger.info(f"      - Tipo part: {type(part)}")
+                    log.detail("   🔍 Analisi part %d/%d: %s", idx, len(response.parts), type(part).__name__)
                     
                     # Controlla se ha testo PRIMA di controllare inline_data
                     if hasattr(part, 'text') and part.text is not None:
                         text_content = part.text
-                        logger.warning(f"   ⚠️ Part {idx} contiene TESTO: {text_content[:500]}...")
+                        log.warning("   ⚠️ Part %d contiene TESTO: %.500s...", idx, text_content)
                         text_messages.append(text_content)
                         # Se contiene solo testo, continua a cercare altre parts
                         # ma salva il messaggio per eventuali errori
@@ -464,7 +369,7 @@ class BananaProService:
                     
                     # Controlla se ha inline_data
                     if hasattr(part, 'inline_data') and part.inline_data is not None:
-                        logger.info(f"   ✅ Part {idx} contiene inline_data!")
+                        log.detail("   ✅ Part %d contiene inline_data", idx)
                         found_image = True
                         # Usa as_image() per ottenere l'immagine PIL
                         try:
@@ -472,13 +377,13 @@ class BananaProService:
                             
                             # Verifica che l'immagine sia valida
                             if generated_image is None:
-                                logger.warning("   ⚠️ as_image() ha restituito None")
+                                log.warning("   ⚠️ as_image() ha restituito None")
                                 continue
                             
                             # Verifica che sia una PIL Image con attributo size
                             from PIL import Image
                             if not isinstance(generated_image, Image.Image):
-                                logger.warning(f"   ⚠️ as_image() ha restituito tipo non PIL: {type(generated_image)}")
+                                log.warning("   ⚠️ as_image() ha restituito tipo non PIL: %s", type(generated_image))
                                 # Prova a estrarre i dati direttamente
                                 if hasattr(part.inline_data, 'data'):
                                     image_data = part.inline_data.data
@@ -490,22 +395,23 @@ class BananaProService:
                                     elif isinstance(image_data, str):
                                         image_data_base64 = image_data
                                     else:
-                                        logger.error(f"   ❌ Tipo dati non supportato: {type(image_data)}")
+                                        log.error("   ❌ Tipo dati non supportato: %s", type(image_data))
                                         continue
                                     
-                                    logger.info(f"   ✅ Trovati dati immagine base64: {len(image_data_base64)} caratteri")
-                                    supabase_image_url = await self._save_to_supabase_storage(image_data_base64)
-                                    logger.info(f"   ✅ Immagine salvata: {supabase_image_url}")
+                                    log.detail("   ✅ Trovati dati immagine base64: %d caratteri", len(image_data_base64))
+                                    saved_image = await self._save_to_supabase_storage(image_data_base64)
+                                    log.info("   ✅ Immagine salvata: %s", saved_image['image_url'], image_url=saved_image['image_url'])
                                     return {
-                                        "image_url": supabase_image_url,
+                                        "image_url": saved_image["image_url"],
                                         "status": "completed",
-                                        "ai_service": "banana_pro"
+                                        "ai_service": "banana_pro",
+                                        "image_metadata": saved_image["metadata"]
                                     }
                                 continue
                             
                             # Verifica che abbia l'attributo size
                             if not hasattr(generated_image, 'size'):
-                                logger.warning(f"   ⚠️ Immagine non ha attributo size: {type(generated_image)}")
+                                log.warning("   ⚠️ Immagine non ha attributo size: %s", type(generated_image))
                                 # Prova a convertire direttamente da inline_data
                                 if hasattr(part.inline_data, 'data'):
                                     image_data = part.inline_data.data
@@ -517,20 +423,21 @@ class BananaProService:
                                     elif isinstance(image_data, str):
                                         image_data_base64 = image_data
                                     else:
-                                        logger.error(f"   ❌ Tipo dati non supportato: {type(image_data)}")
+                                        log.error("   ❌ Tipo dati non supportato: %s", type(image_data))
                                         continue
                                     
-                                    logger.info(f"   ✅ Trovati dati immagine base64: {len(image_data_base64)} caratteri")
-                                    supabase_image_url = await self._save_to_supabase_storage(image_data_base64)
-                                    logger.info(f"   ✅ Immagine salvata: {supabase_image_url}")
+                                    log.detail("   ✅ Trovati dati immagine base64: %d caratteri", len(image_data_base64))
+                                    saved_image = await self._save_to_supabase_storage(image_data_base64)
+                                    log.info("   ✅ Immagine salvata: %s", saved_image['image_url'], image_url=saved_image['image_url'])
                                     return {
-                                        "image_url": supabase_image_url,
+                                        "image_url": saved_image["image_url"],
                                         "status": "completed",
-                                        "ai_service": "banana_pro"
+                                        "ai_service": "banana_pro",
+                                        "image_metadata": saved_image["metadata"]
                                     }
                                 continue
                             
-                            logger.info(f"   ✅ Trovata immagine generata: {generated_image.size}")
+                            log.detail("   ✅ Trovata immagine generata: %s", generated_image.size)
                             
                             # Converti PIL Image in bytes per salvare su Supabase
                             import io
@@ -540,20 +447,20 @@ class BananaProService:
                             
                             # Converti bytes in base64 per compatibilità con _save_to_supabase_storage
                             image_data_base64 = base64.b64encode(image_bytes).decode('utf-8')
-                            logger.info(f"   Immagine convertita in base64: {len(image_data_base64)} caratteri")
+                            log.detail("   Immagine convertita in base64: %d caratteri", len(image_data_base64))
                             
                             # Salva l'immagine su Supabase Storage
-                            logger.info(f"   Salvataggio immagine su Supabase Storage...")
-                            supabase_image_url = await self._save_to_supabase_storage(image_data_base64)
-                            logger.info(f"   ✅ Immagine salvata: {supabase_image_url}")
+                            saved_image = await self._save_to_supabase_storage(image_data_base64)
+                            log.info("   ✅ Immagine salvata: %s", saved_image['image_url'], image_url=saved_image['image_url'])
                             
                             return {
-                                "image_url": supabase_image_url,
+                                "image_url": saved_image["image_url"],
                                 "status": "completed",
-                                "ai_service": "banana_pro"
+                                "ai_service": "banana_pro",
+                                "image_metadata": saved_image["metadata"]
                             }
                         except Exception as e:
-                            logger.error(f"   ❌ Errore estrazione immagine: {e}")
+                            log.error("   ❌ Errore estrazione immagine: %s", e)
                             # Prova fallback: estrai dati direttamente da inline_data
                             if hasattr(part, 'inline_data') and part.inline_data is not None:
                                 try:
@@ -567,21 +474,20 @@ class BananaProService:
                                         elif isinstance(image_data, str):
                                             image_data_base64 = image_data
                                         else:
-                                            logger.error(f"   ❌ Tipo dati non supportato: {type(image_data)}")
+                                            log.error("   ❌ Tipo dati non supportato: %s", type(image_data))
                                             continue
                                         
-                                        logger.info(f"   ✅ Fallback: trovati dati immagine base64: {len(image_data_base64)} caratteri")
-                                        supabase_image_url = await self._save_to_supabase_storage(image_data_base64)
-                                        logger.info(f"   ✅ Immagine salvata: {supabase_image_url}")
+                                        log.detail("   ✅ Fallback: trovati dati immagine base64: %d caratteri", len(image_data_base64))
+                                        saved_image = await self._save_to_supabase_storage(image_data_base64)
+                                        log.info("   ✅ Immagine salvata: %s", saved_image['image_url'], image_url=saved_image['image_url'])
                                         return {
-                                            "image_url": supabase_image_url,
+                                            "image_url": saved_image["image_url"],
                                             "status": "completed",
-                                            "ai_service": "banana_pro"
+                                            "ai_service": "banana_pro",
+                                            "image_metadata": saved_image["metadata"]
                                         }
                                 except Exception as fallback_error:
-                                    import traceback
-                                    logger.error(f"   ❌ Errore anche nel fallback: {fallback_error}")
-                                    logger.error(f"   Traceback: {traceback.format_exc()}")
+                                    log.error("   ❌ Errore anche nel fallback: %s", fallback_error, exc_info=True)
                             continue
             else:
                 # Formato vecchio: response.candidates[0].content.parts
@@ -592,17 +498,17 @@ class BananaProService:
                             if hasattr(part, 'inline_data') and part.inline_data:
                                 # Estrai dati base64 dall'immagine
                                 image_data_base64 = part.inline_data.data
-                                logger.info(f"   ✅ Trovata immagine generata: {len(image_data_base64)} caratteri base64")
+                                log.detail("   ✅ Trovata immagine generata: %d caratteri base64", len(image_data_base64))
                                 
                                 # Salva l'immagine su Supabase Storage
-                                logger.info(f"   Salvataggio immagine su Supabase Storage...")
-                                supabase_image_url = await self._save_to_supabase_storage(image_data_base64)
-                                logger.info(f"   ✅ Immagine salvata: {supabase_image_url}")
+                                saved_image = await self._save_to_supabase_storage(image_data_base64)
+                                log.info("   ✅ Immagine salvata: %s", saved_image['image_url'], image_url=saved_image['image_url'])
                                 
                                 return {
-                                    "image_url": supabase_image_url,
+                                    "image_url": saved_image["image_url"],
                                     "status": "completed",
-                                    "ai_service": "banana_pro"
+                                    "ai_service": "banana_pro",
+                                    "image_metadata": saved_image["metadata"]
                                 }
             
             # Se non c'è immagine nella risposta, prova a estrarre il testo per vedere se c'è un messaggio di errore
@@ -612,12 +518,12 @@ class BananaProService:
                     text_parts = [p.text for p in response.parts if hasattr(p, 'text') and p.text is not None]
                     if text_parts:
                         error_message = " ".join(text_parts)
-                        logger.error(f"   📝 Messaggio completo dalla risposta: {error_message}")
+                        log.error("   📝 Messaggio completo dalla risposta: %s", error_message)
                         # Se la risposta contiene solo testo, potrebbe essere un errore o un messaggio informativo
-                        logger.error(f"   ⚠️ La risposta contiene solo testo, non un'immagine. Questo potrebbe indicare:")
-                        logger.error(f"      1. Il modello non supporta la generazione di immagini con questo formato")
-                        logger.error(f"      2. C'è un problema con la configurazione dell'API key")
-                        logger.error(f"      3. Il modello richiede un formato diverso per la generazione di immagini")
+                        log.error("   ⚠️ La risposta contiene solo testo, non un'immagine. Questo potrebbe indicare:")
+                        log.error("      1. Il modello non supporta la generazione di immagini con questo formato")
+                        log.error("      2. C'è un problema con la configurazione dell'API key")
+                        log.error("      3. Il modello richiede un formato diverso per la generazione di immagini")
             else:
                 if hasattr(response, 'candidates') and response.candidates:
                     candidate = response.candidates[0]
@@ -626,10 +532,10 @@ class BananaProService:
                             text_parts = [p.text for p in candidate.content.parts if hasattr(p, 'text') and p.text is not None]
                             if text_parts:
                                 error_message = " ".join(text_parts)
-                                logger.error(f"   📝 Messaggio completo dalla risposta: {error_message}")
+                                log.error("   📝 Messaggio completo dalla risposta: %s", error_message)
             
-            logger.error("⚠️  Gemini API non ha restituito immagine nella risposta")
-            logger.error(f"   Numero di parts nella risposta: {len(response.parts) if hasattr(response, 'parts') else 0}")
+            log.error("⚠️  Gemini API non ha restituito immagine nella risposta")
+            log.error("   Numero di parts nella risposta: %d", len(response.parts) if getattr(response, 'parts', None) else 0)
             
             error_detail = f"Verifica che il modello '{self.model_name}' sia disponibile e che la fatturazione sia attiva sul tuo account Google Cloud."
             if error_message:
@@ -645,22 +551,39 @@ class BananaProService:
             )
                     
         except httpx.HTTPError as e:
-            import traceback
-            error_trace = traceback.format_exc()
-            logger.error(f"❌ Errore HTTP Banana Pro: {e}")
-            if hasattr(e, 'response') and e.response is not None:
-                logger.error(f"   Response status: {e.response.status_code}")
-                logger.error(f"   Response body: {e.response.text}")
-            logger.error(f"   Traceback completo:\n{error_trace}")
+            log.error("❌ Errore HTTP Banana Pro: %s", e, exc_info=True)
+            http_response = getattr(e, 'response', None)
+            if http_response is not None:
+                log.error("   Response status: %s", http_response.status_code, status_code=http_response.status_code)
+                log.error("   Response body: %s", lazy(lambda: http_response.text))
             raise Exception(f"Errore comunicazione Banana Pro: {str(e)}") from e
         except Exception as e:
-            import traceback
-            error_trace = traceback.format_exc()
-            logger.error(f"❌ Errore generazione Banana Pro: {e}")
-            logger.error(f"   Traceback completo:\n{error_trace}")
+            log.error("❌ Errore generazione Banana Pro: %s", e, exc_info=True)
             raise
     
-    async def _save_to_supabase_storage(self, image_data: str) -> str:
+    @staticmethod
+    def _log_response_structure(log: GenerationLog, response: Any) -> None:
+        """Struttura della risposta del modello nei log di dettaglio (parts, testo, inline_data)"""
+        parts = getattr(response, 'parts', None)
+        if parts is None and getattr(response, 'candidates', None):
+            content = getattr(response.candidates[0], 'content', None)
+            parts = getattr(content, 'parts', None)
+        if parts is None:
+            log.detail("   📋 Risposta senza parts, attributi: %s", lazy(lambda: dir(response)))
+            return
+        log.detail("   📋 Risposta %s con %d parts", type(response).__name__, len(parts))
+        for idx, part in enumerate(parts, 1):
+            text = getattr(part, 'text', None)
+            inline_data = getattr(part, 'inline_data', None)
+            data = getattr(inline_data, 'data', None)
+            log.detail(
+                "      - Part %d: tipo=%s, testo=%.300s, inline_data=%s, mime_type=%s",
+                idx, type(part).__name__, text,
+                len(data) if isinstance(data, (str, bytes)) else inline_data is not None,
+                getattr(part, 'mime_type', None),
+            )
+
+    async def _save_to_supabase_storage(self, image_data: str) -> Dict[str, Any]:
         """
         Salva l'immagine su Supabase Storage
         
@@ -668,7 +591,8 @@ class BananaProService:
             image_data: Dati immagine in base64 (stringa) da Google Imagen API OPPURE URL (stringa)
             
         Returns:
-            URL pubblico dell'immagine su Supabase Storage
+            Dict con 'image_url' (URL pubblico su Supabase Storage) e 'metadata'
+            ('mime_type', 'width', 'height', 'byte_size' dell'immagine salvata)
         """
         try:
             from backend.database import get_supabase_admin
@@ -689,8 +613,8 @@ class BananaProService:
             # Determina se è un URL o base64
             if image_data.startswith("http://") or image_data.startswith("https://"):
                 # È un URL - scarica l'immagine
-                async with httpx.AsyncClient(timeout=30.0) as client:
-                    logger.info(f"📥 Download immagine da banana.dev: {image_data}")
+                async with instrumented_async_client("banana_result", timeout=30.0) as client:
+                    logger.debug("📥 Download immagine da banana.dev: %s", image_data)
                     response = await client.get(image_data)
                     response.raise_for_status()
                     image_bytes = response.content
@@ -698,42 +622,60 @@ class BananaProService:
                     if not image_bytes or len(image_bytes) == 0:
                         raise ValueError("Immagine scaricata vuota")
                     
-                    logger.info(f"✅ Immagine scaricata: {len(image_bytes)} bytes")
+                    logger.debug("✅ Immagine scaricata: %d bytes", len(image_bytes))
             elif image_data.startswith("data:image") or len(image_data) > 100:
                 # Probabilmente è base64
-                logger.info(f"📥 Decodifica immagine base64 da banana.dev")
+                logger.debug("📥 Decodifica immagine base64 da banana.dev")
                 try:
                     # Rimuovi il prefisso data:image se presente
                     if "," in image_data:
                         image_data = image_data.split(",")[1]
                     image_bytes = base64.b64decode(image_data)
-                    logger.info(f"✅ Immagine decodificata: {len(image_bytes)} bytes")
+                    logger.debug("✅ Immagine decodificata: %d bytes", len(image_bytes))
                 except Exception as e:
                     raise ValueError(f"Errore decodifica base64: {e}")
             else:
                 raise ValueError(f"Formato immagine non riconosciuto: {image_data[:50]}...")
+            end_stage("response_parse")
+            
+            # Rileva il formato reale e transcodifica (CPU-bound, fuori dall'event loop)
+            loop = asyncio.get_event_loop()
+            with stage("transcode"):
+                processed = await loop.run_in_executor(None, transcode_image, image_bytes)
+            image_bytes = processed["data"]
+            content_type = processed["mime_type"]
+            extension = processed["extension"]
+            logger.info(
+                "🗜️ Immagine transcodificata: %s %d bytes -> %s %d bytes (%dx%d)",
+                processed['source_format'], processed['source_byte_size'], content_type,
+                processed['byte_size'], processed['width'], processed['height'],
+            )
             
             # Genera nome file univoco
-            file_name = f"generated/{uuid4()}.jpg"
+            file_name = f"generated/{uuid4()}.{extension}"
             
             # Carica su Supabase Storage
             bucket_name = "generated-images"
-            logger.info(f"📤 Upload su Supabase Storage: {bucket_name}/{file_name}")
+            logger.debug("📤 Upload su Supabase Storage: %s/%s", bucket_name, file_name)
+            
+            def upload(path: str):
+                supabase_admin.storage.from_(bucket_name).upload(
+                    path,
+                    image_bytes,
+                    file_options={"content-type": content_type, "upsert": "true"}
+                )
             
-            # Prova a caricare, se esiste già genera un nuovo nome
+            # Prova a caricare (errori transitori ritentati con backoff), se esiste già genera un nuovo nome
             max_retries = 3
             for attempt in range(max_retries):
                 try:
-                    supabase_admin.storage.from_(bucket_name).upload(
-                        file_name,
-                        image_bytes,
-                        file_options={"content-type": "image/jpeg", "upsert": "true"}
-                    )
+                    with stage("upload", bucket_name):
+                        await storage_retry_policy.run_in_executor(upload, file_name)
                     break
                 except Exception as e:
                     if "duplicate" in str(e).lower() or "already exists" in str(e).lower():
                         # Genera nuovo nome se esiste già
-                        file_name = f"generated/{uuid4()}.jpg"
+                        file_name = f"generated/{uuid4()}.{extension}"
                         if attempt == max_retries - 1:
                             raise
                     else:
@@ -741,9 +683,17 @@ class BananaProService:
             
             # Ottieni URL pubblico
             public_url = supabase_admin.storage.from_(bucket_name).get_public_url(file_name)
-            logger.info(f"✅ Immagine salvata su Supabase Storage: {public_url}")
-            
-            return public_url
+            logger.debug("✅ Immagine salvata su Supabase Storage: %s", public_url)
+            
+            return {
+                "image_url": public_url,
+                "metadata": {
+                    "mime_type": content_type,
+                    "width": processed["width"],
+                    "height": processed["height"],
+                    "byte_size": processed["byte_size"]
+                }
+            }
             
         except Exception as e:
             import traceback
@@ -0,0 +1,223 @@
+"""
+Circuit breaker per i backend di generazione AI
+
+Ogni backend (Banana Pro, Gemini) ha il suo circuito che osserva le ultime
+chiamate al modello: se la percentuale di errori (o di chiamate troppo lente)
+supera la soglia il circuito si apre e le richieste falliscono subito, senza
+attendere il timeout dell'SDK. Dopo CIRCUIT_OPEN_SECONDS il circuito passa a
+half-open e lascia passare un numero limitato di chiamate di prova: se vanno a
+buon fine si richiude, altrimenti si riapre.
+
+Gli errori di input (ValueError, risposte HTTP 4xx diverse da 408/429) non
+contano: non dicono nulla sulla salute del backend.
+"""
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, Dict, Optional
+from backend.config import settings
+from backend.utils.metrics import ai_model_call_seconds, ai_model_calls_rejected_total
+from backend.utils.retry import error_status_code
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Chiamata rifiutata: circuito del backend aperto"""
+
+    def __init__(self, name: str, retry_after: float):
+        self.name = name
+        self.retry_after = retry_after
+        super().__init__(f"Servizio {name} temporaneamente non disponibile (circuito aperto, riprova tra {retry_after:.0f}s)")
+
+
+def is_backend_failure(exc: BaseException) -> bool:
+    """True se l'errore indica un problema del backend (e non dell'input)"""
+    if isinstance(exc, (ValueError, CircuitOpenError)):
+        return False
+    code = error_status_code(exc)
+    if code is not None and 400 <= code < 500 and code not in (408, 429):
+        return False
+    return True
+
+
+def describe_error(exc: BaseException) -> str:
+    """
+    Classe dell'errore e codice HTTP, senza il messaggio
+
+    Il messaggio di httpx contiene l'URL della richiesta, che per Gemini include
+    la API key (?key=...): non deve finire in /health né nelle risposte.
+    """
+    code = error_status_code(exc)
+    if code is None and exc.__cause__ is not None:
+        code = error_status_code(exc.__cause__)
+    return f"{type(exc).__name__} (HTTP {code})" if code is not None else type(exc).__name__
+
+
+class CircuitBreaker:
+    """Circuito closed -> open -> half_open su finestra scorrevole delle ultime chiamate"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.state = CLOSED
+        self._results: deque = deque(maxlen=settings.CIRCUIT_WINDOW_SIZE)  # True = chiamata fallita
+        self._opened_at = 0.0
+        self._probes_in_flight = 0
+        self._last_error: Optional[str] = None
+        self._last_latency: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def _open_remaining(self, now: float) -> float:
+        return max(0.0, self._opened_at + settings.CIRCUIT_OPEN_SECONDS - now)
+
+    def _transition(self, state: str, now: float) -> None:
+        if state == self.state:
+            return
+        logger.warning(f"🔌 Circuito {self.name}: {self.state} -> {state}")
+        self.state = state
+        if state == OPEN:
+            self._opened_at = now
+        if state in (OPEN, CLOSED):
+            self._probes_in_flight = 0
+        if state == CLOSED:
+            self._results.clear()
+
+    def is_available(self) -> bool:
+        """True se una chiamata verrebbe ammessa ora (non riserva slot di prova)"""
+        if not settings.CIRCUIT_BREAKER_ENABLED:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            if self.state == OPEN:
+                return self._open_remaining(now) == 0
+            if self.state == HALF_OPEN:
+                return self._probes_in_flight < settings.CIRCUIT_HALF_OPEN_PROBES
+            return True
+
+    def retry_after(self) -> float:
+        """Secondi prima che il circuito ammetta di nuovo chiamate (0 se disponibile)"""
+        if not settings.CIRCUIT_BREAKER_ENABLED:
+            return 0.0
+        now = time.monotonic()
+        with self._lock:
+            if self.state == OPEN:
+                return self._open_remaining(now)
+            if self.state == HALF_OPEN and self._probes_in_flight >= settings.CIRCUIT_HALF_OPEN_PROBES:
+                return float(settings.CIRCUIT_OPEN_SECONDS)
+            return 0.0
+
+    def _acquire(self) -> None:
+        now = time.monotonic()
+        with self._lock:
+            if self.state == OPEN:
+                remaining = self._open_remaining(now)
+                if remaining > 0:
+                    raise CircuitOpenError(self.name, remaining)
+                self._transition(HALF_OPEN, now)
+            if self.state == HALF_OPEN:
+                if self._probes_in_flight >= settings.CIRCUIT_HALF_OPEN_PROBES:
+                    raise CircuitOpenError(self.name, settings.CIRCUIT_OPEN_SECONDS)
+                self._probes_in_flight += 1
+
+    def _record(self, failed: bool, latency: float, error: Optional[str]) -> None:
+        now = time.monotonic()
+        slow = latency > settings.CIRCUIT_SLOW_CALL_SECONDS
+        if slow and not failed:
+            error = f"chiamata lenta ({latency:.1f}s)"
+        with self._lock:
+            self._last_latency = latency
+            if failed or slow:
+                self._last_error = error
+            if self.state == HALF_OPEN:
+                self._probes_in_flight = max(0, self._probes_in_flight - 1)
+                self._transition(OPEN if failed or slow else CLOSED, now)
+                return
+            self._results.append(failed or slow)
+            if len(self._results) >= settings.CIRCUIT_MIN_CALLS:
+                failure_rate = sum(self._results) / len(self._results)
+                if failure_rate >= settings.CIRCUIT_FAILURE_RATE:
+                    logger.error(f"❌ Circuito {self.name} aperto: {failure_rate:.0%} chiamate fallite o lente, ultimo errore: {self._last_error}")
+                    self._transition(OPEN, now)
+
+    def _release(self) -> None:
+        # Chiamata di prova terminata con un errore di input: non decide lo stato
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probes_in_flight = max(0, self._probes_in_flight - 1)
+
+    @asynccontextmanager
+    async def guard(self):
+        """
+        Protegge una chiamata al modello
+
+        Raises:
+            CircuitOpenError: se il circuito è aperto (la chiamata non viene eseguita)
+
+        La durata e l'esito sono sempre registrati in ai_model_call_seconds,
+        anche con il circuit breaker disabilitato.
+        """
+        enabled = settings.CIRCUIT_BREAKER_ENABLED
+        if enabled:
+            try:
+                self._acquire()
+            except CircuitOpenError:
+                ai_model_calls_rejected_total.labels(backend=self.name).inc()
+                raise
+        start = time.monotonic()
+        outcome = "ok"
+        try:
+            yield
+        except Exception as e:
+            failed = is_backend_failure(e)
+            outcome = "error" if failed else "client_error"
+            if enabled:
+                if failed:
+                    self._record(True, time.monotonic() - start, describe_error(e))
+                else:
+                    self._release()
+            raise
+        except BaseException:
+            # Richiesta annullata (es: client disconnesso): non dice nulla sul backend
+            outcome = "cancelled"
+            if enabled:
+                self._release()
+            raise
+        else:
+            if enabled:
+                self._record(False, time.monotonic() - start, None)
+        finally:
+            ai_model_call_seconds.labels(backend=self.name, outcome=outcome).observe(time.monotonic() - start)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Stato del circuito per /health"""
+        now = time.monotonic()
+        with self._lock:
+            calls = len(self._results)
+            data: Dict[str, Any] = {
+                "state": self.state,
+                "recent_calls": calls,
+                "failure_rate": round(sum(self._results) / calls, 2) if calls else 0.0,
+                "last_latency_seconds": round(self._last_latency, 2) if self._last_latency is not None else None,
+            }
+            if self.state == OPEN:
+                data["retry_after_seconds"] = round(self._open_remaining(now), 1)
+            return data
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(name: str) -> CircuitBreaker:
+    """Circuito del backend (uno per nome, creato al primo uso)"""
+    with _breakers_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(name)
+        return _breakers[name]
+
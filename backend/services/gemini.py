@@ -2,9 +2,16 @@
 Servizio per integrazione Google Gemini API
 """
 import httpx
+import asyncio
 import logging
 from typing import Optional, Dict, Any, List
 from backend.config import settings
+from backend.services.image_processing import transcode_image
+from backend.services.circuit_breaker import get_circuit_breaker
+from backend.utils.ai_logging import GenerationLog
+from backend.utils.instrumentation import instrumented_async_client
+from backend.utils.retry import model_retry_policy, storage_retry_policy
+from backend.utils.timing import stage
 import base64
 
 logger = logging.getLogger(__name__)
@@ -16,6 +23,7 @@ class GeminiService:
     def __init__(self):
         self.api_key = settings.GEMINI_API_KEY
         self.base_url = "https://generativelanguage.googleapis.com/v1beta"
+        self.breaker = get_circuit_breaker("gemini")
         if not self.api_key:
             logger.warning("GEMINI_API_KEY non configurata")
     
@@ -62,8 +70,9 @@ class GeminiService:
                 """Rimuove parametri di query e caratteri strani dall'URL"""
                 if not url:
                     return url
-                # Rimuovi parametri di query (tutto dopo ?)
-                url = url.split('?')[0]
+                # Rimuovi parametri di query (tutto dopo ?), tranne per URL firmati Storage
+                if "/object/sign/" not in url:
+                    url = url.split('?')[0]
                 # Rimuovi eventuali spazi o caratteri di fine riga
                 url = url.strip()
                 return url
@@ -71,30 +80,32 @@ class GeminiService:
             customer_photo_url_clean = clean_url(customer_photo_url)
             product_image_url_clean = clean_url(product_image_url)
             
-            logger.info(f"📥 Download immagini:")
-            logger.info(f"   Foto cliente: {customer_photo_url_clean}")
-            logger.info(f"   Prodotto: {product_image_url_clean}")
+            log = GenerationLog(logger, "gemini")
+            log.info("📥 Download immagini: 1 foto cliente, 1 prodotto", customer_photos=1, products=1)
+            log.detail("   Foto cliente: %s, prodotto: %s", customer_photo_url_clean, product_image_url_clean)
             
             # Scarica le immagini per includerle nella richiesta
-            async with httpx.AsyncClient(timeout=30.0) as client:
+            async with instrumented_async_client("image_download", timeout=30.0) as client:
                 # Scarica foto cliente
                 try:
-                    customer_response = await client.get(customer_photo_url_clean)
-                    customer_response.raise_for_status()
+                    with stage("download", "foto cliente 1"):
+                        customer_response = await client.get(customer_photo_url_clean)
+                        customer_response.raise_for_status()
                     customer_image_data = base64.b64encode(customer_response.content).decode('utf-8')
-                    logger.info(f"✅ Foto cliente scaricata: {len(customer_response.content)} bytes")
+                    log.detail("✅ Foto cliente scaricata: %d bytes", len(customer_response.content))
                 except Exception as e:
-                    logger.error(f"❌ Errore download foto cliente da {customer_photo_url_clean}: {e}")
+                    log.error("❌ Errore download foto cliente da %s: %s", customer_photo_url_clean, e)
                     raise Exception(f"Impossibile scaricare foto cliente: {str(e)}")
                 
                 # Scarica immagine prodotto
                 try:
-                    product_response = await client.get(product_image_url_clean)
-                    product_response.raise_for_status()
+                    with stage("download", "prodotto 1"):
+                        product_response = await client.get(product_image_url_clean)
+                        product_response.raise_for_status()
                     product_image_data = base64.b64encode(product_response.content).decode('utf-8')
-                    logger.info(f"✅ Immagine prodotto scaricata: {len(product_response.content)} bytes")
+                    log.detail("✅ Immagine prodotto scaricata: %d bytes", len(product_response.content))
                 except Exception as e:
-                    logger.error(f"❌ Errore download immagine prodotto da {product_image_url_clean}: {e}")
+                    log.error("❌ Errore download immagine prodotto da %s: %s", product_image_url_clean, e)
                     raise Exception(f"Impossibile scaricare immagine prodotto: {str(e)}")
             
             # Prepara contenuto per Gemini (multimodale)
@@ -121,23 +132,31 @@ class GeminiService:
             ]
             
             # Chiamata API Gemini
-            async with httpx.AsyncClient(timeout=120.0) as client:
-                response = await client.post(
-                    f"{self.base_url}/models/{model}:generateContent",
-                    params={"key": self.api_key},
-                    json={
-                        "contents": contents,
-                        "generationConfig": {
-                            "temperature": 0.7,
-                            "topK": 40,
-                            "topP": 0.95,
-                            "maxOutputTokens": 1024
-                        }
-                    }
-                )
+            async with instrumented_async_client("gemini_api", timeout=120.0) as client:
+                # Il circuit breaker fallisce subito se il backend è in errore; gli errori
+                # transitori (429/503, timeout) vengono ritentati con backoff
+                async def call_model():
+                    async with self.breaker.guard():
+                        with stage("model_call", model):
+                            response = await client.post(
+                                f"{self.base_url}/models/{model}:generateContent",
+                                params={"key": self.api_key},
+                                json={
+                                    "contents": contents,
+                                    "generationConfig": {
+                                        "temperature": 0.7,
+                                        "topK": 40,
+                                        "topP": 0.95,
+                                        "maxOutputTokens": 1024
+                                    }
+                                }
+                            )
+                            response.raise_for_status()
+                        return response
                 
-                response.raise_for_status()
-                result = response.json()
+                response = await model_retry_policy.run(call_model)
+                with stage("response_parse"):
+                    result = response.json()
                 
                 # Gemini può restituire testo o immagini generate
                 # Per ora, assumiamo che restituisca un URL o dati immagine
@@ -149,11 +168,12 @@ class GeminiService:
                             if "inline_data" in part:
                                 image_data = part["inline_data"]["data"]
                                 # Salva l'immagine generata su Supabase Storage
-                                image_url = await self._save_generated_image(image_data)
+                                saved_image = await self._save_generated_image(image_data)
                                 return {
-                                    "image_url": image_url,
+                                    "image_url": saved_image["image_url"],
                                     "status": "completed",
-                                    "ai_service": "gemini"
+                                    "ai_service": "gemini",
+                                    "image_metadata": saved_image["metadata"]
                                 }
                 
                 # Se non c'è immagine nella risposta, usa un placeholder
@@ -171,8 +191,8 @@ class GeminiService:
             logger.error(f"Errore generazione Gemini: {e}")
             raise
     
-    async def _save_generated_image(self, image_data: str) -> str:
-        """Salva l'immagine generata su Supabase Storage"""
+    async def _save_generated_image(self, image_data: str) -> Dict[str, Any]:
+        """Salva l'immagine generata su Supabase Storage (dict con 'image_url' e 'metadata')"""
         try:
             from backend.database import get_supabase_admin
             from uuid import uuid4
@@ -182,27 +202,48 @@ class GeminiService:
             supabase_admin = get_supabase_admin()
             
             # Decodifica base64
-            image_bytes = base64.b64decode(image_data)
+            with stage("response_parse", "base64"):
+                image_bytes = base64.b64decode(image_data)
+            
+            # Rileva il formato reale e transcodifica (CPU-bound, fuori dall'event loop)
+            loop = asyncio.get_event_loop()
+            with stage("transcode"):
+                processed = await loop.run_in_executor(None, transcode_image, image_bytes)
             
             # Genera nome file univoco
-            file_name = f"generated/{uuid4()}.jpg"
+            file_name = f"generated/{uuid4()}.{processed['extension']}"
             
             # Carica su Supabase Storage
             bucket_name = "generated-images"
-            supabase_admin.storage.from_(bucket_name).upload(
-                file_name,
-                image_bytes,
-                file_options={"content-type": "image/jpeg"}
-            )
+            def upload():
+                supabase_admin.storage.from_(bucket_name).upload(
+                    file_name,
+                    processed["data"],
+                    file_options={"content-type": processed["mime_type"]}
+                )
+            
+            with stage("upload", bucket_name):
+                await storage_retry_policy.run_in_executor(upload)
             
             # Ottieni URL pubblico
             public_url = supabase_admin.storage.from_(bucket_name).get_public_url(file_name)
-            return public_url
+            return {
+                "image_url": public_url,
+                "metadata": {
+                    "mime_type": processed["mime_type"],
+                    "width": processed["width"],
+                    "height": processed["height"],
+                    "byte_size": processed["byte_size"]
+                }
+            }
             
         except Exception as e:
             logger.error(f"Errore salvataggio immagine generata: {e}")
             # Fallback a placeholder
-            return "https://via.placeholder.com/1024x1024?text=AI+Generated+Image"
+            return {
+                "image_url": "https://via.placeholder.com/1024x1024?text=AI+Generated+Image",
+                "metadata": None
+            }
     
     async def generate_outfit_image(
         self,
@@ -242,27 +283,31 @@ class GeminiService:
                 """Rimuove parametri di query e caratteri strani dall'URL"""
                 if not url:
                     return url
-                # Rimuovi parametri di query (tutto dopo ?)
-                url = url.split('?')[0]
+                # Rimuovi parametri di query (tutto dopo ?), tranne per URL firmati Storage
+                if "/object/sign/" not in url:
+                    url = url.split('?')[0]
                 # Rimuovi eventuali spazi o caratteri di fine riga
                 url = url.strip()
                 return url
             
             customer_photo_url_clean = clean_url(customer_photo_url)
-            logger.info(f"📥 Download immagini per outfit:")
-            logger.info(f"   Foto cliente: {customer_photo_url_clean}")
-            logger.info(f"   Prodotti: {len(product_image_urls)}")
+            log = GenerationLog(logger, "gemini")
+            log.info(
+                "📥 Download immagini per outfit: 1 foto cliente, %d prodotti", len(product_image_urls),
+                customer_photos=1, products=len(product_image_urls),
+            )
+            log.detail("   Foto cliente: %s", customer_photo_url_clean)
             
             # Scarica le immagini per includerle nella richiesta
-            async with httpx.AsyncClient(timeout=30.0) as client:
+            async with instrumented_async_client("image_download", timeout=30.0) as client:
                 # Scarica foto cliente
                 try:
                     customer_response = await client.get(customer_photo_url_clean)
                     customer_response.raise_for_status()
                     customer_image_data = base64.b64encode(customer_response.content).decode('utf-8')
-                    logger.info(f"✅ Foto cliente scaricata: {len(customer_response.content)} bytes")
+                    log.detail("✅ Foto cliente scaricata: %d bytes", len(customer_response.content))
                 except Exception as e:
-                    logger.error(f"❌ Errore download foto cliente da {customer_photo_url_clean}: {e}")
+                    log.error("❌ Errore download foto cliente da %s: %s", customer_photo_url_clean, e)
                     raise Exception(f"Impossibile scaricare foto cliente: {str(e)}")
                 
                 # Scarica immagini prodotti
@@ -270,14 +315,14 @@ class GeminiService:
                 for idx, product_url in enumerate(product_image_urls):
                     try:
                         product_url_clean = clean_url(product_url)
-                        logger.info(f"   Download prodotto {idx+1}/{len(product_image_urls)}: {product_url_clean}")
+                        log.detail("   Download prodotto %d/%d: %s", idx + 1, len(product_image_urls), product_url_clean)
                         product_response = await client.get(product_url_clean)
                         product_response.raise_for_status()
                         product_image_data = base64.b64encode(product_response.content).decode('utf-8')
                         product_images_data.append(product_image_data)
-                        logger.info(f"   ✅ Prodotto {idx+1} scaricato: {len(product_response.content)} bytes")
+                        log.detail("   ✅ Prodotto %d scaricato: %d bytes", idx + 1, len(product_response.content))
                     except Exception as e:
-                        logger.warning(f"⚠️ Errore nel caricare immagine prodotto {product_url}: {e}")
+                        log.warning("⚠️ Errore nel caricare immagine prodotto %s: %s", product_url, e)
                         continue
             
             if not product_images_data:
@@ -308,22 +353,28 @@ class GeminiService:
             contents = [{"parts": parts}]
             
             # Chiamata API Gemini
-            async with httpx.AsyncClient(timeout=180.0) as client:  # Timeout più lungo per più immagini
-                response = await client.post(
-                    f"{self.base_url}/models/{model}:generateContent",
-                    params={"key": self.api_key},
-                    json={
-                        "contents": contents,
-                        "generationConfig": {
-                            "temperature": 0.7,
-                            "topK": 40,
-                            "topP": 0.95,
-                            "maxOutputTokens": 2048  # Più token per prompt più complesso
-                        }
-                    }
-                )
+            async with instrumented_async_client("gemini_api", timeout=180.0) as client:  # Timeout più lungo per più immagini
+                # Il circuit breaker fallisce subito se il backend è in errore; gli errori
+                # transitori (429/503, timeout) vengono ritentati con backoff
+                async def call_model():
+                    async with self.breaker.guard():
+                        response = await client.post(
+                            f"{self.base_url}/models/{model}:generateContent",
+                            params={"key": self.api_key},
+                            json={
+                                "contents": contents,
+                                "generationConfig": {
+                                    "temperature": 0.7,
+                                    "topK": 40,
+                                    "topP": 0.95,
+                                    "maxOutputTokens": 2048  # Più token per prompt più complesso
+                                }
+                            }
+                        )
+                        response.raise_for_status()
+                        return response
                 
-                response.raise_for_status()
+                response = await model_retry_policy.run(call_model)
                 result = response.json()
                 
                 # Gemini può restituire testo o immagini generate
@@ -335,11 +386,12 @@ class GeminiService:
                             if "inline_data" in part:
                                 image_data = part["inline_data"]["data"]
                                 # Salva l'immagine generata su Supabase Storage
-                                image_url = await self._save_generated_image(image_data)
+                                saved_image = await self._save_generated_image(image_data)
                                 return {
-                                    "image_url": image_url,
+                                    "image_url": saved_image["image_url"],
                                     "status": "completed",
-                                    "ai_service": "gemini"
+                                    "ai_service": "gemini",
+                                    "image_metadata": saved_image["metadata"]
                                 }
                 
                 # Se non c'è immagine nella risposta, usa un placeholder
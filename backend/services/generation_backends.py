@@ -0,0 +1,133 @@
+"""
+Interfaccia dei backend di generazione immagini AI e registro dei backend
+
+Ogni backend dichiara nome, capacità (quante foto cliente e immagini prodotto
+accetta) e un metodo asincrono generate che restituisce lo stesso formato di
+risultato usato dalle route: {'image_url', 'status', 'ai_service', 'image_metadata'}.
+AIService sceglie il backend dal registro per nome e ripiega sui successivi
+della catena di fallback se non è configurato o se il suo circuito è aperto.
+"""
+import logging
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+from backend.services.banana_pro import banana_pro_service
+from backend.services.gemini import gemini_service
+from backend.services.circuit_breaker import CircuitBreaker, get_circuit_breaker
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class BackendCapabilities:
+    """Cosa sa fare un backend di generazione"""
+    max_customer_photos: int = 3
+    max_product_images: int = 10
+    uses_product_names: bool = True  # Il prompt usa i nomi prodotto
+    requires_network: bool = True  # Richiede API key e rete
+
+
+class ImageGenerationBackend(ABC):
+    """Backend di generazione immagini (Banana Pro, Gemini, motore locale, ...)"""
+
+    name: str = ""
+    capabilities: BackendCapabilities = BackendCapabilities()
+
+    @property
+    def breaker(self) -> CircuitBreaker:
+        return get_circuit_breaker(self.name)
+
+    @abstractmethod
+    def is_configured(self) -> bool:
+        """True se il backend può essere usato (API key presente, abilitato, ...)"""
+
+    @abstractmethod
+    async def generate(
+        self,
+        customer_photo_urls: List[str],
+        product_image_urls: List[str],
+        prompt: Optional[str] = None,
+        scenario: Optional[str] = None,
+        product_names: Optional[List[str]] = None,
+    ) -> Dict[str, Any]:
+        """Genera l'immagine e restituisce il risultato nel formato comune"""
+
+    def fit_inputs(self, customer_photo_urls: List[str], product_image_urls: List[str], product_names: Optional[List[str]]):
+        """Limita gli input alle capacità del backend"""
+        caps = self.capabilities
+        products = product_image_urls[:caps.max_product_images]
+        names = product_names[:len(products)] if product_names and caps.uses_product_names else None
+        return customer_photo_urls[:caps.max_customer_photos], products, names
+
+
+class BananaProBackend(ImageGenerationBackend):
+    """Gemini 2.5 Flash Image via google-genai (più foto cliente e più prodotti)"""
+
+    name = "banana_pro"
+    capabilities = BackendCapabilities(max_customer_photos=3, max_product_images=10)
+
+    def __init__(self, service=banana_pro_service):
+        self.service = service
+
+    def is_configured(self) -> bool:
+        return bool(self.service.api_key)
+
+    async def generate(self, customer_photo_urls, product_image_urls, prompt=None, scenario=None, product_names=None):
+        customer_photo_urls, product_image_urls, product_names = self.fit_inputs(
+            customer_photo_urls, product_image_urls, product_names
+        )
+        return await self.service.generate_image(
+            customer_photo_urls=customer_photo_urls,
+            product_image_urls=product_image_urls,
+            prompt=prompt,
+            scenario=scenario,
+            product_names=product_names
+        )
+
+
+class GeminiBackend(ImageGenerationBackend):
+    """Gemini REST (una foto cliente e un prodotto)"""
+
+    name = "gemini"
+    capabilities = BackendCapabilities(max_customer_photos=1, max_product_images=1, uses_product_names=False)
+
+    def __init__(self, service=gemini_service):
+        self.service = service
+
+    def is_configured(self) -> bool:
+        return bool(self.service.api_key)
+
+    async def generate(self, customer_photo_urls, product_image_urls, prompt=None, scenario=None, product_names=None):
+        # Gemini non supporta più immagini: usa solo la prima foto e il primo prodotto
+        return await self.service.generate_image(
+            customer_photo_url=customer_photo_urls[0] if customer_photo_urls else "",
+            product_image_url=product_image_urls[0] if product_image_urls else "",
+            prompt=prompt,
+            scenario=scenario
+        )
+
+
+_backends: Dict[str, ImageGenerationBackend] = {}
+
+
+def register_backend(backend: ImageGenerationBackend) -> ImageGenerationBackend:
+    """Registra un backend (sostituisce un eventuale backend con lo stesso nome)"""
+    if not backend.name:
+        raise ValueError("Il backend deve avere un nome")
+    _backends[backend.name] = backend
+    logger.debug(f"Backend AI registrato: {backend.name}")
+    return backend
+
+
+def get_backend(name: str) -> Optional[ImageGenerationBackend]:
+    """Backend registrato con questo nome (None se assente)"""
+    return _backends.get(name)
+
+
+def registered_backends() -> Dict[str, ImageGenerationBackend]:
+    """Tutti i backend registrati (nome -> backend)"""
+    return dict(_backends)
+
+
+register_backend(BananaProBackend())
+register_backend(GeminiBackend())
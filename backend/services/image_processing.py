@@ -0,0 +1,136 @@
+"""
+Post-processing delle immagini generate prima del salvataggio su Storage
+Rileva il formato reale dei bytes restituiti dal modello e li transcodifica
+in un formato più efficiente (WebP/AVIF o JPEG con qualità calibrata)
+"""
+import io
+import logging
+from typing import Dict, Any, Optional
+from backend.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Formati di output supportati: formato PIL, MIME type, estensione file
+OUTPUT_FORMATS = {
+    "webp": ("WEBP", "image/webp", "webp"),
+    "avif": ("AVIF", "image/avif", "avif"),
+    "jpeg": ("JPEG", "image/jpeg", "jpg"),
+}
+
+# MIME type dei formati in ingresso riconosciuti da PIL
+INPUT_MIME_TYPES = {
+    "PNG": "image/png",
+    "JPEG": "image/jpeg",
+    "WEBP": "image/webp",
+    "AVIF": "image/avif",
+    "GIF": "image/gif",
+    "BMP": "image/bmp",
+    "TIFF": "image/tiff",
+}
+
+# Lato maggiore (px) delle varianti delle immagini prodotto
+PRODUCT_IMAGE_MAX_DIMENSION = 1600
+PRODUCT_THUMBNAIL_MAX_DIMENSION = 400
+
+# Formati in ingresso che possono essere salvati così come sono
+WEB_EXTENSIONS = {
+    "PNG": "png",
+    "JPEG": "jpg",
+    "WEBP": "webp",
+    "AVIF": "avif",
+}
+
+
+def _encoder_available(pil_format: str) -> bool:
+    """Verifica che Pillow sia compilato con l'encoder richiesto"""
+    from PIL import features
+
+    feature = {"WEBP": "webp", "AVIF": "avif"}.get(pil_format)
+    return feature is None or bool(features.check(feature))
+
+
+def transcode_image(image_bytes: bytes, max_dimension: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Transcodifica un'immagine nel formato di output configurato
+
+    Funzione sincrona e CPU-bound: dal codice async va eseguita in un executor.
+
+    Args:
+        image_bytes: Bytes dell'immagine (es: così come restituiti dal modello)
+        max_dimension: Se indicato, ridimensiona mantenendo le proporzioni
+            in modo che il lato maggiore non superi questo valore
+
+    Returns:
+        Dict con 'data', 'mime_type', 'extension', 'width', 'height',
+        'byte_size', 'source_format', 'source_byte_size'
+    """
+    from PIL import Image
+
+    with Image.open(io.BytesIO(image_bytes)) as image:
+        source_format = image.format or "UNKNOWN"
+        image.load()
+        resized = False
+        if max_dimension and max(image.size) > max_dimension:
+            image.thumbnail((max_dimension, max_dimension), Image.Resampling.LANCZOS)
+            resized = True
+        width, height = image.size
+
+        target = (settings.GENERATED_IMAGE_FORMAT or "webp").lower()
+        if target not in OUTPUT_FORMATS:
+            logger.warning(f"⚠️ Formato output '{target}' non supportato, uso jpeg")
+            target = "jpeg"
+
+        pil_format, mime_type, extension = OUTPUT_FORMATS[target]
+        if not _encoder_available(pil_format):
+            logger.warning(f"⚠️ Encoder {pil_format} non disponibile in Pillow, uso jpeg")
+            pil_format, mime_type, extension = OUTPUT_FORMATS["jpeg"]
+
+        # JPEG non supporta trasparenza: appiattisci su sfondo bianco
+        if pil_format == "JPEG" and image.mode not in ("RGB", "L"):
+            rgba = image.convert("RGBA")
+            flattened = Image.new("RGB", rgba.size, (255, 255, 255))
+            flattened.paste(rgba, mask=rgba.getchannel("A"))
+            image_to_save = flattened
+        elif image.mode not in ("RGB", "RGBA", "L"):
+            image_to_save = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+        else:
+            image_to_save = image
+
+        save_options = {"quality": settings.GENERATED_IMAGE_QUALITY}
+        if pil_format == "JPEG":
+            save_options.update({"optimize": True, "progressive": True})
+        elif pil_format == "WEBP":
+            save_options["method"] = 4
+
+        output = io.BytesIO()
+        image_to_save.save(output, format=pil_format, **save_options)
+        data = output.getvalue()
+
+    # Se la transcodifica non riduce la dimensione, mantieni l'originale
+    # (purché sia già in un formato adatto al web) con il MIME type corretto
+    if not resized and len(data) >= len(image_bytes) and source_format in WEB_EXTENSIONS:
+        data = image_bytes
+        mime_type = INPUT_MIME_TYPES[source_format]
+        extension = WEB_EXTENSIONS[source_format]
+
+    return {
+        "data": data,
+        "mime_type": mime_type,
+        "extension": extension,
+        "width": width,
+        "height": height,
+        "byte_size": len(data),
+        "source_format": INPUT_MIME_TYPES.get(source_format, source_format.lower()),
+        "source_byte_size": len(image_bytes),
+    }
+
+
+def make_product_derivatives(image_bytes: bytes) -> Dict[str, Dict[str, Any]]:
+    """
+    Genera le varianti di un'immagine prodotto: 'main' per il dettaglio e
+    'thumbnail' per liste e gallerie (stesso formato di output di transcode_image)
+    """
+    return {
+        "main": transcode_image(image_bytes, max_dimension=PRODUCT_IMAGE_MAX_DIMENSION),
+        "thumbnail": transcode_image(image_bytes, max_dimension=PRODUCT_THUMBNAIL_MAX_DIMENSION),
+    }
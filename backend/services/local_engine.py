@@ -0,0 +1,176 @@
+"""
+Motore di generazione locale (senza rete né API key) per test di carico e benchmark
+
+Compone con PIL le immagini in input (foto cliente a sinistra, prodotti in
+griglia a destra) su uno sfondo che dipende da prompt e scenario, attende una
+latenza configurabile per simulare il modello e salva il risultato su Storage
+come gli altri backend. A parità di input l'immagine è sempre la stessa.
+
+Abilitato con LOCAL_ENGINE_ENABLED=true e selezionato con AI_BACKEND=local.
+"""
+import asyncio
+import hashlib
+import io
+import logging
+import random
+from typing import Any, Dict, List, Optional
+from uuid import uuid4
+
+from PIL import Image, ImageDraw, ImageOps
+
+from backend.config import settings
+from backend.services.generation_backends import BackendCapabilities, ImageGenerationBackend, register_backend
+from backend.services.image_processing import transcode_image
+from backend.utils.instrumentation import instrumented_async_client
+from backend.utils.retry import storage_retry_policy
+from backend.utils.timing import stage
+
+logger = logging.getLogger(__name__)
+
+
+class LocalEngineError(Exception):
+    """Errore simulato (LOCAL_ENGINE_FAILURE_RATE): si comporta come un 503 del provider"""
+    status_code = 503
+
+
+def _digest(*parts: Optional[str]) -> bytes:
+    return hashlib.sha256("\x1f".join(p or "" for p in parts).encode("utf-8")).digest()
+
+
+def _synthetic_tile(url: str, size: int) -> Image.Image:
+    """Immagine sostitutiva deterministica per un URL (colore e bande dall'hash)"""
+    digest = _digest(url)
+    tile = Image.new("RGB", (size, size), tuple(digest[:3]))
+    draw = ImageDraw.Draw(tile)
+    stripe = max(4, size // 8)
+    for i in range(0, size, stripe * 2):
+        draw.rectangle([i, 0, i + stripe - 1, size], fill=tuple(digest[3:6]))
+    return tile
+
+
+def compose_image(
+    customer_images: List[Image.Image],
+    product_images: List[Image.Image],
+    prompt: Optional[str],
+    scenario: Optional[str],
+    size: int,
+) -> bytes:
+    """Composizione PNG: foto cliente impilate a sinistra, prodotti in griglia a destra"""
+    canvas = Image.new("RGB", (size, size), tuple(_digest(prompt, scenario)[:3]))
+    left_width = size * 3 // 5
+
+    if customer_images:
+        cell = size // len(customer_images)
+        for idx, img in enumerate(customer_images):
+            fitted = ImageOps.fit(img.convert("RGB"), (left_width, cell))
+            canvas.paste(fitted, (0, idx * cell))
+
+    if product_images:
+        columns = 2 if len(product_images) > 1 else 1
+        rows = -(-len(product_images) // columns)
+        cell_w = (size - left_width) // columns
+        cell_h = size // rows
+        for idx, img in enumerate(product_images):
+            fitted = ImageOps.fit(img.convert("RGB"), (cell_w, cell_h))
+            canvas.paste(fitted, (left_width + (idx % columns) * cell_w, (idx // columns) * cell_h))
+
+    buffer = io.BytesIO()
+    canvas.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+class LocalImageEngine(ImageGenerationBackend):
+    """Backend locale deterministico basato su PIL"""
+
+    name = "local"
+    capabilities = BackendCapabilities(max_customer_photos=3, max_product_images=10, requires_network=False)
+
+    def is_configured(self) -> bool:
+        return settings.LOCAL_ENGINE_ENABLED
+
+    async def _load_images(self, urls: List[str], tile_size: int) -> List[Image.Image]:
+        if not settings.LOCAL_ENGINE_FETCH_IMAGES:
+            return [_synthetic_tile(url, tile_size) for url in urls]
+
+        images = []
+        async with instrumented_async_client("image_download", timeout=30.0) as client:
+            for url in urls:
+                try:
+                    response = await client.get(url)
+                    response.raise_for_status()
+                    images.append(Image.open(io.BytesIO(response.content)))
+                except Exception as e:
+                    logger.warning(f"⚠️ Motore locale: immagine {url[:50]} non scaricata ({e}), uso un sostituto")
+                    images.append(_synthetic_tile(url, tile_size))
+        return images
+
+    def _latency(self, digest: bytes) -> float:
+        # Latenza base +/- jitter, deterministica a parità di input
+        base = settings.LOCAL_ENGINE_LATENCY_MS / 1000
+        jitter = settings.LOCAL_ENGINE_LATENCY_JITTER
+        unit = int.from_bytes(digest[6:8], "big") / 0xFFFF
+        return max(0.0, base * (1 + jitter * (2 * unit - 1)))
+
+    async def generate(self, customer_photo_urls, product_image_urls, prompt=None, scenario=None, product_names=None):
+        customer_photo_urls, product_image_urls, product_names = self.fit_inputs(
+            customer_photo_urls, product_image_urls, product_names
+        )
+        size = settings.LOCAL_ENGINE_IMAGE_SIZE
+        digest = _digest(prompt, scenario, *customer_photo_urls, *product_image_urls)
+
+        with stage("download", "motore locale"):
+            customer_images = await self._load_images(customer_photo_urls, size // 2)
+            product_images = await self._load_images(product_image_urls, size // 4)
+
+        async with self.breaker.guard():
+            with stage("model_call", self.name):
+                # Latenza simulata del modello (ed eventuale errore simulato)
+                await asyncio.sleep(self._latency(digest))
+                if settings.LOCAL_ENGINE_FAILURE_RATE and random.random() < settings.LOCAL_ENGINE_FAILURE_RATE:
+                    raise LocalEngineError("Errore simulato del motore locale")
+
+                loop = asyncio.get_event_loop()
+                png_bytes = await loop.run_in_executor(
+                    None, compose_image, customer_images, product_images, prompt, scenario, size
+                )
+
+        saved_image = await self._save(png_bytes)
+        return {
+            "image_url": saved_image["image_url"],
+            "status": "completed",
+            "ai_service": self.name,
+            "image_metadata": saved_image["metadata"]
+        }
+
+    async def _save(self, png_bytes: bytes) -> Dict[str, Any]:
+        """Transcodifica e salva su Storage come le immagini generate dai modelli"""
+        from backend.database import get_supabase_admin
+
+        loop = asyncio.get_event_loop()
+        with stage("transcode"):
+            processed = await loop.run_in_executor(None, transcode_image, png_bytes)
+        file_name = f"generated/{uuid4()}.{processed['extension']}"
+        bucket_name = "generated-images"
+        supabase_admin = get_supabase_admin()
+
+        def upload():
+            supabase_admin.storage.from_(bucket_name).upload(
+                file_name,
+                processed["data"],
+                file_options={"content-type": processed["mime_type"], "upsert": "true"}
+            )
+
+        with stage("upload", bucket_name):
+            await storage_retry_policy.run_in_executor(upload)
+        return {
+            "image_url": supabase_admin.storage.from_(bucket_name).get_public_url(file_name),
+            "metadata": {
+                "mime_type": processed["mime_type"],
+                "width": processed["width"],
+                "height": processed["height"],
+                "byte_size": processed["byte_size"]
+            }
+        }
+
+
+local_engine = register_backend(LocalImageEngine())
@@ -0,0 +1,229 @@
+"""
+Template dei prompt per la generazione immagini
+
+I testi fissi dei prompt sono compilati una volta sola all'import: i pezzi
+costanti sono stringhe già concatenate e le regole di enfasi per categoria
+(scarpe, giacche, pantaloni) sono un'unica regex con tabella parola chiave ->
+regola, così ogni nome prodotto viene scansionato una sola volta.
+
+I prompt costruiti sono memoizzati: a parità di input (e di versione dei
+template) il testo è identico. Modificando i testi va incrementato
+PROMPT_TEMPLATE_VERSION, che fa parte della chiave di cache ed è riportato nei log.
+"""
+import re
+from functools import lru_cache
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+# Versione dei template: da incrementare a ogni modifica dei testi
+PROMPT_TEMPLATE_VERSION = "1"
+
+# Dimensione delle cache dei prompt costruiti
+PROMPT_CACHE_SIZE = 512
+
+# --- Prompt scenario (AIService.build_prompt) -----------------------------------
+
+# Prompt base che enfatizza l'uso delle foto del cliente
+# IMPORTANTE: Le foto cliente vengono passate come {image1}, {image2}, {image3}
+# e devono essere utilizzate per mantenere il volto e la forma fisica della persona
+SCENE_BASE = "Immagine professionale che ritrae fedelmente la persona dalle foto cliente fornite, mantenendo esattamente lo stesso volto, la stessa forma fisica e le stesse caratteristiche fisiche della persona nelle foto"
+
+SCENE_SUFFIX = ". IMPORTANTE: Il volto della persona deve essere identico a quello nelle foto cliente fornite. La forma fisica, l'altezza, la corporatura e tutte le caratteristiche fisiche devono corrispondere esattamente alle foto cliente. Gli articoli di abbigliamento devono essere indossati sulla persona reale dalle foto, non su una persona generica. Alta qualità, stile fotografia professionale con illuminazione e composizione appropriate. La persona deve essere chiaramente visibile e gli articoli devono essere ben indossati."
+
+# Campi di uno scenario dettagliato nell'ordine in cui entrano nel prompt: (campo, prefisso)
+SCENARIO_FIELDS = (
+    ("description", ""),
+    ("position", "posizione: "),
+    ("environment", "ambiente: "),
+    ("lighting", "illuminazione: "),
+    ("background", "sfondo: "),
+    ("custom_text", ""),
+)
+
+# Scenari semplici (retrocompatibilità con il parametro scenario)
+LEGACY_SCENARIOS = {
+    "montagna": "in un ambiente montano con neve e alberi, atmosfera invernale",
+    "spiaggia": "su una bellissima spiaggia con sabbia e oceano, atmosfera estiva",
+    "città": "in un ambiente urbano cittadino, architettura moderna",
+    "festa": "a una festa o celebrazione, atmosfera festosa",
+    "lavoro": "in un ambiente professionale d'ufficio",
+    "casual": "in un ambiente casual quotidiano",
+}
+
+# --- Prompt completo Banana Pro (BananaProService.generate_image) ------------------
+
+FULL_PROMPT_HEAD = (
+    "CRITICO: L'immagine generata DEVE mostrare la STESSA PERSONA delle foto cliente fornite. "
+    "Immagine professionale che ritrae "
+)
+
+FULL_PROMPT_REQUIREMENTS = (
+    "REQUISITI OBBLIGATORI PER IL VOLTO E LA FORMA FISICA: "
+    "1. Il volto della persona nell'immagine generata DEVE essere IDENTICO al volto nelle foto cliente fornite. "
+    "2. La forma fisica, l'altezza, la corporatura e tutte le caratteristiche fisiche DEBBONO corrispondere esattamente alle foto cliente. "
+    "3. La persona nell'immagine generata DEVE essere la STESSA persona delle foto cliente, NON una persona generica o diversa. "
+    "REQUISITI OBBLIGATORI PER I PRODOTTI: "
+    "4. TUTTI gli articoli di abbigliamento dalle immagini prodotto fornite DEBBONO essere chiaramente visibili e indossati nella persona. "
+    "5. NESSUN prodotto può essere omesso, nascosto o parzialmente visibile. Ogni prodotto deve essere completamente visibile e riconoscibile. "
+    "6. Se ci sono più prodotti (es: giacca, pantaloni, scarpe), TUTTI devono essere presenti e completamente visibili nell'immagine generata. "
+    "7. Gli articoli di abbigliamento devono essere indossati sulla persona reale dalle foto cliente, non su una persona diversa. "
+    "8. Le scarpe devono essere chiaramente visibili ai piedi della persona. "
+    "9. Le giacche o capi superiori devono essere chiaramente visibili sul busto della persona. "
+    "10. I pantaloni devono essere chiaramente visibili sulle gambe della persona. "
+)
+
+FULL_PROMPT_TAIL = (
+    " "
+    "Il volto deve essere fedele alla foto così come la forma fisica. "
+    "TUTTI i prodotti devono essere chiaramente visibili e ben indossati. "
+    "L'immagine deve essere di alta qualità, stile fotografia professionale con illuminazione e composizione appropriate. "
+    "La persona deve essere chiaramente visibile e TUTTI gli articoli devono essere ben indossati sulla persona reale dalle foto cliente."
+)
+
+# Regole di enfasi per categoria: (parole chiave nel nome prodotto, frase aggiunta al prompt).
+# L'ordine delle regole è l'ordine delle frasi nel prompt.
+EMPHASIS_RULES = (
+    (("scarpe", "shoe"), " Le scarpe DEBBONO essere chiaramente visibili ai piedi della persona. "),
+    (("giacca", "jacket", "blazer"), " La giacca/blazer DEVE essere chiaramente visibile sul busto della persona. "),
+    (("pantaloni", "pants", "trousers"), " I pantaloni DEBBONO essere chiaramente visibili sulle gambe della persona. "),
+)
+
+# Tabella parola chiave -> indice regola e regex unica su tutte le parole chiave.
+# Il lookahead trova anche parole chiave sovrapposte, come il test "in" originale.
+_EMPHASIS_INDEX = {
+    keyword: rule_idx
+    for rule_idx, (keywords, _) in enumerate(EMPHASIS_RULES)
+    for keyword in keywords
+}
+_EMPHASIS_PATTERN = re.compile(
+    "(?=(" + "|".join(re.escape(k) for k in sorted(_EMPHASIS_INDEX, key=len, reverse=True)) + "))"
+)
+
+
+def _image_ref(index: int) -> str:
+    # Placeholder con graffe singole: le doppie graffe sarebbero testo letterale
+    return "{image" + str(index) + "}"
+
+
+def matched_emphasis_rules(product_names: Iterable[str]) -> List[int]:
+    """Indici (ordinati) delle regole di enfasi attivate dai nomi prodotto"""
+    matched = set()
+    for name in product_names:
+        for match in _EMPHASIS_PATTERN.finditer(name.lower()):
+            matched.add(_EMPHASIS_INDEX[match.group(1)])
+        if len(matched) == len(EMPHASIS_RULES):
+            break
+    return sorted(matched)
+
+
+def _scenario_key(scenario_detail: dict) -> Tuple[Optional[str], ...]:
+    """Chiave hashable di uno scenario: solo i campi che entrano nel prompt"""
+    return tuple(scenario_detail.get(field) or None for field, _ in SCENARIO_FIELDS)
+
+
+@lru_cache(maxsize=PROMPT_CACHE_SIZE)
+def _compile_scene_prompt(
+    version: str,
+    product_category: Optional[str],
+    product_style: Optional[str],
+    scenario: Optional[str],
+    scenarios: Tuple[Tuple[Optional[str], ...], ...],
+) -> str:
+    parts = [SCENE_BASE]
+    if product_category:
+        parts.append(f" con indossato {product_category}")
+    if product_style:
+        parts.append(f" in stile {product_style}")
+
+    if scenarios:
+        scenario_parts = []
+        for values in scenarios:
+            fields = [
+                prefix + value
+                for (_, prefix), value in zip(SCENARIO_FIELDS, values)
+                if value
+            ]
+            if fields:
+                scenario_parts.append(", ".join(fields))
+        if scenario_parts:
+            parts.append(". " + ". ".join(scenario_parts))
+    elif scenario and scenario.lower() in LEGACY_SCENARIOS:
+        parts.append(f". {LEGACY_SCENARIOS[scenario.lower()]}")
+
+    parts.append(SCENE_SUFFIX)
+    return "".join(parts)
+
+
+def build_scene_prompt(
+    product_category: Optional[str] = None,
+    product_style: Optional[str] = None,
+    scenario: Optional[str] = None,
+    scenario_details: Optional[Sequence[dict]] = None,
+) -> str:
+    """Prompt di scenario (vedi AIService.build_prompt), memoizzato sugli input"""
+    scenarios = tuple(_scenario_key(s) for s in scenario_details) if scenario_details else ()
+    return _compile_scene_prompt(PROMPT_TEMPLATE_VERSION, product_category, product_style, scenario, scenarios)
+
+
+@lru_cache(maxsize=PROMPT_CACHE_SIZE)
+def _compile_full_prompt(
+    version: str,
+    customer_count: int,
+    product_count: int,
+    product_names: Tuple[str, ...],
+    prompt: str,
+) -> str:
+    customer_refs = [_image_ref(i + 1) for i in range(customer_count)]
+    product_refs = [_image_ref(customer_count + 1 + i) for i in range(product_count)]
+
+    if customer_count == 1:
+        customer_part = "la persona dalla foto " + customer_refs[0] + " (USA QUESTA FOTO COME RIFERIMENTO PRINCIPALE PER IL VOLTO E LA FORMA FISICA)"
+    else:
+        customer_part = "la persona dalle foto " + ", ".join(customer_refs) + " (USA QUESTE FOTO COME RIFERIMENTO PRINCIPALE PER IL VOLTO E LA FORMA FISICA)"
+
+    # Ogni prodotto deve essere menzionato esplicitamente, per nome se disponibile
+    if product_names and len(product_names) == product_count:
+        if product_count == 1:
+            product_part = f"l'articolo '{product_names[0]}' come da immagine " + product_refs[0] + " (DEVE essere chiaramente visibile e indossato)"
+        else:
+            refs = ", ".join(f"'{name}' come da immagine {ref}" for ref, name in zip(product_refs, product_names))
+            product_part = f"TUTTI gli articoli di abbigliamento: {refs} (OGNI prodotto DEVE essere chiaramente visibile e indossato, nessun prodotto può essere omesso o nascosto)"
+    elif product_count == 1:
+        product_part = "TUTTI gli articoli di abbigliamento come da immagine " + product_refs[0] + " (DEVE essere chiaramente visibile e indossato)"
+    else:
+        refs = ", ".join(f"prodotto {idx} come da immagine {ref}" for idx, ref in enumerate(product_refs, 1))
+        product_part = f"TUTTI gli articoli di abbigliamento: {refs} (OGNI prodotto DEVE essere chiaramente visibile e indossato, nessun prodotto può essere omesso)"
+
+    products_list_text = ""
+    if product_names:
+        products_list_text = f" I prodotti che DEBBONO essere presenti e completamente visibili sono: {', '.join(product_names)}. "
+        products_list_text += "".join(EMPHASIS_RULES[idx][1] for idx in matched_emphasis_rules(product_names))
+
+    return (
+        FULL_PROMPT_HEAD
+        + customer_part + " con indossato " + product_part + ". "
+        + products_list_text
+        + FULL_PROMPT_REQUIREMENTS
+        + prompt
+        + FULL_PROMPT_TAIL
+    )
+
+
+def build_full_prompt(
+    customer_count: int,
+    product_count: int,
+    product_names: Optional[Sequence[str]],
+    prompt: str,
+) -> str:
+    """
+    Prompt completo per Banana Pro con i riferimenti {imageN} alle immagini
+
+    Le immagini sono passate nell'ordine: prima le foto cliente, poi i prodotti.
+    """
+    names = tuple(product_names) if product_names else ()
+    return _compile_full_prompt(PROMPT_TEMPLATE_VERSION, customer_count, product_count, names, prompt)
+
+
+def clear_prompt_cache():
+    """Svuota le cache dei prompt costruiti"""
+    _compile_scene_prompt.cache_clear()
+    _compile_full_prompt.cache_clear()
@@ -0,0 +1,158 @@
+"""
+Cache in-process degli scenario prompts per negozio
+
+Gli scenari cambiano raramente ma vengono letti a ogni generazione immagine:
+la cache tiene in memoria tutti gli scenari di un negozio, caricati con una
+sola query. Le route di scenario_prompts aggiornano la cache a ogni scrittura
+(write-through); un TTL limita comunque la durata delle voci, perché con più
+worker le scritture fatte da un processo non sono visibili nella cache degli
+altri. Per questo la lista CRUD degli scenari legge sempre dal database: la
+cache serve solo il percorso di generazione.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+from backend.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def load_scenarios(supabase, shop_ids: List[str]) -> List[dict]:
+    """Scenari dei negozi letti dal database con una sola query"""
+    query = supabase.table("scenario_prompts").select("*")
+    if len(shop_ids) == 1:
+        query = query.eq("shop_id", shop_ids[0])
+    else:
+        query = query.in_("shop_id", shop_ids)
+    return query.execute().data or []
+
+
+class ScenarioPromptCache:
+    """Scenari per negozio: shop_id -> {scenario_id: riga scenario_prompts}"""
+
+    def __init__(self, max_shops: int = 1000):
+        self.max_shops = max_shops
+        # shop_id -> (scenari per id, scadenza in time.monotonic())
+        self._shops: "OrderedDict[str, Tuple[Dict[str, dict], float]]" = OrderedDict()
+        # Contatore per negozio incrementato a ogni scrittura: un caricamento
+        # iniziato prima di una scrittura non sovrascrive la cache con dati vecchi.
+        # Serve solo per i negozi in cache o in caricamento (_loading): le altre
+        # voci vengono rimosse, così il dizionario non cresce senza limite
+        self._generations: Dict[str, int] = {}
+        self._loading: Dict[str, int] = {}  # shop_id -> caricamenti in corso
+        self._lock = threading.Lock()
+
+    def _bump(self, shop_id: str) -> None:
+        # Senza voce in cache né caricamenti in corso non c'è nulla da rendere obsoleto
+        if shop_id in self._shops or shop_id in self._loading:
+            self._generations[shop_id] = self._generations.get(shop_id, 0) + 1
+
+    def _forget(self, shop_id: str) -> None:
+        if shop_id not in self._shops and shop_id not in self._loading:
+            self._generations.pop(shop_id, None)
+
+    def _end_loading(self, shop_ids: List[str]) -> None:
+        for shop_id in shop_ids:
+            remaining = self._loading.get(shop_id, 0) - 1
+            if remaining > 0:
+                self._loading[shop_id] = remaining
+            else:
+                self._loading.pop(shop_id, None)
+                self._forget(shop_id)
+
+    def _cached(self, shop_id: str, now: float) -> Optional[Dict[str, dict]]:
+        entry = self._shops.get(shop_id)
+        if entry and entry[1] > now:
+            self._shops.move_to_end(shop_id)
+            return entry[0]
+        return None
+
+    def get_shops_scenarios(self, supabase, shop_ids: Iterable[str]) -> Dict[str, Dict[str, dict]]:
+        """
+        Scenari dei negozi richiesti (shop_id -> {scenario_id: scenario})
+
+        I negozi non in cache vengono caricati con una sola query.
+        """
+        now = time.monotonic()
+        result: Dict[str, Dict[str, dict]] = {}
+        missing: List[str] = []
+
+        with self._lock:
+            for shop_id in dict.fromkeys(str(s) for s in shop_ids):
+                cached = self._cached(shop_id, now)
+                if cached is not None:
+                    result[shop_id] = cached
+                else:
+                    missing.append(shop_id)
+            generations = {shop_id: self._generations.get(shop_id, 0) for shop_id in missing}
+            for shop_id in missing:
+                self._loading[shop_id] = self._loading.get(shop_id, 0) + 1
+
+        if not missing:
+            return result
+
+        try:
+            rows = load_scenarios(supabase, missing)
+        except Exception:
+            with self._lock:
+                self._end_loading(missing)
+            raise
+
+        loaded: Dict[str, Dict[str, dict]] = {shop_id: {} for shop_id in missing}
+        for row in rows:
+            loaded.setdefault(str(row["shop_id"]), {})[str(row["id"])] = row
+
+        expires_at = time.monotonic() + settings.SCENARIO_CACHE_TTL
+        with self._lock:
+            for shop_id, scenarios in loaded.items():
+                if self._generations.get(shop_id, 0) == generations.get(shop_id, 0):
+                    self._shops[shop_id] = (scenarios, expires_at)
+                    self._shops.move_to_end(shop_id)
+            self._end_loading(missing)
+            while len(self._shops) > self.max_shops:
+                evicted, _ = self._shops.popitem(last=False)
+                self._forget(evicted)
+
+        logger.debug(f"Scenari caricati per {len(missing)} negozi ({len(rows)} scenari)")
+        result.update(loaded)
+        return result
+
+    def get_shop_scenarios(self, supabase, shop_id) -> Dict[str, dict]:
+        """Scenari di un negozio (scenario_id -> scenario)"""
+        return self.get_shops_scenarios(supabase, [str(shop_id)])[str(shop_id)]
+
+    def store(self, scenario: dict) -> None:
+        """Write-through dopo creazione/aggiornamento di uno scenario"""
+        shop_id = str(scenario["shop_id"])
+        with self._lock:
+            self._bump(shop_id)
+            entry = self._shops.get(shop_id)
+            if entry:
+                # Copia: le letture in corso continuano a vedere il dizionario precedente
+                scenarios = dict(entry[0])
+                scenarios[str(scenario["id"])] = scenario
+                self._shops[shop_id] = (scenarios, entry[1])
+
+    def remove(self, shop_id, scenario_id) -> None:
+        """Write-through dopo eliminazione di uno scenario"""
+        shop_id = str(shop_id)
+        with self._lock:
+            self._bump(shop_id)
+            entry = self._shops.get(shop_id)
+            if entry:
+                scenarios = {k: v for k, v in entry[0].items() if k != str(scenario_id)}
+                self._shops[shop_id] = (scenarios, entry[1])
+
+    def invalidate(self, shop_id=None) -> None:
+        """Rimuove dalla cache un negozio (o tutti se shop_id è None)"""
+        with self._lock:
+            shop_ids = list(self._shops) + list(self._loading) if shop_id is None else [str(shop_id)]
+            for key in dict.fromkeys(shop_ids):
+                self._bump(key)
+                self._shops.pop(key, None)
+                self._forget(key)
+
+
+scenario_prompt_cache = ScenarioPromptCache()
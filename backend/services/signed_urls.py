@@ -0,0 +1,147 @@
+"""
+Servizio per URL firmati dei bucket Storage privati
+Firma in batch con l'API bulk di Supabase Storage e mantiene in cache gli URL
+firmati fino a poco prima della scadenza, così le liste non fanno una chiamata
+Storage per ogni riga
+"""
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import unquote
+from backend.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class SignedUrlService:
+    """Firma e mette in cache gli URL degli oggetti nei bucket privati"""
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        # (bucket, path) -> (signed_url, scadenza in time.monotonic())
+        self._cache: "OrderedDict[Tuple[str, str], Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def is_private(self, bucket: str) -> bool:
+        """True se il bucket è configurato come privato"""
+        return bucket in settings.get_private_storage_buckets()
+
+    @staticmethod
+    def extract_path(bucket: str, url_or_path: Optional[str]) -> Optional[str]:
+        """
+        Ricava il path dell'oggetto nel bucket da un URL pubblico o firmato
+        (formato get_public_url / create_signed_url) oppure da un path già relativo
+        """
+        if not url_or_path or not isinstance(url_or_path, str):
+            return None
+        if not url_or_path.startswith(("http://", "https://")):
+            return url_or_path.lstrip("/")
+        for marker in (f"/object/public/{bucket}/", f"/object/sign/{bucket}/"):
+            if marker in url_or_path:
+                path = url_or_path.split(marker, 1)[1].split("?", 1)[0]
+                return unquote(path)
+        # URL esterno (placeholder, CDN, ...): non appartiene al bucket
+        return None
+
+    async def sign_paths(self, bucket: str, paths: List[str]) -> Dict[str, str]:
+        """
+        Restituisce gli URL firmati per i path richiesti
+
+        I path già in cache e non in scadenza vengono serviti dalla cache,
+        gli altri vengono firmati con una sola chiamata bulk, eseguita fuori
+        dall'event loop (il client Storage è sincrono). Se la firma fallisce i
+        path mancanti non sono nel risultato: i chiamanti servono l'URL salvato.
+        """
+        now = time.monotonic()
+        signed: Dict[str, str] = {}
+        missing: List[str] = []
+
+        with self._lock:
+            for path in dict.fromkeys(paths):
+                cached = self._cache.get((bucket, path))
+                if cached and cached[1] > now:
+                    self._cache.move_to_end((bucket, path))
+                    signed[path] = cached[0]
+                else:
+                    missing.append(path)
+
+        if missing:
+            loop = asyncio.get_running_loop()
+            signed.update(await loop.run_in_executor(None, self._sign_missing, bucket, missing))
+        return signed
+
+    def _sign_missing(self, bucket: str, missing: List[str]) -> Dict[str, str]:
+        """Firma bulk dei path non in cache (bloccante: eseguita nel thread pool)"""
+        from backend.database import get_supabase_admin
+
+        ttl = settings.SIGNED_URL_TTL
+        # Considera l'URL scaduto con un margine di sicurezza, così il client
+        # non riceve mai un URL che scade mentre scarica l'immagine
+        valid_for = max(ttl - settings.SIGNED_URL_REFRESH_MARGIN, 0)
+        try:
+            response = get_supabase_admin().storage.from_(bucket).create_signed_urls(missing, ttl)
+        except Exception as e:
+            # Storage non disponibile: meglio l'URL salvato che un 500 sull'intera lista
+            logger.warning(f"⚠️ Firma URL fallita per {len(missing)} oggetti in {bucket}, uso gli URL salvati: {e}")
+            return {}
+
+        signed: Dict[str, str] = {}
+        expires_at = time.monotonic() + valid_for
+        with self._lock:
+            for item in response:
+                if item.get("error") or not item.get("signedURL"):
+                    logger.warning(f"⚠️ Firma URL fallita per {bucket}/{item.get('path')}: {item.get('error')}")
+                    continue
+                path = item["path"]
+                signed[path] = item["signedURL"]
+                self._cache[(bucket, path)] = (item["signedURL"], expires_at)
+                self._cache.move_to_end((bucket, path))
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+
+        return signed
+
+    async def resolve_url(self, bucket: str, url: Optional[str]) -> Optional[str]:
+        """Restituisce l'URL da servire al client per un singolo oggetto"""
+        if not url or not self.is_private(bucket):
+            return url
+        path = self.extract_path(bucket, url)
+        if not path:
+            return url
+        return (await self.sign_paths(bucket, [path])).get(path, url)
+
+    async def resolve_urls(self, bucket: str, urls: List[str]) -> List[str]:
+        """Come resolve_url, ma per una lista di URL con una sola firma bulk"""
+        if not self.is_private(bucket):
+            return urls
+        paths = [self.extract_path(bucket, url) for url in urls]
+        signed = await self.sign_paths(bucket, [p for p in paths if p])
+        return [signed.get(path, url) if path else url for url, path in zip(urls, paths)]
+
+    async def sign_rows(self, bucket: str, rows: List[dict], field: str = "image_url") -> List[dict]:
+        """
+        Sostituisce in place il campo URL delle righe con URL firmati
+
+        Se il bucket non è privato le righe vengono restituite invariate.
+        """
+        if not rows or not self.is_private(bucket):
+            return rows
+        urls = [row.get(field) for row in rows]
+        resolved = await self.resolve_urls(bucket, urls)
+        for row, url in zip(rows, resolved):
+            if url is not None:
+                row[field] = url
+        return rows
+
+    def invalidate(self, bucket: str, url_or_path: Optional[str]) -> None:
+        """Rimuove dalla cache l'URL firmato di un oggetto (es: dopo eliminazione)"""
+        path = self.extract_path(bucket, url_or_path)
+        if path:
+            with self._lock:
+                self._cache.pop((bucket, path), None)
+
+
+signed_url_service = SignedUrlService()
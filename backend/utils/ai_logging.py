@@ -0,0 +1,78 @@
+"""
+Log della pipeline di generazione AI
+
+I servizi AI producono molto dettaglio (prompt completi, URL, dimensioni delle
+immagini, struttura delle risposte) utile in sviluppo ma costoso in
+produzione: ogni f-string viene formattata anche quando il livello la scarta.
+
+GenerationLog separa i messaggi di una generazione in due livelli:
+- info: tappe principali (inizio, immagine salvata), sempre a INFO
+- detail: dettaglio di debug, a DEBUG; per una frazione delle generazioni
+  (AI_LOG_VERBOSE_SAMPLE_RATE) a INFO, così in produzione si vede il
+  dettaglio completo di un campione senza pagarlo per ogni richiesta
+
+I messaggi usano argomenti in stile %: la formattazione avviene solo se il
+record viene emesso. Per argomenti costosi da calcolare si usa lazy(...) o
+si controlla detail_enabled. I campi passati come keyword finiscono in
+extra={...} e quindi nel JSON con LOG_FORMAT=json.
+"""
+import logging
+import random
+from typing import Any, Callable
+
+from backend.config import settings
+
+
+class lazy:
+    """Argomento di log calcolato solo se il messaggio viene formattato"""
+
+    __slots__ = ("_fn",)
+
+    def __init__(self, fn: Callable[[], Any]):
+        self._fn = fn
+
+    def __str__(self) -> str:
+        return str(self._fn())
+
+    __repr__ = __str__
+
+
+class GenerationLog:
+    """Logger di una singola generazione (backend e campionamento del dettaglio)"""
+
+    __slots__ = ("logger", "backend", "verbose", "detail_level")
+
+    def __init__(self, logger: logging.Logger, backend: str):
+        self.logger = logger
+        self.backend = backend
+        rate = settings.AI_LOG_VERBOSE_SAMPLE_RATE
+        self.verbose = rate > 0 and random.random() < rate
+        self.detail_level = logging.INFO if self.verbose else logging.DEBUG
+
+    @property
+    def detail_enabled(self) -> bool:
+        """True se i messaggi di dettaglio vengono emessi (per evitare calcoli inutili)"""
+        return self.logger.isEnabledFor(self.detail_level)
+
+    def _log(self, level: int, msg: str, args: tuple, fields: dict) -> None:
+        if self.logger.isEnabledFor(level):
+            extra = {"backend": self.backend, **fields}
+            if self.verbose:
+                extra["verbose_sample"] = True
+            self.logger.log(level, msg, *args, extra=extra, stacklevel=3)
+
+    def info(self, msg: str, *args, **fields) -> None:
+        self._log(logging.INFO, msg, args, fields)
+
+    def detail(self, msg: str, *args, **fields) -> None:
+        self._log(self.detail_level, msg, args, fields)
+
+    def warning(self, msg: str, *args, **fields) -> None:
+        self._log(logging.WARNING, msg, args, fields)
+
+    def error(self, msg: str, *args, exc_info: bool = False, **fields) -> None:
+        if exc_info:
+            # Il traceback viene formattato solo se il record viene emesso
+            self.logger.error(msg, *args, exc_info=True, extra={"backend": self.backend, **fields}, stacklevel=2)
+            return
+        self._log(logging.ERROR, msg, args, fields)
@@ -0,0 +1,304 @@
+"""
+Strumentazione per le metriche Prometheus (vedi backend/utils/metrics.py)
+
+- instrument_supabase: avvolge il client Supabase e misura ogni query
+  PostgREST (tabella/funzione RPC, operazione, esito) e ogni chiamata Storage;
+  le registra anche nel QueryStats della richiesta (backend/utils/query_stats.py)
+- MetricsTransport / instrumented_async_client: client httpx che misura le
+  richieste in uscita (download immagini, API dei modelli)
+- InstrumentedThreadPoolExecutor: executor di default dell'event loop
+  (run_in_executor) con coda e thread occupati esportati come gauge; esegue le
+  funzioni nel contesto del chiamante (contextvar)
+- EventLoopMonitor: misura periodicamente il ritardo dell'event loop e lo
+  stato del thread pool anyio usato da route e dependency sincrone
+"""
+import asyncio
+import contextvars
+import hashlib
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Optional, Tuple
+
+import httpx
+
+from backend.utils.metrics import (
+    event_loop_lag_last_seconds,
+    event_loop_lag_seconds,
+    outbound_http_errors_total,
+    outbound_http_seconds,
+    supabase_query_seconds,
+    supabase_storage_seconds,
+    threadpool_busy_threads,
+    threadpool_queue_depth,
+    threadpool_wait_seconds,
+)
+from backend.utils.query_stats import current_query_stats
+
+logger = logging.getLogger(__name__)
+
+QUERY_OPERATIONS = {"select", "insert", "upsert", "update", "delete"}
+# Operazioni il cui primo argomento è il payload (non una colonna)
+PAYLOAD_OPERATIONS = {"insert", "upsert", "update"}
+# Metodi Storage senza chiamate HTTP: non misurati
+STORAGE_LOCAL_METHODS = {"get_public_url"}
+
+
+# --- Supabase ---
+
+def _query_keys(table: str, operation: str, calls: Tuple) -> Tuple[Tuple, Tuple]:
+    """Firma (filtri e valori) e forma (solo colonne) di una query per QueryStats"""
+    signature = []
+    shape = []
+    for name, args, kwargs in calls:
+        if (name in PAYLOAD_OPERATIONS or name == "rpc") and args:
+            # Payload e parametri RPC (es: nomi ed email dei clienti) non finiscono nei
+            # log: solo un digest, che basta a distinguere payload diversi
+            digest = hashlib.blake2b(repr(args[0]).encode(), digest_size=4).hexdigest()
+            values = (f"<payload {digest}>", *map(repr, args[1:]))
+        else:
+            values = tuple(map(repr, args))
+        signature.append((name, *values, *(f"{k}={v!r}" for k, v in kwargs.items())))
+        # Il primo argomento stringa è la colonna (eq, in_, order, select, ...)
+        if name not in PAYLOAD_OPERATIONS and args and isinstance(args[0], str):
+            shape.append((name, args[0]))
+        else:
+            shape.append((name,))
+    return (table, operation, tuple(signature)), (table, operation, tuple(shape))
+
+
+class _QueryProxy:
+    """Query builder PostgREST che misura execute() per tabella e operazione"""
+
+    __slots__ = ("_builder", "_table", "_operation", "_calls")
+
+    def __init__(self, builder: Any, table: str, operation: str = "select", calls: Tuple = ()):
+        self._builder = builder
+        self._table = table
+        self._operation = operation
+        self._calls = calls  # Metodi chiamati sul builder: (nome, args, kwargs)
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self._builder, name)
+        if not callable(attr):
+            return attr
+
+        def chained(*args, **kwargs):
+            result = attr(*args, **kwargs)
+            if hasattr(result, "execute"):
+                operation = name if name in QUERY_OPERATIONS else self._operation
+                return _QueryProxy(result, self._table, operation, self._calls + ((name, args, kwargs),))
+            return result
+
+        return chained
+
+    def execute(self, *args, **kwargs):
+        start = time.perf_counter()
+        outcome = "ok"
+        try:
+            return self._builder.execute(*args, **kwargs)
+        except Exception:
+            outcome = "error"
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            supabase_query_seconds.labels(
+                table=self._table, operation=self._operation, outcome=outcome
+            ).observe(elapsed)
+            stats = current_query_stats()
+            if stats is not None:
+                signature, shape = _query_keys(self._table, self._operation, self._calls)
+                stats.record_query(elapsed, signature, shape)
+
+
+class _BucketProxy:
+    """Bucket Storage che misura ogni chiamata (upload, download, create_signed_urls, ...)"""
+
+    __slots__ = ("_bucket", "_name")
+
+    def __init__(self, bucket: Any, name: str):
+        self._bucket = bucket
+        self._name = name
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self._bucket, name)
+        if not callable(attr) or name in STORAGE_LOCAL_METHODS:
+            return attr
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            outcome = "ok"
+            try:
+                return attr(*args, **kwargs)
+            except Exception:
+                outcome = "error"
+                raise
+            finally:
+                elapsed = time.perf_counter() - start
+                supabase_storage_seconds.labels(
+                    bucket=self._name, operation=name, outcome=outcome
+                ).observe(elapsed)
+                stats = current_query_stats()
+                if stats is not None:
+                    stats.record_storage(elapsed)
+
+        return timed
+
+
+class _StorageProxy:
+    __slots__ = ("_storage",)
+
+    def __init__(self, storage: Any):
+        self._storage = storage
+
+    def from_(self, bucket: str) -> _BucketProxy:
+        return _BucketProxy(self._storage.from_(bucket), bucket)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._storage, name)
+
+
+class InstrumentedSupabase:
+    """Client Supabase con metriche su query e Storage (stessa interfaccia del client)"""
+
+    def __init__(self, client: Any):
+        self._client = client
+
+    def table(self, table_name: str) -> _QueryProxy:
+        return _QueryProxy(self._client.table(table_name), table_name)
+
+    def from_(self, table_name: str) -> _QueryProxy:
+        return _QueryProxy(self._client.from_(table_name), table_name)
+
+    def rpc(self, fn: str, *args, **kwargs) -> _QueryProxy:
+        return _QueryProxy(self._client.rpc(fn, *args, **kwargs), fn, "rpc", (("rpc", args, kwargs),))
+
+    @property
+    def storage(self) -> _StorageProxy:
+        return _StorageProxy(self._client.storage)
+
+    def __getattr__(self, name: str) -> Any:
+        # auth, postgrest, functions, ... passano invariati
+        return getattr(self._client, name)
+
+
+def instrument_supabase(client: Any) -> InstrumentedSupabase:
+    """Avvolge un client Supabase per misurare query e chiamate Storage"""
+    if isinstance(client, InstrumentedSupabase):
+        return client
+    return InstrumentedSupabase(client)
+
+
+# --- HTTP in uscita ---
+
+def _status_class(status_code: int) -> str:
+    return f"{status_code // 100}xx"
+
+
+class MetricsTransport(httpx.AsyncBaseTransport):
+    """Transport httpx che misura le richieste in uscita (durata fino agli header della risposta)"""
+
+    def __init__(self, target: str, transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.target = target
+        self._transport = transport or httpx.AsyncHTTPTransport()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        start = time.perf_counter()
+        try:
+            response = await self._transport.handle_async_request(request)
+        except Exception as e:
+            outbound_http_seconds.labels(target=self.target, status="error").observe(time.perf_counter() - start)
+            outbound_http_errors_total.labels(target=self.target, reason=type(e).__name__).inc()
+            raise
+        outbound_http_seconds.labels(
+            target=self.target, status=_status_class(response.status_code)
+        ).observe(time.perf_counter() - start)
+        if response.status_code >= 400:
+            outbound_http_errors_total.labels(target=self.target, reason=str(response.status_code)).inc()
+        return response
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+
+def instrumented_async_client(target: str, **kwargs) -> httpx.AsyncClient:
+    """httpx.AsyncClient con metriche per destinazione (es: 'image_download', 'gemini_api')"""
+    return httpx.AsyncClient(transport=MetricsTransport(target), **kwargs)
+
+
+# --- Thread pool ed event loop ---
+
+class InstrumentedThreadPoolExecutor(ThreadPoolExecutor):
+    """ThreadPoolExecutor che esporta coda, thread occupati e attesa in coda e propaga il contesto"""
+
+    def __init__(self, *args, pool: str = "asyncio", **kwargs):
+        super().__init__(*args, **kwargs)
+        self._queue_depth = threadpool_queue_depth.labels(pool=pool)
+        self._busy = threadpool_busy_threads.labels(pool=pool)
+        self._wait = threadpool_wait_seconds.labels(pool=pool)
+
+    def submit(self, fn, /, *args, **kwargs):
+        queued_at = time.perf_counter()
+        self._queue_depth.inc()
+        # Come asyncio.to_thread: la funzione vede i contextvar del chiamante (QueryStats, timer)
+        context = contextvars.copy_context()
+
+        def run():
+            self._queue_depth.dec()
+            self._wait.observe(time.perf_counter() - queued_at)
+            self._busy.inc()
+            try:
+                return context.run(fn, *args, **kwargs)
+            finally:
+                self._busy.dec()
+
+        try:
+            return super().submit(run)
+        except BaseException:
+            self._queue_depth.dec()
+            raise
+
+
+class EventLoopMonitor:
+    """Task che misura il ritardo dell'event loop e lo stato del thread pool anyio"""
+
+    def __init__(self, interval: float = 0.5):
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def _sample_anyio(self) -> None:
+        try:
+            import anyio.to_thread
+            stats = anyio.to_thread.current_default_thread_limiter().statistics()
+        except Exception:  # pragma: no cover - anyio è una dipendenza di starlette
+            return
+        threadpool_queue_depth.labels(pool="anyio").set(stats.tasks_waiting)
+        threadpool_busy_threads.labels(pool="anyio").set(stats.borrowed_tokens)
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - start - self.interval)
+            event_loop_lag_seconds.observe(lag)
+            event_loop_lag_last_seconds.set(lag)
+            if lag > 1:
+                logger.warning(f"🐢 Event loop bloccato per {lag:.2f}s")
+            self._sample_anyio()
+
+
+event_loop_monitor = EventLoopMonitor()
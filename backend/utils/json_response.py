@@ -0,0 +1,116 @@
+"""
+Serializzazione JSON veloce per le risposte API
+
+FastJSONResponse usa orjson (se installato), che serializza nativamente UUID,
+datetime, date ed enum senza passare da jsonable_encoder. FastJSONRoute
+restituisce direttamente una FastJSONResponse per le route senza response_model,
+così FastAPI salta anche la conversione ricorsiva di jsonable_encoder, che sulle
+liste grandi costa più della serializzazione stessa.
+"""
+import functools
+import inspect
+import json
+from datetime import date, datetime, time
+from decimal import Decimal
+from enum import Enum
+from typing import Any
+from uuid import UUID
+
+from fastapi.routing import APIRoute
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson è opzionale
+    orjson = None
+
+
+def _default(value: Any) -> Any:
+    """Tipi non gestiti nativamente dal serializzatore JSON"""
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json")
+    if isinstance(value, Decimal):
+        # Stesso comportamento di jsonable_encoder
+        return int(value) if value.as_tuple().exponent >= 0 else float(value)
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    if isinstance(value, bytes):
+        return value.decode("utf-8")
+    # Usati solo senza orjson (che li gestisce nativamente)
+    if isinstance(value, UUID):
+        return str(value)
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    if isinstance(value, Enum):
+        return value.value
+    raise TypeError(f"Tipo non serializzabile in JSON: {type(value).__name__}")
+
+
+def dumps(content: Any) -> bytes:
+    """Serializza in JSON (bytes UTF-8) con orjson o, in mancanza, con json"""
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(
+        content,
+        default=_default,
+        ensure_ascii=False,
+        allow_nan=False,
+        separators=(",", ":"),
+    ).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """Risposta JSON serializzata con orjson (fallback: json della stdlib)"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+class FastJSONRoute(APIRoute):
+    """
+    Route che serializza direttamente dict e liste con FastJSONResponse
+
+    Vale solo per le route senza response_model: quelle con response_model
+    continuano a essere validate e serializzate da FastAPI/Pydantic.
+    Lo status_code dichiarato sul decoratore viene mantenuto.
+    """
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        response_model = kwargs.get("response_model")
+        has_response_model = response_model is not None and not _is_default_placeholder(response_model)
+        has_return_annotation = inspect.signature(endpoint).return_annotation is not inspect.Signature.empty
+        if not has_response_model and not has_return_annotation:
+            endpoint = _wrap_endpoint(endpoint, kwargs.get("status_code"))
+        super().__init__(path, endpoint, **kwargs)
+
+
+def _is_default_placeholder(value: Any) -> bool:
+    # fastapi.datastructures.DefaultPlaceholder: valore di default non impostato
+    return type(value).__name__ == "DefaultPlaceholder"
+
+
+def _wrap_endpoint(endpoint, status_code):
+    """Avvolge l'endpoint in modo che dict/list diventino subito una FastJSONResponse"""
+    if getattr(endpoint, "__fast_json__", False):
+        # Già avvolto (include_router ricrea le route con lo stesso endpoint)
+        return endpoint
+
+    status_code = status_code or 200
+
+    def to_response(result):
+        if isinstance(result, (dict, list)):
+            return FastJSONResponse(result, status_code=status_code)
+        return result
+
+    if inspect.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def wrapper(*args, **kwargs):
+            return to_response(await endpoint(*args, **kwargs))
+    else:
+        @functools.wraps(endpoint)
+        def wrapper(*args, **kwargs):
+            return to_response(endpoint(*args, **kwargs))
+
+    wrapper.__fast_json__ = True
+    return wrapper
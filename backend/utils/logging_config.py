@@ -0,0 +1,102 @@
+"""
+Configurazione del logging dell'applicazione
+
+LOG_FORMAT=text mantiene il formato testuale classico; LOG_FORMAT=json scrive
+una riga JSON per record con timestamp, livello, logger, messaggio e i campi
+strutturati passati con extra={...} (es: backend, immagini, durate).
+
+Ogni record riporta il request id della richiesta in corso (RequestIdFilter).
+Il root logger scrive su una coda (QueueHandler). Nel thread chiamante (anche
+l'event loop) QueueHandler.prepare unisce messaggio e argomenti e formatta
+l'eventuale traceback; formattazione finale (timestamp, JSON) e scrittura su
+stderr avvengono in un thread dedicato (QueueListener), così l'I/O dei log non
+blocca l'event loop. Per questo nei percorsi caldi si usa il logging lazy
+(backend/utils/ai_logging.py): i record sotto il livello attivo non arrivano
+nemmeno alla coda.
+"""
+import atexit
+import json
+import logging
+import queue
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, Optional
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson è opzionale
+    orjson = None
+
+from backend.config import settings
+from backend.utils.request_context import RequestIdFilter
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - [%(request_id)s] %(message)s'
+
+# Attributi standard di LogRecord: tutto il resto arriva da extra={...}
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "taskName"}
+
+
+class JsonFormatter(logging.Formatter):
+    """Una riga JSON per record, con i campi extra come chiavi di primo livello"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data: Dict[str, Any] = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                data[key] = value
+        if record.exc_info:
+            data["exc_info"] = self.formatException(record.exc_info)
+        # default=str: valori non serializzabili (UUID, oggetti arbitrari) come stringa
+        if orjson is not None:
+            return orjson.dumps(data, default=str).decode()
+        return json.dumps(data, default=str, ensure_ascii=False)
+
+
+def build_formatter() -> logging.Formatter:
+    if settings.LOG_FORMAT.lower() == "json":
+        return JsonFormatter()
+    return logging.Formatter(TEXT_FORMAT)
+
+
+_listener: Optional[QueueListener] = None
+
+
+def configure_logging() -> None:
+    """
+    Configura il root logger (livello da DEBUG, formato da LOG_FORMAT)
+
+    Come logging.basicConfig non fa nulla se il root logger ha già handler
+    (es: configurato da uno script di benchmark).
+    """
+    global _listener
+    root = logging.getLogger()
+    if root.handlers:
+        return
+
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(build_formatter())
+
+    # Il filtro gira nel thread che emette il record: legge il contextvar della richiesta
+    queue_handler = QueueHandler(queue.SimpleQueue())
+    queue_handler.addFilter(RequestIdFilter())
+
+    root.addHandler(queue_handler)
+    root.setLevel(logging.DEBUG if settings.DEBUG else logging.INFO)
+
+    _listener = QueueListener(queue_handler.queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    # Scrive i record ancora in coda all'uscita del processo
+    atexit.register(stop_logging)
+
+
+def stop_logging() -> None:
+    """Svuota la coda dei log e ferma il thread di scrittura"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
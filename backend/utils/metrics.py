@@ -0,0 +1,208 @@
+"""
+Metriche Prometheus dell'applicazione
+
+prometheus-client è opzionale: se non è installato le metriche sono oggetti
+inerti con la stessa interfaccia (labels/observe/inc/dec/set), così il codice
+strumentato non deve controllare la disponibilità della libreria.
+
+Con più worker uvicorn ogni processo ha le sue metriche: se la variabile
+PROMETHEUS_MULTIPROC_DIR è impostata (prima dell'avvio, su una directory vuota)
+prometheus-client scrive i valori su file condivisi e /metrics aggrega tutti i
+worker. I gauge usano le modalità "live*": contano solo i processi vivi.
+"""
+import glob
+import logging
+import os
+import re
+from typing import Optional, Sequence, Tuple
+
+try:
+    from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+    from prometheus_client import multiprocess
+    PROMETHEUS_AVAILABLE = True
+except ImportError:  # pragma: no cover - dipende dall'ambiente
+    PROMETHEUS_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Fasi della generazione: da millisecondi (query, prompt) a minuti (modello)
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+# Richieste HTTP: le generazioni AI arrivano a decine di secondi
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+# Query e chiamate HTTP in uscita
+QUERY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# Ritardo dell'event loop e attese nel thread pool
+LAG_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+
+class _NoopMetric:
+    """Metrica inerte usata quando prometheus-client non è installato"""
+
+    def labels(self, *args, **kwargs) -> "_NoopMetric":
+        return self
+
+    def observe(self, value: float) -> None:
+        pass
+
+    def inc(self, amount: float = 1) -> None:
+        pass
+
+    def dec(self, amount: float = 1) -> None:
+        pass
+
+    def set(self, value: float) -> None:
+        pass
+
+
+def _histogram(name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Optional[Sequence[float]] = None):
+    if not PROMETHEUS_AVAILABLE:
+        return _NoopMetric()
+    return Histogram(name, documentation, labelnames, buckets=buckets or Histogram.DEFAULT_BUCKETS)
+
+
+def _counter(name: str, documentation: str, labelnames: Sequence[str] = ()):
+    if not PROMETHEUS_AVAILABLE:
+        return _NoopMetric()
+    return Counter(name, documentation, labelnames)
+
+
+def _gauge(name: str, documentation: str, labelnames: Sequence[str] = (), multiprocess_mode: str = "livesum"):
+    if not PROMETHEUS_AVAILABLE:
+        return _NoopMetric()
+    return Gauge(name, documentation, labelnames, multiprocess_mode=multiprocess_mode)
+
+
+if not PROMETHEUS_AVAILABLE:
+    logger.info("prometheus-client non installato: metriche disabilitate")
+
+
+# --- Pipeline di generazione (vedi backend/utils/timing.py) ---
+generation_stage_seconds = _histogram(
+    "generation_stage_seconds",
+    "Durata delle fasi di generazione immagini (query, download, decodifica, prompt, modello, upload, ...)",
+    ["stage", "backend"],
+    buckets=STAGE_BUCKETS,
+)
+
+# --- Richieste HTTP in ingresso (MetricsMiddleware) ---
+http_request_duration_seconds = _histogram(
+    "http_request_duration_seconds",
+    "Durata delle richieste HTTP per route (template del path), metodo e status",
+    ["method", "route", "status"],
+    buckets=REQUEST_BUCKETS,
+)
+http_requests_in_flight = _gauge(
+    "http_requests_in_flight",
+    "Richieste HTTP in corso per metodo",
+    ["method"],
+)
+
+# --- Supabase (backend/utils/instrumentation.py) ---
+supabase_query_seconds = _histogram(
+    "supabase_query_seconds",
+    "Durata delle query PostgREST per tabella (o funzione RPC), operazione ed esito",
+    ["table", "operation", "outcome"],
+    buckets=QUERY_BUCKETS,
+)
+supabase_storage_seconds = _histogram(
+    "supabase_storage_seconds",
+    "Durata delle chiamate a Supabase Storage per bucket, operazione ed esito",
+    ["bucket", "operation", "outcome"],
+    buckets=QUERY_BUCKETS,
+)
+
+# --- Chiamate HTTP in uscita e modelli AI ---
+outbound_http_seconds = _histogram(
+    "outbound_http_seconds",
+    "Durata delle richieste HTTP in uscita (fino agli header della risposta) per destinazione e status",
+    ["target", "status"],
+    buckets=STAGE_BUCKETS,
+)
+outbound_http_errors_total = _counter(
+    "outbound_http_errors_total",
+    "Richieste HTTP in uscita fallite (status >= 400 o errore di rete) per destinazione e motivo",
+    ["target", "reason"],
+)
+ai_model_call_seconds = _histogram(
+    "ai_model_call_seconds",
+    "Durata delle chiamate ai modelli AI per backend ed esito (ok, error, client_error, cancelled)",
+    ["backend", "outcome"],
+    buckets=STAGE_BUCKETS,
+)
+ai_model_calls_rejected_total = _counter(
+    "ai_model_calls_rejected_total",
+    "Chiamate ai modelli AI rifiutate dal circuit breaker (circuito aperto)",
+    ["backend"],
+)
+
+# --- Event loop e thread pool ---
+event_loop_lag_seconds = _histogram(
+    "event_loop_lag_seconds",
+    "Ritardo dell'event loop (quanto arriva in ritardo un timer)",
+    buckets=LAG_BUCKETS,
+)
+event_loop_lag_last_seconds = _gauge(
+    "event_loop_lag_last_seconds",
+    "Ultimo ritardo misurato dell'event loop (massimo tra i worker)",
+    multiprocess_mode="livemax",
+)
+threadpool_queue_depth = _gauge(
+    "threadpool_queue_depth",
+    "Funzioni in attesa di un thread libero (asyncio: run_in_executor, anyio: route e dependency sincrone)",
+    ["pool"],
+)
+threadpool_busy_threads = _gauge(
+    "threadpool_busy_threads",
+    "Thread occupati del pool",
+    ["pool"],
+)
+threadpool_wait_seconds = _histogram(
+    "threadpool_wait_seconds",
+    "Attesa in coda prima che una funzione ottenga un thread (solo pool asyncio)",
+    ["pool"],
+    buckets=LAG_BUCKETS,
+)
+
+
+def multiprocess_dir() -> Optional[str]:
+    """Directory delle metriche condivise tra worker (None in modalità singolo processo)"""
+    return os.environ.get("PROMETHEUS_MULTIPROC_DIR") or os.environ.get("prometheus_multiproc_dir")
+
+
+def cleanup_dead_processes() -> int:
+    """
+    Rimuove i gauge "live" dei worker terminati (es: riavviati da uvicorn)
+
+    Da chiamare all'avvio di ogni worker; restituisce il numero di processi rimossi.
+    """
+    directory = multiprocess_dir()
+    if not PROMETHEUS_AVAILABLE or not directory:
+        return 0
+    pids = set()
+    for path in glob.glob(os.path.join(directory, "gauge_live*.db")):
+        match = re.search(r"_(\d+)\.db$", path)
+        if match:
+            pids.add(int(match.group(1)))
+    removed = 0
+    for pid in pids:
+        if pid == os.getpid():
+            continue
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            multiprocess.mark_process_dead(pid, directory)
+            removed += 1
+        except PermissionError:
+            pass  # Processo vivo di un altro utente
+    return removed
+
+
+def render_metrics() -> Tuple[bytes, str]:
+    """Metriche in formato testo Prometheus (aggregate tra i worker se multiprocess)"""
+    if not PROMETHEUS_AVAILABLE:
+        raise RuntimeError("prometheus-client non installato")
+    if multiprocess_dir():
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
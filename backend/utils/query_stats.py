@@ -0,0 +1,94 @@
+"""
+Conteggio delle query Supabase per richiesta
+
+QueryStatsMiddleware crea un QueryStats per richiesta e lo rende corrente
+(contextvar); il client Supabase strumentato (backend/utils/instrumentation.py)
+registra ogni query e chiamata Storage nel QueryStats corrente. Fuori da una
+richiesta (startup, script) non viene registrato nulla.
+
+Le route sincrone girano nel thread pool anyio, che copia il contesto: il
+QueryStats è lo stesso oggetto, quindi le query eseguite lì vengono contate.
+Per run_in_executor il contesto è copiato dall'executor di default installato
+all'avvio (InstrumentedThreadPoolExecutor).
+
+Oltre a numero e durata totale, per individuare pattern N+1 si tiene conto di:
+- query identiche: stessa tabella, operazione, filtri e valori
+- query con la stessa forma: stessa tabella, operazione e colonne filtrate,
+  valori diversi (tipicamente una query per elemento di una lista)
+"""
+import threading
+from collections import Counter
+from contextvars import ContextVar
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+_current_stats: ContextVar[Optional["QueryStats"]] = ContextVar("request_query_stats", default=None)
+
+
+class QueryStats:
+    """Query e chiamate Storage di una richiesta"""
+
+    def __init__(self):
+        self.query_count = 0
+        self.query_seconds = 0.0
+        self.storage_count = 0
+        self.storage_seconds = 0.0
+        self.signatures: Counter = Counter()
+        self.shapes: Counter = Counter()
+        self._lock = threading.Lock()  # Query anche da più thread (gather + executor)
+
+    def record_query(self, seconds: float, signature: Hashable, shape: Hashable) -> None:
+        with self._lock:
+            self.query_count += 1
+            self.query_seconds += seconds
+            self.signatures[signature] += 1
+            self.shapes[shape] += 1
+
+    def record_storage(self, seconds: float) -> None:
+        with self._lock:
+            self.storage_count += 1
+            self.storage_seconds += seconds
+
+    def duplicates(self, threshold: int = 2) -> List[Tuple[Any, int]]:
+        """Query identiche eseguite almeno threshold volte"""
+        return [(sig, n) for sig, n in self.signatures.most_common() if n >= threshold]
+
+    def repeated_shapes(self, threshold: int) -> List[Tuple[Any, int]]:
+        """Forme di query ripetute almeno threshold volte (possibile N+1)"""
+        return [(shape, n) for shape, n in self.shapes.most_common() if n >= threshold]
+
+    def server_timing(self) -> str:
+        """Valore dell'header Server-Timing (durate in millisecondi)"""
+        parts = [f'db;dur={self.query_seconds * 1000:.1f};desc="{self.query_count} query"']
+        if self.storage_count:
+            parts.append(f'storage;dur={self.storage_seconds * 1000:.1f};desc="{self.storage_count} chiamate"')
+        return ", ".join(parts)
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "queries": self.query_count,
+            "query_ms": round(self.query_seconds * 1000, 1),
+            "storage_calls": self.storage_count,
+            "storage_ms": round(self.storage_seconds * 1000, 1),
+        }
+
+
+def current_query_stats() -> Optional[QueryStats]:
+    """QueryStats della richiesta in corso (None fuori da una richiesta)"""
+    return _current_stats.get()
+
+
+def start_query_stats() -> Tuple[QueryStats, Any]:
+    """Nuovo QueryStats corrente; restituisce anche il token per reset_query_stats"""
+    stats = QueryStats()
+    return stats, _current_stats.set(stats)
+
+
+def reset_query_stats(token: Any) -> None:
+    _current_stats.reset(token)
+
+
+def format_query(key: Tuple) -> str:
+    """Rappresentazione leggibile di una firma/forma di query per i log"""
+    table, operation, calls = key
+    filters = " ".join(f"{name}({', '.join(str(arg)[:60] for arg in args)})" for name, *args in calls)
+    return f"{operation} {table} {filters}".strip()
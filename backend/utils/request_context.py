@@ -0,0 +1,82 @@
+"""
+Contesto della richiesta HTTP corrente (request id e tempi per fase)
+
+AccessLogMiddleware crea un RequestContext per richiesta e lo rende corrente
+(contextvar): il request id arriva così a ogni log emesso durante la
+richiesta (RequestIdFilter), anche dai servizi AI, senza passarlo come
+parametro. Il contesto è un oggetto mutabile: le copie del contesto (thread
+pool anyio, executor di default InstrumentedThreadPoolExecutor installato
+all'avvio) vedono lo stesso oggetto.
+
+Le fasi registrate dagli StageTimer della richiesta (backend/utils/timing.py)
+vengono sommate in stages e finiscono nella riga di access log.
+"""
+import logging
+import re
+import threading
+import uuid
+from contextvars import ContextVar
+from typing import Any, Dict, Optional, Tuple
+
+REQUEST_ID_HEADER = "X-Request-ID"
+
+# Request id accettati dall'header del client (es: da un proxy o dal frontend)
+_VALID_REQUEST_ID = re.compile(r"^[A-Za-z0-9._:-]{1,128}$")
+
+_current_request: ContextVar[Optional["RequestContext"]] = ContextVar("request_context", default=None)
+
+
+class RequestContext:
+    """Request id e tempi per fase di una richiesta"""
+
+    __slots__ = ("request_id", "stages", "_lock")
+
+    def __init__(self, request_id: str):
+        self.request_id = request_id
+        self.stages: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def add_stage(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def stages_ms(self) -> Dict[str, float]:
+        with self._lock:
+            return {stage: round(seconds * 1000, 1) for stage, seconds in self.stages.items()}
+
+
+def new_request_id(incoming: Optional[str] = None) -> str:
+    """Request id del client se valido, altrimenti uno nuovo"""
+    if incoming and _VALID_REQUEST_ID.match(incoming):
+        return incoming
+    return uuid.uuid4().hex
+
+
+def current_request() -> Optional[RequestContext]:
+    """Contesto della richiesta in corso (None fuori da una richiesta)"""
+    return _current_request.get()
+
+
+def get_request_id() -> Optional[str]:
+    context = _current_request.get()
+    return context.request_id if context is not None else None
+
+
+def start_request(request_id: str) -> Tuple[RequestContext, Any]:
+    """Nuovo RequestContext corrente; restituisce anche il token per reset_request"""
+    context = RequestContext(request_id)
+    return context, _current_request.set(context)
+
+
+def reset_request(token: Any) -> None:
+    _current_request.reset(token)
+
+
+class RequestIdFilter(logging.Filter):
+    """Aggiunge record.request_id ("-" fuori da una richiesta)"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not hasattr(record, "request_id"):
+            context = _current_request.get()
+            record.request_id = context.request_id if context is not None else "-"
+        return True
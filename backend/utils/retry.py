@@ -0,0 +1,174 @@
+"""
+Retry con backoff esponenziale e jitter per chiamate ai modelli AI e a Storage
+
+Solo gli errori transitori vengono ritentati: 408/425/429/5xx (httpx, google-genai,
+Supabase Storage), errori di rete e timeout. Ogni tentativo attende un tempo
+casuale tra 0 e base_delay * 2^tentativo (full jitter, limitato a max_delay),
+rispettando l'header Retry-After se presente. Due limiti evitano di insistere
+su un provider già in difficoltà:
+
+- budget di tempo per chiamata: nessun nuovo tentativo oltre budget_seconds
+  dall'inizio;
+- budget di retry per processo (token bucket): ogni errore ritentabile consuma
+  un token, ogni successo ne restituisce una frazione; sotto metà capacità i
+  retry sono sospesi finché le chiamate non tornano a riuscire.
+"""
+import asyncio
+import logging
+import random
+import threading
+import time
+from typing import Any, Awaitable, Callable, Optional
+from backend.config import settings
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUS_CODES = {408, 425, 429, 500, 502, 503, 504}
+# Stati gRPC/Google restituiti da google-genai insieme al codice HTTP
+RETRYABLE_STATUS_NAMES = {"RESOURCE_EXHAUSTED", "UNAVAILABLE", "DEADLINE_EXCEEDED", "INTERNAL"}
+
+
+def error_status_code(exc: BaseException) -> Optional[int]:
+    """
+    Codice HTTP di un errore, se presente
+
+    httpx.HTTPStatusError (response.status_code), google-genai APIError e
+    google.api_core (code), Supabase StorageApiError (status, anche come stringa).
+    """
+    for candidate in (
+        getattr(getattr(exc, "response", None), "status_code", None),
+        getattr(exc, "status_code", None),
+        getattr(exc, "code", None),
+        getattr(exc, "status", None),
+    ):
+        if isinstance(candidate, int):
+            return candidate
+        if isinstance(candidate, str) and candidate.isdigit():
+            return int(candidate)
+    return None
+
+
+def is_retryable_error(exc: BaseException) -> bool:
+    """True se l'errore è transitorio e la chiamata può essere ritentata"""
+    try:
+        import httpx
+        if isinstance(exc, httpx.TransportError):  # timeout, connessione, protocollo
+            return True
+    except ImportError:  # pragma: no cover - httpx è una dipendenza del progetto
+        pass
+    if isinstance(exc, (ConnectionError, TimeoutError, asyncio.TimeoutError)):
+        return True
+    code = error_status_code(exc)
+    if code is not None:
+        return code in RETRYABLE_STATUS_CODES
+    return str(getattr(exc, "status", "")).upper() in RETRYABLE_STATUS_NAMES
+
+
+def _retry_after_header(exc: BaseException) -> Optional[float]:
+    """Secondi indicati dall'header Retry-After della risposta, se numerico"""
+    headers = getattr(getattr(exc, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        value = headers.get("retry-after")
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+class RetryPolicy:
+    """Politica di retry con budget di tempo per chiamata e budget di retry per processo"""
+
+    def __init__(
+        self,
+        name: str,
+        max_attempts: int,
+        base_delay: float,
+        max_delay: float,
+        budget_seconds: float,
+        token_max: float = 10.0,
+        token_ratio: float = 0.1,
+    ):
+        self.name = name
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget_seconds = budget_seconds
+        self.token_max = token_max
+        self.token_ratio = token_ratio
+        self._tokens = token_max
+        self._lock = threading.Lock()
+
+    def backoff(self, attempt: int, exc: Optional[BaseException] = None) -> float:
+        """Attesa prima del tentativo successivo (attempt parte da 1)"""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** (attempt - 1))))
+        retry_after = _retry_after_header(exc) if exc is not None else None
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.max_delay))
+        return delay
+
+    def _on_success(self) -> None:
+        with self._lock:
+            self._tokens = min(self.token_max, self._tokens + self.token_ratio)
+
+    def _allow_retry(self) -> bool:
+        # Consuma un token per l'errore; i retry sono ammessi sopra metà capacità
+        with self._lock:
+            self._tokens = max(0.0, self._tokens - 1)
+            return self._tokens > self.token_max / 2
+
+    async def run(self, func: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        """Esegue la coroutine function func con retry sugli errori transitori"""
+        start = time.monotonic()
+        attempt = 1
+        while True:
+            try:
+                result = await func(*args, **kwargs)
+            except Exception as e:
+                if not is_retryable_error(e) or attempt >= self.max_attempts:
+                    raise
+                if not self._allow_retry():
+                    logger.warning(f"⚠️ Retry {self.name} sospesi (budget di retry esaurito): {e}")
+                    raise
+                delay = self.backoff(attempt, e)
+                if time.monotonic() - start + delay > self.budget_seconds:
+                    logger.warning(f"⚠️ Retry {self.name} interrotti: budget di {self.budget_seconds:.0f}s superato")
+                    raise
+                logger.warning(f"🔁 {self.name}: tentativo {attempt}/{self.max_attempts} fallito ({e}), riprovo tra {delay:.1f}s")
+                await asyncio.sleep(delay)
+                attempt += 1
+            else:
+                self._on_success()
+                return result
+
+    async def run_in_executor(self, func: Callable[..., Any], *args) -> Any:
+        """Come run, per una funzione sincrona (bloccante) eseguita in un thread"""
+        loop = asyncio.get_event_loop()
+
+        async def call():
+            return await loop.run_in_executor(None, func, *args)
+
+        return await self.run(call)
+
+
+# Chiamate ai modelli AI (generate_content / generateContent)
+model_retry_policy = RetryPolicy(
+    "modello AI",
+    max_attempts=settings.MODEL_RETRY_MAX_ATTEMPTS,
+    base_delay=settings.MODEL_RETRY_BASE_DELAY,
+    max_delay=settings.MODEL_RETRY_MAX_DELAY,
+    budget_seconds=settings.MODEL_RETRY_BUDGET_SECONDS,
+    token_max=settings.RETRY_BUDGET_TOKENS,
+    token_ratio=settings.RETRY_BUDGET_RATIO,
+)
+
+# Upload su Supabase Storage
+storage_retry_policy = RetryPolicy(
+    "upload Storage",
+    max_attempts=settings.STORAGE_RETRY_MAX_ATTEMPTS,
+    base_delay=settings.STORAGE_RETRY_BASE_DELAY,
+    max_delay=settings.STORAGE_RETRY_MAX_DELAY,
+    budget_seconds=settings.STORAGE_RETRY_BUDGET_SECONDS,
+    token_max=settings.RETRY_BUDGET_TOKENS,
+    token_ratio=settings.RETRY_BUDGET_RATIO,
+)
@@ -0,0 +1,137 @@
+"""
+Tempi per fase della pipeline di generazione immagini
+
+La route crea uno StageTimer per richiesta e lo rende corrente (contextvar):
+i servizi chiamati registrano le loro fasi con stage(...) senza doverlo
+ricevere come parametro. Ogni fase è anche osservata nell'istogramma
+Prometheus generation_stage_seconds (etichette stage e backend) e sommata
+nei tempi della richiesta HTTP (access log, vedi request_context).
+
+Come per QueryStats e RequestContext, il thread pool anyio copia il
+contesto; con run_in_executor lo copia l'executor di default installato
+all'avvio (InstrumentedThreadPoolExecutor). Senza di esso (script, benchmark)
+il contextvar non arriva ai thread: per questo le funzioni eseguite con
+run_in_executor ricevono comunque il timer letto prima con current_timer().
+
+Fasi usate: db_fetch, download, decode, prompt_build, model_call,
+response_parse, transcode, upload, db_insert.
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+from backend.utils.metrics import generation_stage_seconds
+from backend.utils.request_context import RequestContext, current_request
+
+_current_timer: ContextVar[Optional["StageTimer"]] = ContextVar("generation_stage_timer", default=None)
+
+
+class StageTimer:
+    """Raccoglie le durate delle fasi di una generazione"""
+
+    def __init__(self, started_at: Optional[float] = None, spans: Optional[List[Dict[str, Any]]] = None,
+                 request: Optional[RequestContext] = None):
+        self.started_at = started_at if started_at is not None else time.perf_counter()
+        self.spans: List[Dict[str, Any]] = list(spans or [])
+        self.backend: Optional[str] = None
+        self._open: Dict[str, float] = {}
+        # Richiesta HTTP che ha creato il timer (fasi sommate nell'access log)
+        self.request = request if request is not None else current_request()
+
+    def fork(self) -> "StageTimer":
+        """Timer per una singola immagine: parte dalle fasi già registrate (es: query comuni)"""
+        return StageTimer(self.started_at, self.spans, self.request)
+
+    def add(self, stage: str, seconds: float, detail: Optional[str] = None, failed: bool = False) -> None:
+        span: Dict[str, Any] = {"stage": stage, "ms": round(seconds * 1000, 1)}
+        if detail:
+            span["detail"] = detail
+        if failed:
+            span["error"] = True
+        self.spans.append(span)
+        generation_stage_seconds.labels(stage=stage, backend=self.backend or "none").observe(seconds)
+        if self.request is not None:
+            self.request.add_stage(stage, seconds)
+
+    @contextmanager
+    def span(self, stage: str, detail: Optional[str] = None):
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.add(stage, time.perf_counter() - start, detail, failed=True)
+            raise
+        else:
+            self.add(stage, time.perf_counter() - start, detail)
+
+    def begin(self, stage: str) -> None:
+        """Apre una fase che termina in un altro punto del codice (vedi end)"""
+        self._open[stage] = time.perf_counter()
+
+    def end(self, stage: str, detail: Optional[str] = None) -> None:
+        """Chiude una fase aperta con begin (nessun effetto se non è aperta)"""
+        start = self._open.pop(stage, None)
+        if start is not None:
+            self.add(stage, time.perf_counter() - start, detail)
+
+    def breakdown(self) -> Dict[str, Any]:
+        """Riepilogo JSON: durata totale, totale per fase e singole fasi in ordine"""
+        stages: Dict[str, float] = {}
+        for span in self.spans:
+            stages[span["stage"]] = round(stages.get(span["stage"], 0.0) + span["ms"], 1)
+        data: Dict[str, Any] = {
+            "total_ms": round((time.perf_counter() - self.started_at) * 1000, 1),
+            "stages": stages,
+            "spans": self.spans,
+        }
+        if self.backend:
+            data["backend"] = self.backend
+        if self.request is not None:
+            # Correla la riga generated_images con i log della richiesta
+            data["request_id"] = self.request.request_id
+        return data
+
+
+def current_timer() -> Optional[StageTimer]:
+    """Timer della generazione in corso (None fuori da una generazione)"""
+    return _current_timer.get()
+
+
+@contextmanager
+def use_timer(timer: StageTimer):
+    """Rende timer corrente per il blocco (anche nelle coroutine chiamate)"""
+    token = _current_timer.set(timer)
+    try:
+        yield timer
+    finally:
+        _current_timer.reset(token)
+
+
+@contextmanager
+def stage(name: str, detail: Optional[str] = None, timer: Optional[StageTimer] = None):
+    """Registra la durata del blocco come fase name (nessun effetto senza timer)"""
+    timer = timer or _current_timer.get()
+    if timer is None:
+        yield
+        return
+    with timer.span(name, detail):
+        yield
+
+
+def begin_stage(name: str) -> None:
+    timer = _current_timer.get()
+    if timer is not None:
+        timer.begin(name)
+
+
+def end_stage(name: str, detail: Optional[str] = None) -> None:
+    timer = _current_timer.get()
+    if timer is not None:
+        timer.end(name, detail)
+
+
+def set_stage_backend(name: str) -> None:
+    """Backend che esegue la generazione corrente (etichetta delle fasi successive)"""
+    timer = _current_timer.get()
+    if timer is not None:
+        timer.backend = name
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark: serializzazione della lista clienti (GET /api/customers)
+
+Confronta, su 10k righe shop_customers, il costo per riga del vecchio percorso
+(dict -> CustomerResponse.model_validate -> model_dump) con la proiezione
+diretta usata ora da list_customers. Entrambi includono la codifica JSON che
+FastAPI applica alla risposta (jsonable_encoder + json.dumps).
+
+Uso:
+    python benchmarks/bench_customer_serialization.py [--rows 10000] [--repeat 5]
+"""
+import argparse
+import json
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+# Aggiungi il path del progetto
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from fastapi.encoders import jsonable_encoder
+
+from backend.routes.customers import CustomerResponse, _customer_response_row
+
+
+def make_rows(count: int) -> list:
+    """Righe sintetiche nella forma restituita da PostgREST"""
+    shop_id = str(uuid.uuid4())
+    base = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    rows = []
+    for i in range(count):
+        created = (base + timedelta(minutes=i)).isoformat()
+        rows.append({
+            "id": str(uuid.uuid4()),
+            "shop_id": shop_id,
+            "email": f"cliente{i}@example.com",
+            "full_name": f"Cliente Numero {i}",
+            "phone": f"+39 333 {i:07d}",
+            "address": f"Via Roma {i}, Milano",
+            "notes": "Preferisce taglie slim" if i % 3 == 0 else None,
+            "created_at": created,
+            "updated_at": created,
+        })
+    return rows
+
+
+def legacy_path(rows: list) -> bytes:
+    """Percorso precedente: model_validate + model_dump per ogni riga"""
+    customers = []
+    for customer_data in rows:
+        customer_dict = {
+            'id': customer_data.get('id'),
+            'shop_id': customer_data.get('shop_id'),
+            'email': customer_data.get('email'),
+            'full_name': customer_data.get('full_name'),
+            'phone': customer_data.get('phone'),
+            'address': customer_data.get('address'),
+            'notes': customer_data.get('notes'),
+            'created_at': customer_data.get('created_at', customer_data.get('created_at')),
+            'updated_at': customer_data.get('updated_at', customer_data.get('created_at')),
+            'user_id': None
+        }
+        customers.append(CustomerResponse.model_validate(customer_dict))
+    body = {"customers": [c.model_dump() for c in customers], "count": len(customers)}
+    return json.dumps(jsonable_encoder(body)).encode("utf-8")
+
+
+def projection_path(rows: list) -> bytes:
+    """Percorso attuale: proiezione diretta della riga"""
+    customers = [_customer_response_row(customer_data) for customer_data in rows]
+    body = {"customers": customers, "count": len(customers)}
+    return json.dumps(jsonable_encoder(body)).encode("utf-8")
+
+
+def measure(fn, rows: list, repeat: int) -> float:
+    """Miglior tempo (secondi) su `repeat` esecuzioni"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(rows)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows)
+
+    # Le due risposte devono essere equivalenti
+    assert json.loads(legacy_path(rows[:100])) == json.loads(projection_path(rows[:100]))
+
+    print(f"📊 Serializzazione lista clienti: {args.rows} righe, miglior tempo su {args.repeat} run")
+    results = {}
+    for name, fn in (("model_validate + model_dump", legacy_path), ("proiezione diretta", projection_path)):
+        elapsed = measure(fn, rows, args.repeat)
+        results[name] = elapsed
+        print(f"   {name:<28} {elapsed * 1000:8.1f} ms totali  {elapsed / args.rows * 1e6:7.2f} µs/riga")
+
+    legacy, current = results.values()
+    print(f"✅ Speedup: {legacy / current:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
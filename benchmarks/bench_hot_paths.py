@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+"""
+Suite di micro-benchmark dei percorsi CPU più frequenti, con baseline salvata
+
+Casi misurati su fixture di dimensioni realistiche:
+- prompt di scenario (AIService.build_prompt), a cache vuota e con cache calda
+- prompt completo di BananaProService.generate_image (build_full_prompt)
+- validazione degli URL immagine in generate_outfit_image
+- conversione delle righe in list_customers
+- rimodellamento delle righe embedded in list_outfits
+- serializzazione JSON di liste grandi (FastJSONResponse)
+
+Per ogni caso riporta mediana e minimo del tempo per operazione su --repeat
+campioni. Con --save salva i risultati nella baseline
+(benchmarks/baseline_hot_paths.json); senza --save li confronta con la
+baseline sul minimo (meno sensibile al rumore della macchina) e termina con
+codice 1 se un caso è più lento di --tolerance (default 50%, adatto a
+runner condivisi; su macchine dedicate si può scendere al 20-25%). La
+baseline dipende dalla macchina: rigenerarla con --save quando si cambia
+ambiente di CI.
+
+Uso:
+    python benchmarks/bench_hot_paths.py [--repeat 7] [--only prompt] [--save]
+        [--baseline benchmarks/baseline_hot_paths.json] [--tolerance 0.5] [--json]
+"""
+import argparse
+import copy
+import json
+import platform
+import statistics
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+# Aggiungi il path del progetto
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+import logging
+logging.disable(logging.WARNING)  # Avvisi delle API key mancanti all'import dei servizi
+
+from backend.routes.customers import _customer_response_row
+from backend.routes.generated_images import _invalid_image_urls, _split_product_image_urls
+from backend.routes.outfits import _format_outfit
+from backend.services.ai_service import ai_service
+from backend.services.prompt_templates import build_full_prompt, clear_prompt_cache
+from backend.utils.json_response import FastJSONResponse
+
+DEFAULT_BASELINE = Path(__file__).parent / "baseline_hot_paths.json"
+BASE_TIME = datetime(2025, 1, 1, tzinfo=timezone.utc)
+STORAGE = "https://example.supabase.co/storage/v1/object/public"
+CATEGORIES = ("giacche", "blazer", "maglieria", "camicie", "pantaloni", "scarpe", "accessori")
+
+
+# --- fixture ---
+
+def scenario_details(count: int = 3) -> list:
+    return [{
+        "description": f"Aperitivo in terrazza {i}",
+        "position": "in piedi, tre quarti",
+        "environment": "terrazza sul lago al tramonto",
+        "lighting": "luce calda radente",
+        "background": "sfocato con luci",
+        "custom_text": "sorriso accennato" if i % 2 else None,
+    } for i in range(count)]
+
+
+def product_rows(count: int, shop_id: str) -> list:
+    """Righe products come restituite da PostgREST"""
+    return [{
+        "id": str(uuid.uuid4()),
+        "shop_id": shop_id,
+        "name": f"Giacca in lana {i}" if i % 3 else f"Pantalone chino {i}",
+        "sku": f"GL-{i:05d}",
+        "description": "Giacca monopetto in lana vergine, fodera in viscosa",
+        "category": CATEGORIES[i % len(CATEGORIES)],
+        "price": 199.9 + i,
+        "image_url": f"{STORAGE}/product-images/{shop_id}/{i}.webp",
+        "thumbnail_url": f"{STORAGE}/product-images/{shop_id}/{i}_thumb.webp",
+        "available": True,
+        "created_at": (BASE_TIME + timedelta(minutes=i)).isoformat(),
+    } for i in range(count)]
+
+
+def customer_rows(count: int, shop_id: str) -> list:
+    """Righe shop_customers come restituite da PostgREST"""
+    rows = []
+    for i in range(count):
+        created = (BASE_TIME + timedelta(minutes=i)).isoformat()
+        rows.append({
+            "id": str(uuid.uuid4()),
+            "shop_id": shop_id,
+            "email": f"cliente{i}@example.com",
+            "full_name": f"Cliente Numero {i}",
+            "phone": f"+39 333 {i:07d}",
+            "address": f"Via Roma {i}, Milano",
+            "notes": "Preferisce taglie slim" if i % 3 == 0 else None,
+            "created_at": created,
+            "updated_at": created,
+        })
+    return rows
+
+
+def outfit_rows(count: int, shop_id: str, products: list) -> list:
+    """Righe outfits con outfit_products/outfit_scenarios embedded (expand=products,scenarios)"""
+    rows = []
+    for i in range(count):
+        picked = [products[(i + k) % len(products)] for k in range(5)]
+        rows.append({
+            "id": str(uuid.uuid4()),
+            "shop_id": shop_id,
+            "customer_id": str(uuid.uuid4()),
+            "user_id": None,
+            "name": f"Outfit {i}",
+            "created_at": (BASE_TIME + timedelta(hours=i)).isoformat(),
+            "outfit_products": [{
+                "product_id": p["id"],
+                "products": {k: p[k] for k in ("id", "name", "category", "thumbnail_url", "image_url")},
+            } for p in picked],
+            "outfit_scenarios": [{
+                "scenario_prompt_id": str(uuid.uuid4()),
+                "custom_text": "con cappotto" if k == 0 else None,
+                "scenario_prompts": {"id": str(uuid.uuid4()), "name": f"Scenario {k}"},
+            } for k in range(3)],
+        })
+    return rows
+
+
+def generated_image_rows(count: int) -> list:
+    prompt = "Fotografia realistica a figura intera della persona nella foto di riferimento. " * 12
+    return [{
+        "id": str(uuid.uuid4()),
+        "customer_photo_id": str(uuid.uuid4()),
+        "outfit_id": str(uuid.uuid4()),
+        "image_url": f"{STORAGE}/generated-images/generated/{uuid.uuid4()}.webp",
+        "prompt_used": prompt,
+        "scenario": "Aperitivo in terrazza",
+        "ai_service": "banana_pro",
+        "mime_type": "image/webp",
+        "width": 1024,
+        "height": 1536,
+        "byte_size": 183_204,
+        "created_at": (BASE_TIME + timedelta(seconds=i)).isoformat(),
+    } for i in range(count)]
+
+
+# --- casi ---
+
+def build_cases():
+    """Casi della suite: nome -> (funzione senza argomenti, operazioni per chiamata, setup non misurato)"""
+    shop_id = str(uuid.uuid4())
+    scenarios = scenario_details(3)
+    products = product_rows(5000, shop_id)
+    outfit_products = products[:10]
+    product_names = [p["name"] for p in outfit_products]
+    categories = ", ".join(sorted({p["category"] for p in outfit_products}))
+    customers = customer_rows(10000, shop_id)
+    outfits = outfit_rows(2000, shop_id, products)
+    images = generated_image_rows(2000)
+    expand = {"products", "scenarios"}
+
+    def scene_prompt():
+        return ai_service.build_prompt(product_category=categories, scenario_details=scenarios)
+
+    def scene_prompt_cold():
+        clear_prompt_cache()
+        return scene_prompt()
+
+    def full_prompt():
+        prompt = scene_prompt() + f" Articoli indossati: {', '.join(product_names)}."
+        return build_full_prompt(3, len(outfit_products), product_names, prompt)
+
+    def full_prompt_cold():
+        clear_prompt_cache()
+        return full_prompt()
+
+    def url_validation():
+        urls, missing = _split_product_image_urls(outfit_products)
+        return _invalid_image_urls(urls), missing
+
+    # list_outfits modifica le righe sul posto: copie preparate fuori dalla misura
+    outfit_copies = []
+
+    def outfits_setup():
+        outfit_copies[:] = [copy.deepcopy(outfits)]
+
+    def outfits_reshape():
+        return [_format_outfit(outfit, expand) for outfit in outfit_copies.pop()]
+
+    return {
+        "prompt.scene_cold": (scene_prompt_cold, 1, None),
+        "prompt.scene_cached": (scene_prompt, 1, None),
+        "prompt.full_cold": (full_prompt_cold, 1, None),
+        "prompt.full_cached": (full_prompt, 1, None),
+        "generate_outfit.url_validation": (url_validation, len(outfit_products), None),
+        "list_customers.rows": (lambda: [_customer_response_row(c) for c in customers], len(customers), None),
+        "list_outfits.reshape": (outfits_reshape, len(outfits), outfits_setup),
+        "json.products": (lambda: FastJSONResponse({"products": products, "count": len(products)}), len(products), None),
+        "json.customers": (lambda: FastJSONResponse({"customers": customers, "count": len(customers)}), len(customers), None),
+        "json.generated_images": (lambda: FastJSONResponse({"images": images, "count": len(images)}), len(images), None),
+    }
+
+
+# --- misura ---
+
+def calibrate(fn, setup) -> int:
+    """Chiamate per campione in modo che un campione duri almeno ~50ms"""
+    if setup:
+        return 1
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        if time.perf_counter() - start >= 0.05 or loops >= 1_000_000:
+            return loops
+        loops *= 10
+
+
+def measure(fn, ops: int, setup, repeat: int) -> dict:
+    """Mediana e minimo del tempo per operazione (µs) su repeat campioni"""
+    loops = calibrate(fn, setup)
+    samples = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        samples.append((time.perf_counter() - start) / loops / ops * 1e6)
+    return {
+        "median_us": round(statistics.median(samples), 4),
+        "min_us": round(min(samples), 4),
+        "ops_per_call": ops,
+    }
+
+
+def environment() -> dict:
+    try:
+        import orjson
+        json_backend = f"orjson {orjson.__version__}"
+    except ImportError:
+        json_backend = "json"
+    return {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "platform": platform.platform(terse=True),
+        "json_backend": json_backend,
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float, out=sys.stdout) -> list:
+    """Stampa il confronto con la baseline e restituisce i casi regrediti"""
+    regressions = []
+    print(f"\n{'caso':<34}{'min attuale':>14}{'min baseline':>14}{'delta':>10}", file=out)
+    for name, result in results.items():
+        base = baseline.get("results", {}).get(name)
+        if not base:
+            print(f"{name:<34}{result['min_us']:>12.3f}µs{'-':>14}{'nuovo':>10}", file=out)
+            continue
+        delta = result["min_us"] / base["min_us"] - 1
+        flag = ""
+        if delta > tolerance:
+            regressions.append(f"{name}: {delta:+.0%}")
+            flag = " ❌"
+        print(f"{name:<34}{result['min_us']:>12.3f}µs{base['min_us']:>12.3f}µs{delta:>+9.0%}{flag}", file=out)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmark dei percorsi CPU più frequenti")
+    parser.add_argument("--repeat", type=int, default=7, help="Campioni per caso")
+    parser.add_argument("--only", default=None, help="Esegue solo i casi il cui nome contiene questo testo")
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE, help="File della baseline")
+    parser.add_argument("--save", action="store_true", help="Salva i risultati come nuova baseline")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="Rallentamento massimo ammesso rispetto alla baseline")
+    parser.add_argument("--json", action="store_true", help="Stampa i risultati in JSON")
+    args = parser.parse_args()
+
+    cases = build_cases()
+    if args.only:
+        cases = {name: case for name, case in cases.items() if args.only in name}
+
+    results = {}
+    for name, (fn, ops, setup) in cases.items():
+        results[name] = measure(fn, ops, setup, args.repeat)
+        if not args.json:
+            print(f"   {name:<34}{results[name]['median_us']:>12.3f} µs/op (min {results[name]['min_us']:.3f})")
+
+    report = {"environment": environment(), "results": results}
+    if args.json:
+        print(json.dumps(report, indent=2))
+
+    if args.save:
+        if args.baseline.exists() and args.only:
+            # Aggiorna solo i casi eseguiti
+            saved = json.loads(args.baseline.read_text())
+            saved["results"].update(results)
+            report["results"] = saved["results"]
+        args.baseline.write_text(json.dumps(report, indent=2) + "\n")
+        print(f"💾 Baseline salvata in {args.baseline}", file=sys.stderr)
+        return
+
+    if not args.baseline.exists():
+        print(f"⚠️ Nessuna baseline in {args.baseline}: eseguire con --save per crearla", file=sys.stderr)
+        return
+
+    baseline = json.loads(args.baseline.read_text())
+    if baseline.get("environment") != report["environment"]:
+        print(f"⚠️ Baseline registrata su un ambiente diverso: {baseline.get('environment')}", file=sys.stderr)
+    regressions = compare(results, baseline, args.tolerance, out=sys.stderr if args.json else sys.stdout)
+    if regressions:
+        print(f"❌ Regressioni oltre il {args.tolerance:.0%}: {', '.join(regressions)}", file=sys.stderr)
+        sys.exit(1)
+    print(f"✅ Nessuna regressione oltre il {args.tolerance:.0%}", file=sys.stderr if args.json else sys.stdout)
+
+
+if __name__ == "__main__":
+    main()
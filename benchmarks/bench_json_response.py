@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark: serializzazione delle risposte JSON
+
+Confronta su payload realistici (lista prodotti, outfit con scenari annidati,
+immagini generate con prompt lunghi) il percorso standard di FastAPI
+(jsonable_encoder + JSONResponse) con FastJSONResponse, sia con orjson sia con
+il fallback sulla libreria json standard.
+
+Uso:
+    python benchmarks/bench_json_response.py [--rows 2000] [--repeat 5]
+"""
+import argparse
+import json
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+# Aggiungi il path del progetto
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from backend.utils import json_response
+from backend.utils.json_response import FastJSONResponse
+
+BASE_TIME = datetime(2025, 1, 1, tzinfo=timezone.utc)
+PROMPT = (
+    "Fotografia realistica a figura intera della persona nella foto di riferimento, "
+    "che indossa i capi forniti mantenendo fedelmente colori, tessuti e vestibilità. "
+) * 12
+
+
+def products_payload(count: int) -> dict:
+    """Come GET /api/products: righe PostgREST (stringhe)"""
+    shop_id = str(uuid.uuid4())
+    products = [{
+        "id": str(uuid.uuid4()),
+        "shop_id": shop_id,
+        "name": f"Giacca in lana {i}",
+        "sku": f"GL-{i:05d}",
+        "description": "Giacca monopetto in lana vergine, fodera in viscosa",
+        "category": "giacche",
+        "season": "inverno",
+        "occasion": "formale",
+        "style": "classico",
+        "price": 199.9 + i,
+        "image_url": f"https://example.supabase.co/storage/v1/object/public/product-images/{shop_id}/{i}.webp",
+        "thumbnail_url": f"https://example.supabase.co/storage/v1/object/public/product-images/{shop_id}/{i}_thumb.webp",
+        "available": True,
+        "created_at": (BASE_TIME + timedelta(minutes=i)).isoformat(),
+        "updated_at": (BASE_TIME + timedelta(minutes=i)).isoformat(),
+    } for i in range(count)]
+    return {"products": products, "count": len(products)}
+
+
+def outfits_payload(count: int) -> dict:
+    """Come GET /api/outfits: UUID e datetime come oggetti Python, scenari annidati"""
+    outfits = [{
+        "id": uuid.uuid4(),
+        "shop_id": uuid.uuid4(),
+        "user_id": None,
+        "name": f"Outfit {i}",
+        "product_ids": [uuid.uuid4() for _ in range(4)],
+        "scenarios": [{
+            "scenario_prompt_id": uuid.uuid4(),
+            "custom_text": "Luce calda del tramonto, sfondo urbano",
+        } for _ in range(2)],
+        "created_at": BASE_TIME + timedelta(minutes=i),
+    } for i in range(count)]
+    return {"outfits": outfits, "count": len(outfits)}
+
+
+def generated_images_payload(count: int) -> dict:
+    """Come GET /api/generated-images: prompt_used lunghi"""
+    images = [{
+        "id": str(uuid.uuid4()),
+        "customer_photo_id": str(uuid.uuid4()),
+        "product_id": None,
+        "outfit_id": str(uuid.uuid4()),
+        "image_url": f"https://example.supabase.co/storage/v1/object/public/generated-images/{i}.webp",
+        "prompt_used": PROMPT,
+        "mime_type": "image/webp",
+        "width": 1024,
+        "height": 1536,
+        "byte_size": 183000 + i,
+        "created_at": (BASE_TIME + timedelta(minutes=i)).isoformat(),
+    } for i in range(count)]
+    return {"images": images, "count": len(images)}
+
+
+def fastapi_default(content) -> bytes:
+    """Percorso standard di FastAPI per route senza response_model"""
+    return JSONResponse(jsonable_encoder(content)).body
+
+
+def fast_json(content) -> bytes:
+    return FastJSONResponse(content).body
+
+
+def fast_json_stdlib(content) -> bytes:
+    orjson = json_response.orjson
+    json_response.orjson = None
+    try:
+        return FastJSONResponse(content).body
+    finally:
+        json_response.orjson = orjson
+
+
+def measure(fn, content, repeat: int) -> float:
+    """Miglior tempo (secondi) su `repeat` esecuzioni"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(content)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    if json_response.orjson is None:
+        print("⚠️ orjson non installato: FastJSONResponse usa il fallback json")
+
+    payloads = {
+        "prodotti": products_payload(args.rows),
+        "outfit": outfits_payload(args.rows),
+        "immagini generate": generated_images_payload(args.rows),
+    }
+    variants = (
+        ("jsonable_encoder + json", fastapi_default),
+        ("FastJSONResponse (orjson)", fast_json),
+        ("FastJSONResponse (json)", fast_json_stdlib),
+    )
+
+    print(f"📊 Serializzazione risposte: {args.rows} righe per payload, miglior tempo su {args.repeat} run")
+    for name, content in payloads.items():
+        # Stesso JSON in tutti i percorsi
+        expected = json.loads(fastapi_default(content))
+        assert all(json.loads(fn(content)) == expected for _, fn in variants[1:])
+
+        print(f"\n{name} ({len(fastapi_default(content)) / 1024:.0f} KB)")
+        baseline = None
+        for variant, fn in variants:
+            elapsed = measure(fn, content, args.repeat)
+            baseline = baseline or elapsed
+            print(f"   {variant:<27} {elapsed * 1000:8.2f} ms  {baseline / elapsed:5.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,261 @@
+"""
+Sostituto in memoria del client Supabase per benchmark e test di carico
+
+Implementa il sottoinsieme dell'API supabase-py usato dalle route: tabelle
+(select/insert/update/upsert/delete con eq, neq, in_, gt/gte/lt/lte, order,
+limit, range, single), auth.get_user e Storage (upload, get_public_url,
+create_signed_urls). Le select con embedding PostgREST non sono risolte: le
+colonne embedded semplicemente mancano dalle righe restituite.
+
+Come il client reale, le chiamate sono sincrone: una latenza simulata
+(time.sleep) blocca il thread chiamante esattamente come una query vera.
+"""
+import copy
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+
+
+class FakeResponse:
+    def __init__(self, data, count: Optional[int] = None):
+        self.data = data
+        self.count = count
+
+
+class FakeQuery:
+    """Query builder in stile postgrest-py su una tabella in memoria"""
+
+    def __init__(self, client: "FakeSupabase", table: str):
+        self.client = client
+        self.table = table
+        self.operation = "select"
+        self.payload = None
+        self.filters = []
+        self.order_by = []
+        self.limit_count: Optional[int] = None
+        self.offset = 0
+        self.single_row = False
+        self.count_mode = None
+        self.head = False
+        self.on_conflict = "id"
+
+    # --- operazioni ---
+    def select(self, columns: str = "*", count: Optional[str] = None, head: bool = False):
+        self.operation = "select"
+        self.count_mode = count
+        self.head = head
+        return self
+
+    def insert(self, payload):
+        self.operation, self.payload = "insert", payload
+        return self
+
+    def upsert(self, payload, on_conflict: str = "id", **kwargs):
+        self.operation, self.payload, self.on_conflict = "upsert", payload, on_conflict
+        return self
+
+    def update(self, payload):
+        self.operation, self.payload = "update", payload
+        return self
+
+    def delete(self):
+        self.operation = "delete"
+        return self
+
+    # --- filtri ---
+    def _filter(self, column, predicate):
+        self.filters.append((column, predicate))
+        return self
+
+    def eq(self, column, value):
+        return self._filter(column, lambda v: v is not None and str(v) == str(value))
+
+    def neq(self, column, value):
+        return self._filter(column, lambda v: str(v) != str(value))
+
+    def in_(self, column, values):
+        wanted = {str(v) for v in values}
+        return self._filter(column, lambda v: str(v) in wanted)
+
+    def gt(self, column, value):
+        return self._filter(column, lambda v: v is not None and v > value)
+
+    def gte(self, column, value):
+        return self._filter(column, lambda v: v is not None and v >= value)
+
+    def lt(self, column, value):
+        return self._filter(column, lambda v: v is not None and v < value)
+
+    def lte(self, column, value):
+        return self._filter(column, lambda v: v is not None and v <= value)
+
+    def is_(self, column, value):
+        expected = None if value in (None, "null") else value
+        return self._filter(column, lambda v: v == expected)
+
+    def order(self, column, desc: bool = False, **kwargs):
+        self.order_by.append((column, desc))
+        return self
+
+    def limit(self, count: int, **kwargs):
+        self.limit_count = count
+        return self
+
+    def range(self, start: int, end: int, **kwargs):
+        self.offset, self.limit_count = start, end - start + 1
+        return self
+
+    def single(self):
+        self.single_row = True
+        return self
+
+    def maybe_single(self):
+        return self.single()
+
+    # --- esecuzione ---
+    def _matches(self, row: dict) -> bool:
+        return all(predicate(row.get(column)) for column, predicate in self.filters)
+
+    def execute(self) -> FakeResponse:
+        self.client.simulate_latency()
+        with self.client.lock:
+            self.client.query_count += 1
+            rows = self.client.tables.setdefault(self.table, [])
+            if self.operation == "select":
+                return self._select(rows)
+            if self.operation in ("insert", "upsert"):
+                return self._insert(rows)
+            if self.operation == "update":
+                matched = [row for row in rows if self._matches(row)]
+                for row in matched:
+                    row.update(copy.deepcopy(self.payload))
+                return FakeResponse(copy.deepcopy(matched))
+            matched = [row for row in rows if self._matches(row)]
+            self.client.tables[self.table] = [row for row in rows if not self._matches(row)]
+            return FakeResponse(copy.deepcopy(matched))
+
+    def _select(self, rows: List[dict]) -> FakeResponse:
+        matched = [row for row in rows if self._matches(row)]
+        for column, desc in reversed(self.order_by):
+            matched.sort(key=lambda r: (r.get(column) is None, r.get(column)), reverse=desc)
+        total = len(matched)
+        end = None if self.limit_count is None else self.offset + self.limit_count
+        matched = matched[self.offset:end]
+        count = total if self.count_mode else None
+        if self.head:
+            return FakeResponse([], count)
+        if self.single_row:
+            return FakeResponse(copy.deepcopy(matched[0]) if matched else None, count)
+        return FakeResponse(copy.deepcopy(matched), count)
+
+    def _insert(self, rows: List[dict]) -> FakeResponse:
+        payload = self.payload if isinstance(self.payload, list) else [self.payload]
+        now = datetime.now(timezone.utc).isoformat()
+        written = []
+        for item in payload:
+            item = copy.deepcopy(item)
+            item.setdefault("id", str(uuid.uuid4()))
+            item.setdefault("created_at", now)
+            existing = None
+            if self.operation == "upsert":
+                key = self.on_conflict
+                existing = next((r for r in rows if str(r.get(key)) == str(item.get(key))), None)
+            if existing is not None:
+                existing.update(item)
+                written.append(existing)
+            else:
+                rows.append(item)
+                written.append(item)
+        return FakeResponse(copy.deepcopy(written))
+
+
+class FakeBucket:
+    def __init__(self, client: "FakeSupabase", name: str):
+        self.client = client
+        self.name = name
+
+    def upload(self, path: str, data: bytes, file_options: Optional[dict] = None):
+        self.client.simulate_latency(self.client.storage_latency)
+        with self.client.lock:
+            self.client.objects[(self.name, path)] = bytes(data)
+        return SimpleNamespace(path=path, full_path=f"{self.name}/{path}")
+
+    def get_public_url(self, path: str) -> str:
+        return f"{self.client.url}/storage/v1/object/public/{self.name}/{path}"
+
+    def create_signed_urls(self, paths: List[str], expires_in: int, options: Optional[dict] = None):
+        self.client.simulate_latency(self.client.storage_latency)
+        return [
+            {"path": p, "signedURL": f"{self.client.url}/storage/v1/object/sign/{self.name}/{p}?token=fake", "error": None}
+            for p in paths
+        ]
+
+    def remove(self, paths: List[str]):
+        with self.client.lock:
+            for p in paths:
+                self.client.objects.pop((self.name, p), None)
+        return []
+
+
+class FakeStorage:
+    def __init__(self, client: "FakeSupabase"):
+        self.client = client
+
+    def from_(self, bucket: str) -> FakeBucket:
+        return FakeBucket(self.client, bucket)
+
+
+class FakeAuth:
+    """auth.get_user: il token è l'id utente (i token sconosciuti non sono validi)"""
+
+    def __init__(self, client: "FakeSupabase"):
+        self.client = client
+
+    def get_user(self, token: str):
+        user = next((u for u in self.client.tables.get("users", []) if u["id"] == token), None)
+        return SimpleNamespace(user=SimpleNamespace(id=user["id"], email=user.get("email")) if user else None)
+
+
+class FakeSupabase:
+    """Client Supabase in memoria con latenza simulata per query e Storage"""
+
+    def __init__(self, db_latency: float = 0.0, storage_latency: float = 0.0, url: str = "https://fake.supabase.local"):
+        self.url = url
+        self.db_latency = db_latency
+        self.storage_latency = storage_latency
+        self.tables: Dict[str, List[dict]] = {}
+        self.objects: Dict[tuple, bytes] = {}
+        self.query_count = 0
+        self.lock = threading.RLock()
+        self.auth = FakeAuth(self)
+        self.storage = FakeStorage(self)
+
+    def simulate_latency(self, latency: Optional[float] = None) -> None:
+        latency = self.db_latency if latency is None else latency
+        if latency > 0:
+            time.sleep(latency)
+
+    def table(self, name: str) -> FakeQuery:
+        return FakeQuery(self, name)
+
+    def seed(self, table: str, rows: List[dict]) -> None:
+        with self.lock:
+            self.tables.setdefault(table, []).extend(copy.deepcopy(rows))
+
+    def rpc(self, name: str, params: Optional[dict] = None):
+        raise NotImplementedError(f"RPC {name} non disponibile nel client in memoria")
+
+
+def install(fake: FakeSupabase, app) -> None:
+    """Usa il client in memoria per le dependency FastAPI e per il client admin"""
+    import backend.database as database
+    from backend.utils.instrumentation import instrument_supabase
+
+    # Stesso wrapper delle metriche usato in produzione (vedi backend/database.py)
+    client = instrument_supabase(fake)
+    database.supabase = client
+    database.supabase_admin = client
+    app.dependency_overrides[database.get_supabase] = lambda: client
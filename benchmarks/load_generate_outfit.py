@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+"""
+Test di carico end-to-end: POST /api/generated-images/generate-outfit
+
+Avvia l'app FastAPI nello stesso processo (httpx + ASGITransport, senza
+server HTTP) con Supabase sostituito da un client in memoria (tabelle e
+Storage, latenza configurabile e bloccante come il client reale) e il motore
+di generazione locale con latenza del modello configurabile. Invia N richieste
+con C richieste concorrenti e riporta latenza p50/p95/p99, throughput,
+ritardo dell'event loop e picco di memoria (RSS) del processo.
+
+Non servono rete, API key né database: adatto alla CI. Con --max-p95 e
+--min-throughput lo script termina con codice 1 se le soglie non sono
+rispettate; --json stampa i risultati in formato leggibile da una macchina.
+
+Uso:
+    python benchmarks/load_generate_outfit.py [--requests 200] [--concurrency 20]
+        [--model-latency-ms 500] [--db-latency-ms 5] [--scenarios 1] [--products 4]
+        [--json] [--max-p95 2.5] [--min-throughput 5]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import resource
+import statistics
+import sys
+import time
+import uuid
+from pathlib import Path
+
+# Aggiungi il path del progetto
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from fake_supabase import FakeSupabase, install
+
+
+def configure(args) -> None:
+    """Motore locale al posto dei modelli, nessun limite di ammissione"""
+    from backend.config import settings
+
+    settings.LOCAL_ENGINE_ENABLED = True
+    settings.AI_BACKEND = "local"
+    settings.AI_BACKEND_FALLBACKS = ""
+    settings.LOCAL_ENGINE_LATENCY_MS = args.model_latency_ms
+    settings.LOCAL_ENGINE_LATENCY_JITTER = args.model_jitter
+    settings.LOCAL_ENGINE_FAILURE_RATE = args.failure_rate
+    settings.LOCAL_ENGINE_IMAGE_SIZE = args.image_size
+    settings.LOCAL_ENGINE_FETCH_IMAGES = False
+    settings.RATE_LIMIT_ENABLED = False
+    settings.PRIVATE_STORAGE_BUCKETS = ""
+
+
+def seed(fake: FakeSupabase, products: int, scenarios: int) -> dict:
+    """Negozio con un negoziante, un cliente con 3 foto, prodotti e scenari"""
+    owner_id, shop_id, customer_id = (str(uuid.uuid4()) for _ in range(3))
+    base = f"{fake.url}/storage/v1/object/public"
+
+    fake.seed("users", [{"id": owner_id, "email": "negozio@example.com", "role": "negoziante", "full_name": "Negoziante"}])
+    fake.seed("shops", [{"id": shop_id, "owner_id": owner_id, "name": "Negozio di prova"}])
+    fake.seed("shop_customers", [{"id": customer_id, "shop_id": shop_id, "first_name": "Mario", "last_name": "Rossi"}])
+    fake.seed("customer_photos", [
+        {"id": str(uuid.uuid4()), "customer_id": customer_id, "image_url": f"{base}/customer-photos/{customer_id}/{i}.jpg"}
+        for i in range(3)
+    ])
+    product_rows = [{
+        "id": str(uuid.uuid4()),
+        "shop_id": shop_id,
+        "name": f"Capo {i}",
+        "category": ("giacche", "pantaloni", "camicie", "scarpe")[i % 4],
+        "image_url": f"{base}/product-images/{shop_id}/{i}.webp",
+    } for i in range(products)]
+    fake.seed("products", product_rows)
+    scenario_rows = [{
+        "id": str(uuid.uuid4()),
+        "shop_id": shop_id,
+        "title": f"Scenario {i}",
+        "description": f"Passeggiata in città {i}",
+        "position": "in piedi",
+        "environment": "centro storico",
+        "lighting": "luce naturale",
+        "background": "sfocato",
+    } for i in range(scenarios)]
+    fake.seed("scenario_prompts", scenario_rows)
+
+    return {
+        "token": owner_id,
+        "body": {
+            "shop_id": shop_id,
+            "customer_id": customer_id,
+            "product_ids": [p["id"] for p in product_rows],
+            "scenarios": [{"scenario_prompt_id": s["id"]} for s in scenario_rows],
+        },
+    }
+
+
+class LoopLagMonitor:
+    """Misura il ritardo dell'event loop: quanto arriva in ritardo un sleep di interval secondi"""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.samples = []
+        self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, loop.time() - start - self.interval))
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+
+def percentile(values, pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss è in KB su Linux, in byte su macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+async def run_load(args) -> dict:
+    import httpx
+    from backend.main import app
+
+    fake = FakeSupabase(db_latency=args.db_latency_ms / 1000, storage_latency=args.storage_latency_ms / 1000)
+    install(fake, app)
+    fixture = seed(fake, args.products, args.scenarios)
+    headers = {"Authorization": f"Bearer {fixture['token']}"}
+    url = "/api/generated-images/generate-outfit"
+
+    latencies = []
+    statuses = {}
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://loadtest", timeout=None) as client:
+        async def one_request():
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.post(url, json=fixture["body"], headers=headers)
+                latencies.append(time.perf_counter() - start)
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+        # Riscaldamento: import pigri, cache scenari, primo uso di PIL
+        for _ in range(min(args.warmup, args.requests)):
+            await one_request()
+        latencies.clear()
+        statuses.clear()
+        queries_before = fake.query_count
+
+        monitor = LoopLagMonitor()
+        monitor.start()
+        start = time.perf_counter()
+        await asyncio.gather(*(one_request() for _ in range(args.requests)))
+        elapsed = time.perf_counter() - start
+        await monitor.stop()
+
+    ok = sum(count for code, count in statuses.items() if 200 <= code < 300)
+    lag = monitor.samples
+    return {
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "scenarios_per_request": args.scenarios,
+        "products_per_request": args.products,
+        "model_latency_ms": args.model_latency_ms,
+        "db_latency_ms": args.db_latency_ms,
+        "status_codes": {str(code): count for code, count in sorted(statuses.items())},
+        "success_rate": round(ok / args.requests, 4) if args.requests else 0.0,
+        "elapsed_seconds": round(elapsed, 3),
+        "throughput_rps": round(args.requests / elapsed, 2) if elapsed else 0.0,
+        "latency_seconds": {
+            "p50": round(percentile(latencies, 50), 4),
+            "p95": round(percentile(latencies, 95), 4),
+            "p99": round(percentile(latencies, 99), 4),
+            "max": round(max(latencies), 4) if latencies else 0.0,
+            "mean": round(statistics.fmean(latencies), 4) if latencies else 0.0,
+        },
+        "event_loop_lag_ms": {
+            "p50": round(percentile(lag, 50) * 1000, 2),
+            "p99": round(percentile(lag, 99) * 1000, 2),
+            "max": round(max(lag) * 1000, 2) if lag else 0.0,
+        },
+        "db_queries_per_request": round((fake.query_count - queries_before) / args.requests, 2) if args.requests else 0.0,
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+
+def print_report(results: dict) -> None:
+    lat, lag = results["latency_seconds"], results["event_loop_lag_ms"]
+    print(f"\nPOST /generate-outfit: {results['requests']} richieste, concorrenza {results['concurrency']}, "
+          f"{results['scenarios_per_request']} scenari, {results['products_per_request']} prodotti")
+    print(f"  modello {results['model_latency_ms']} ms, query DB {results['db_latency_ms']} ms")
+    print(f"  esiti:            {results['status_codes']} (successo {results['success_rate']:.1%})")
+    print(f"  durata:           {results['elapsed_seconds']:.2f} s")
+    print(f"  throughput:       {results['throughput_rps']:.2f} richieste/s")
+    print(f"  latenza p50/p95/p99: {lat['p50'] * 1000:.0f} / {lat['p95'] * 1000:.0f} / {lat['p99'] * 1000:.0f} ms (max {lat['max'] * 1000:.0f} ms)")
+    print(f"  ritardo event loop p50/p99/max: {lag['p50']:.1f} / {lag['p99']:.1f} / {lag['max']:.1f} ms")
+    print(f"  query DB per richiesta: {results['db_queries_per_request']}")
+    print(f"  picco RSS:        {results['peak_rss_mb']:.1f} MB")
+
+
+def check_thresholds(results: dict, args) -> list:
+    """Soglie per la CI: elenco delle violazioni (vuoto se tutto ok)"""
+    failures = []
+    if args.max_p95 is not None and results["latency_seconds"]["p95"] > args.max_p95:
+        failures.append(f"latenza p95 {results['latency_seconds']['p95']:.3f}s > {args.max_p95}s")
+    if args.min_throughput is not None and results["throughput_rps"] < args.min_throughput:
+        failures.append(f"throughput {results['throughput_rps']:.2f} < {args.min_throughput} richieste/s")
+    if args.max_loop_lag_ms is not None and results["event_loop_lag_ms"]["p99"] > args.max_loop_lag_ms:
+        failures.append(f"ritardo event loop p99 {results['event_loop_lag_ms']['p99']:.1f}ms > {args.max_loop_lag_ms}ms")
+    if results["success_rate"] < args.min_success_rate:
+        failures.append(f"successo {results['success_rate']:.1%} < {args.min_success_rate:.1%}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Test di carico end-to-end di /generate-outfit")
+    parser.add_argument("--requests", type=int, default=200, help="Richieste totali")
+    parser.add_argument("--concurrency", type=int, default=20, help="Richieste concorrenti")
+    parser.add_argument("--warmup", type=int, default=3, help="Richieste di riscaldamento (escluse dalle misure)")
+    parser.add_argument("--products", type=int, default=4, help="Prodotti per richiesta (max 10)")
+    parser.add_argument("--scenarios", type=int, default=1, help="Scenari per richiesta (max 3)")
+    parser.add_argument("--model-latency-ms", type=int, default=500, help="Latenza simulata del modello")
+    parser.add_argument("--model-jitter", type=float, default=0.2, help="Jitter della latenza del modello (0-1)")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Frazione di chiamate al modello che falliscono")
+    parser.add_argument("--db-latency-ms", type=float, default=5.0, help="Latenza simulata di ogni query Supabase")
+    parser.add_argument("--storage-latency-ms", type=float, default=20.0, help="Latenza simulata degli upload su Storage")
+    parser.add_argument("--image-size", type=int, default=512, help="Lato dell'immagine generata in pixel")
+    parser.add_argument("--json", action="store_true", help="Stampa i risultati in JSON")
+    parser.add_argument("--max-p95", type=float, default=None, help="Soglia CI: latenza p95 massima (secondi)")
+    parser.add_argument("--min-throughput", type=float, default=None, help="Soglia CI: throughput minimo (richieste/s)")
+    parser.add_argument("--max-loop-lag-ms", type=float, default=None, help="Soglia CI: ritardo p99 massimo dell'event loop")
+    parser.add_argument("--min-success-rate", type=float, default=1.0, help="Soglia CI: frazione minima di risposte 2xx")
+    parser.add_argument("--log-level", default="WARNING", help="Livello di log dell'app durante il test")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=args.log_level.upper())
+    configure(args)
+    results = asyncio.run(run_load(args))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_report(results)
+
+    failures = check_thresholds(results, args)
+    for failure in failures:
+        print(f"❌ Soglia non rispettata: {failure}", file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -23,7 +23,8 @@
         
         try {
             console.log('📥 Caricamento outfit...');
-            const data = await window.apiCall('/api/outfits/');
+            // Prodotti inclusi nella stessa risposta: niente richieste per ogni outfit
+            const data = await window.apiCall('/api/outfits/?expand=products,scenarios');
             console.log('✅ Outfit caricati:', data);
             currentOutfits = data.outfits || data || [];
             renderOutfits();
@@ -64,6 +65,17 @@
                 </div>
                 <div class="outfit-info">
                     <p><strong>Prodotti:</strong> ${outfit.product_ids?.length || 0}</p>
+                    ${(outfit.products || []).length ? `
+                        <div class="outfit-products">
+                            ${outfit.products.map(p => `
+                                <div class="outfit-product" title="${p.name} (${p.category})">
+                                    ${(p.thumbnail_url || p.image_url) ? `<img src="${p.thumbnail_url || p.image_url}" alt="${p.name}" class="product-thumb" loading="lazy">` : ''}
+                                    <span>${p.name}</span>
+                                </div>
+                            `).join('')}
+                        </div>
+                    ` : ''}
+                    ${(outfit.scenarios || []).length ? `<p><strong>Scenari:</strong> ${outfit.scenarios.map(sc => sc.name || 'Scenario').join(', ')}</p>` : ''}
                 </div>
                 <div class="outfit-actions">
                     <button onclick="editOutfit('${outfit.id}')" class="btn btn-small">Modifica</button>
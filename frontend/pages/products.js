@@ -11,20 +11,134 @@
     
 let currentProducts = [];
 
+// Stato ricerca: filtri e paginazione sono applicati dal server (/api/products/search)
+const PAGE_SIZE = 24;
+let searchState = {
+    q: '',
+    category: '',
+    season: '',
+    occasion: '',
+    min_price: '',
+    max_price: '',
+    sort: 'relevance',
+    page: 1
+};
+let searchTotal = 0;
+let searchTotalPages = 0;
+let searchDebounce = null;
+let searchRequestId = 0;
+
+function ensureSearchToolbar(container) {
+    if (document.getElementById('products-search')) return;
+    
+    // Toolbar nuova (pagina ri-renderizzata): riparte da filtri vuoti
+    searchState = { q: '', category: '', season: '', occasion: '', min_price: '', max_price: '', sort: 'relevance', page: 1 };
+    
+    const toolbarHTML = `
+        <div id="products-search" class="products-search">
+            <input type="search" id="products-search-q" placeholder="Cerca per nome, descrizione o SKU...">
+            <select id="products-search-category">
+                <option value="">Tutte le categorie</option>
+                <option value="giacche">Giacche</option>
+                <option value="blazer">Blazer</option>
+                <option value="maglieria">Maglieria</option>
+                <option value="felpe&ibridi">Felpe & Ibridi</option>
+                <option value="camicie">Camicie</option>
+                <option value="shirty">Shirty</option>
+                <option value="pantaloni">Pantaloni</option>
+                <option value="calzini">Calzini</option>
+                <option value="short">Short</option>
+                <option value="scarpe">Scarpe</option>
+                <option value="copricapi">Copricapi</option>
+                <option value="accessori">Accessori</option>
+            </select>
+            <select id="products-search-season">
+                <option value="">Tutte le stagioni</option>
+                <option value="primavera">Primavera</option>
+                <option value="estate">Estate</option>
+                <option value="autunno">Autunno</option>
+                <option value="inverno">Inverno</option>
+                <option value="tutto">Tutto l'anno</option>
+            </select>
+            <select id="products-search-occasion">
+                <option value="">Tutte le occasioni</option>
+                <option value="casual">Casual</option>
+                <option value="formale">Formale</option>
+                <option value="sport">Sport</option>
+                <option value="festa">Festa</option>
+                <option value="lavoro">Lavoro</option>
+                <option value="altro">Altro</option>
+            </select>
+            <input type="number" id="products-search-min-price" placeholder="Prezzo min" min="0" step="0.01">
+            <input type="number" id="products-search-max-price" placeholder="Prezzo max" min="0" step="0.01">
+            <select id="products-search-sort">
+                <option value="relevance">Rilevanza</option>
+                <option value="name">Nome</option>
+                <option value="price_asc">Prezzo crescente</option>
+                <option value="price_desc">Prezzo decrescente</option>
+                <option value="newest">Più recenti</option>
+            </select>
+        </div>
+    `;
+    container.insertAdjacentHTML('beforebegin', toolbarHTML);
+    container.insertAdjacentHTML('afterend', '<div id="products-pagination" class="pagination"></div>');
+    
+    const fields = {
+        'products-search-q': 'q',
+        'products-search-category': 'category',
+        'products-search-season': 'season',
+        'products-search-occasion': 'occasion',
+        'products-search-min-price': 'min_price',
+        'products-search-max-price': 'max_price',
+        'products-search-sort': 'sort'
+    };
+    Object.entries(fields).forEach(([id, key]) => {
+        const el = document.getElementById(id);
+        const eventName = el.tagName === 'SELECT' ? 'change' : 'input';
+        el.addEventListener(eventName, () => {
+            searchState[key] = el.value.trim();
+            searchState.page = 1;
+            // Debounce: una sola richiesta mentre l'utente sta scrivendo
+            clearTimeout(searchDebounce);
+            searchDebounce = setTimeout(loadProducts, eventName === 'input' ? 300 : 0);
+        });
+    });
+}
+
+function buildSearchQuery() {
+    const params = new URLSearchParams();
+    Object.entries(searchState).forEach(([key, value]) => {
+        if (value !== '' && value !== null && value !== undefined) {
+            params.append(key, value);
+        }
+    });
+    params.append('page_size', PAGE_SIZE);
+    return params.toString();
+}
+
 async function loadProducts() {
     const container = document.getElementById('products-list');
     if (!container) {
         console.warn('Container products-list non trovato');
         return;
     }
+    ensureSearchToolbar(container);
+    
+    // Ignora risposte arrivate fuori ordine (ricerche precedenti più lente)
+    const requestId = ++searchRequestId;
     
     try {
         console.log('📥 Caricamento prodotti...');
-        const data = await window.apiCall('/api/products/');
+        const data = await window.apiCall(`/api/products/search?${buildSearchQuery()}`);
+        if (requestId !== searchRequestId) return;
         console.log('✅ Prodotti caricati:', data);
         currentProducts = data.products || [];
+        searchTotal = data.total || 0;
+        searchTotalPages = data.total_pages || 0;
         renderProducts();
+        renderPagination();
     } catch (error) {
+        if (requestId !== searchRequestId) return;
         console.error('❌ Errore caricamento prodotti:', error);
         container.innerHTML = `<p class="error">Errore nel caricamento prodotti: ${error.message}</p>`;
         if (window.showError) {
@@ -33,6 +147,28 @@ async function loadProducts() {
     }
 }
 
+function renderPagination() {
+    const pagination = document.getElementById('products-pagination');
+    if (!pagination) return;
+    
+    if (searchTotalPages <= 1) {
+        pagination.innerHTML = searchTotal ? `<span>${searchTotal} prodotti</span>` : '';
+        return;
+    }
+    
+    pagination.innerHTML = `
+        <button class="btn btn-small" onclick="goToProductsPage(${searchState.page - 1})" ${searchState.page <= 1 ? 'disabled' : ''}>← Precedente</button>
+        <span>Pagina ${searchState.page} di ${searchTotalPages} (${searchTotal} prodotti)</span>
+        <button class="btn btn-small" onclick="goToProductsPage(${searchState.page + 1})" ${searchState.page >= searchTotalPages ? 'disabled' : ''}>Successiva →</button>
+    `;
+}
+
+function goToProductsPage(page) {
+    if (page < 1 || (searchTotalPages && page > searchTotalPages)) return;
+    searchState.page = page;
+    loadProducts();
+}
+
 function renderProducts() {
     const container = document.getElementById('products-list');
     if (!container) {
@@ -43,13 +179,16 @@ function renderProducts() {
     console.log('🎨 Rendering prodotti:', currentProducts.length);
     
     if (currentProducts.length === 0) {
-        container.innerHTML = '<p class="empty-state">Nessun prodotto. Crea il primo prodotto!</p>';
+        const hasFilters = ['q', 'category', 'season', 'occasion', 'min_price', 'max_price'].some(key => searchState[key]);
+        container.innerHTML = hasFilters
+            ? '<p class="empty-state">Nessun prodotto corrisponde alla ricerca.</p>'
+            : '<p class="empty-state">Nessun prodotto. Crea il primo prodotto!</p>';
         return;
     }
     
     container.innerHTML = currentProducts.map(product => `
         <div class="product-card">
-            ${product.image_url ? `<img src="${product.image_url}" alt="${product.name}" class="product-image">` : ''}
+            ${(product.thumbnail_url || product.image_url) ? `<img src="${product.thumbnail_url || product.image_url}" alt="${product.name}" class="product-image" loading="lazy">` : ''}
             <h3>${product.name}</h3>
             <p class="product-category">${product.category}</p>
             ${product.description ? `<p class="product-description">${product.description}</p>` : ''}
@@ -281,6 +420,7 @@ window.editProduct = editProduct;
 window.deleteProduct = deleteProduct;
 window.closeModal = closeModal;
 window.loadProducts = loadProducts;
+window.goToProductsPage = goToProductsPage;
 
 })(); // Fine IIFE
 
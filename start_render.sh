@@ -10,7 +10,12 @@ export PYTHONPATH="${PYTHONPATH}:$(pwd)"
 # Verifica PORT (Render lo imposta automaticamente)
 export PORT=${PORT:-8000}
 
+# Metriche Prometheus condivise tra i worker: directory svuotata a ogni avvio
+export PROMETHEUS_MULTIPROC_DIR=${PROMETHEUS_MULTIPROC_DIR:-/tmp/prometheus-metrics}
+rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+
 # Avvia direttamente uvicorn (le dipendenze sono già installate dal build)
-# Usa workers multipli per migliori performance
-exec python -m uvicorn backend.main:app --host 0.0.0.0 --port $PORT --workers 2
+# Usa workers multipli per migliori performance; l'access log è scritto dall'app (backend.access)
+exec python -m uvicorn backend.main:app --host 0.0.0.0 --port $PORT --workers 2 --no-access-log
 